@@ -67,24 +67,23 @@ class CAMERA(Device):
         if feature == 'dome':
             return self.get_circle_points(20, place_info, device_for_coordinate_system)
         else:
-            xy_points = []
             diameter = self.get_properties('design')['housing_size']
             n_points = 20
-            if feature == 'front_housing':
-                for i in range(n_points):
-                    angle = 2 * i * np.pi / n_points
-                    xy_points.append([diameter / 2 * np.cos(angle), diameter / 2 * np.sin(angle), 0])
-            elif feature == 'back_housing':
-                z_offset = -1.*self.get_properties('design')['housing_length']
-                for i in range(n_points):
-                    angle = 2 * i * np.pi / n_points
-                    xy_points.append([diameter / 2 * np.cos(angle), diameter / 2 * np.sin(angle), z_offset])
+            angles = 2 * np.pi * np.arange(n_points) / n_points
+            xy_points = np.zeros((n_points, 3))
+            xy_points[:, 0] = diameter / 2 * np.cos(angles)
+            xy_points[:, 1] = diameter / 2 * np.sin(angles)
+            if feature == 'back_housing':
+                xy_points[:, 2] = -1.*self.get_properties('design')['housing_length']
+            elif feature != 'front_housing':
+                xy_points = np.zeros((0, 3))
 
             return self.get_transformed_points(xy_points, place_info, device_for_coordinate_system)
 
     def get_fiducials(self, place_info, device_for_coordinate_system=None):
         """Return the set of fiducial points for surveying (locations of the corner cube reflectors)"""
-        return self.get_transformed_points(self.fiducials, place_info, device_for_coordinate_system)
+        return self.get_derived('fiducials', place_info, device_for_coordinate_system,
+                                lambda: self.get_transformed_points(self.fiducials, place_info, device_for_coordinate_system))
 
     def __init__(self, name, container=None, kind='C', place_design={}, place_true={}):
         super().__init__(CAMERA, name, container, kind, place_design, place_true)
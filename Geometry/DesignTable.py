@@ -0,0 +1,99 @@
+class DesignTable(dict):
+    """
+    DesignTable: a dictionary of device design lists keyed by kind (e.g. MPMT.pmts_design), where the design lists
+    of some kinds are built when they are first used, rather than when the module is imported.
+
+    A builder is the name of a class method of the device class holding the table, which returns the design list.
+    Kinds with the same builder share the same list (e.g. 'ME' and 'MI' mPMTs):
+
+        pmts_design = DesignTable({'MR': def_pmts}, builders={'ME': 'build_dome_pmts', 'MI': 'build_dome_pmts'})
+
+    Otherwise the table behaves as an ordinary dictionary: design lists can be added, replaced, or modified.
+    """
+
+    def __init__(self, designs=None, builders=None):
+        super().__init__(designs or {})
+        # kinds whose designs are not built yet: name of the builder method
+        self.builders = dict(builders or {})
+        self.owner = None
+        # design lists built so far, keyed by builder name
+        self.built = {}
+
+    def __set_name__(self, owner, name):
+        # the builders are methods of the class holding the table
+        self.owner = owner
+
+    def add_builder(self, kind, builder):
+        """Set the name of the class method that builds the design list for a kind"""
+        super().pop(kind, None)
+        self.builders[kind] = builder
+
+    def build(self, kind):
+        """Build the design list for a kind (if it is not built already)"""
+        builder = self.builders.pop(kind, None)
+        if builder is not None:
+            if builder not in self.built:
+                self.built[builder] = getattr(self.owner, builder)()
+            super().__setitem__(kind, self.built[builder])
+
+    def build_all(self):
+        """Build the design lists of all kinds"""
+        for kind in list(self.builders):
+            self.build(kind)
+
+    def __missing__(self, kind):
+        if kind in self.builders:
+            self.build(kind)
+            return super().__getitem__(kind)
+        raise KeyError(kind)
+
+    def __contains__(self, kind):
+        return super().__contains__(kind) or kind in self.builders
+
+    def __setitem__(self, kind, designs):
+        self.builders.pop(kind, None)
+        super().__setitem__(kind, designs)
+
+    def __delitem__(self, kind):
+        if kind in self.builders and not super().__contains__(kind):
+            del self.builders[kind]
+        else:
+            super().__delitem__(kind)
+
+    def get(self, kind, default=None):
+        return self[kind] if kind in self else default
+
+    def setdefault(self, kind, default=None):
+        if kind not in self:
+            self[kind] = default
+        return self[kind]
+
+    def pop(self, kind, *default):
+        self.build(kind)
+        return super().pop(kind, *default)
+
+
+def _building_all(method):
+    def dict_method(self, *args, **kwargs):
+        self.build_all()
+        return method(self, *args, **kwargs)
+    dict_method.__name__ = method.__name__
+    return dict_method
+
+
+# methods that see all kinds build all the design lists first
+for _method in ['__iter__', '__len__', '__repr__', '__eq__', '__ne__', '__reduce_ex__', 'keys', 'values', 'items',
+                'copy', 'popitem', 'update']:
+    setattr(DesignTable, _method, _building_all(getattr(dict, _method)))
+
+
+class DesignList:
+    """A class attribute that gives the design list of one kind in a DesignTable of the class
+    (e.g. SM.bottom_mpmts is SM.devices_design['bottom']), built when first used"""
+
+    def __init__(self, table_name, kind):
+        self.table_name = table_name
+        self.kind = kind
+
+    def __get__(self, instance, owner):
+        return getattr(owner, self.table_name)[self.kind]
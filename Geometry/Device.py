@@ -1,10 +1,151 @@
 import pickle
 import json
+import weakref
 import datetime
 from pathlib import Path
+from types import MappingProxyType
 import numpy as np
-from scipy import stats
-from scipy.spatial.transform import Rotation
+from Geometry.Placement import Placement
+from Geometry.Sampler import Sampler
+
+# transformation of a device to its own coordinate system
+_identity_transform = (np.identity(3), np.zeros(3))
+_identity_transform[0].flags.writeable = False
+_identity_transform[1].flags.writeable = False
+
+
+# marks a slot that has not been set
+_missing = object()
+
+# returned by get_stored for an optional placement or property dictionary that was never set (read-only)
+_empty = MappingProxyType({})
+
+# the slots of the optional placement and property dictionaries
+_optional_slots = {'place_survey': '_place_survey', 'place_photo': '_place_photo', 'place_est': '_place_est',
+                   'place_est_sig': '_place_est_sig', 'prop_est': '_prop_est', 'prop_est_sig': '_prop_est_sig'}
+
+
+def _store_place(device, attribute, place_info, place, shared=False):
+    """Store a placement in a device slot, without informing the device. Returns True if a placement was replaced.
+    A shared placement is held by another device, which remains its main owner."""
+    if place is not None and not isinstance(place, Placement):
+        place = Placement(place)
+    old_place = getattr(device, attribute, _missing)
+    if isinstance(old_place, Placement):
+        old_place.remove_owner(device, place_info)
+    if place is not None:
+        place.add_owner(device, place_info, weak=shared)
+    setattr(device, attribute, place)
+    return old_place is not _missing
+
+
+def _get_pending(device, name, make):
+    """Return the empty placement or dictionary given out for an optional attribute that the device does not have.
+    The same object is returned until the attribute is set, so that changes made through any reference are kept."""
+    pending = getattr(device, '_pending', None)
+    if pending is None:
+        pending = device._pending = {}
+    value = pending.get(name)
+    if value is None:
+        value = pending[name] = make()
+    return value
+
+
+def _clear_pending(device, name):
+    """Forget the empty object given out for an optional attribute that is being set"""
+    pending = getattr(device, '_pending', None)
+    if pending and name in pending:
+        value = pending.pop(name)
+        # a reference kept to it no longer replaces the attribute when modified
+        if isinstance(value, Placement):
+            value.pending = None
+        else:
+            value.device = None
+        if not pending:
+            device._pending = None
+
+
+def _placement_property(name, optional=False):
+    """Return a property that stores a placement dictionary as a Placement, so that changes are tracked.
+    An optional placement is only stored when it is set or modified: until then, an empty placement is returned."""
+    attribute = '_' + name
+    place_info = name[len('place_'):]
+
+    def get_place(self):
+        place = getattr(self, attribute, _missing)
+        if place is _missing:
+            return _get_pending(self, name, lambda: Placement.pending_for(self, name)) if optional else None
+        return place
+
+    def set_place(self, place):
+        if optional:
+            _clear_pending(self, name)
+        replaced = _store_place(self, attribute, place_info, place)
+        # the first design and true placements are set by the constructor, when there is nothing to discard
+        if replaced or optional:
+            self.set_dirty(place_info)
+
+    return property(get_place, set_place)
+
+
+class _PendingDict(dict):
+    """An empty dictionary returned for an optional property dictionary that a device does not have:
+    it is given to the device when it is first modified"""
+
+    __slots__ = ('device', 'attribute')
+
+    def __init__(self, device, attribute):
+        super().__init__()
+        self.device = device
+        self.attribute = attribute
+
+    def _store(self):
+        if self.device is not None:
+            setattr(self.device, self.attribute, self)
+            self.device = None
+
+    def __reduce__(self):
+        return dict, (dict(self),)
+
+
+def _storing(method):
+    def storing_method(self, *args, **kwargs):
+        result = method(self, *args, **kwargs)
+        self._store()
+        return result
+    storing_method.__name__ = method.__name__
+    return storing_method
+
+
+for _method in ['__setitem__', '__ior__', 'update', 'setdefault']:
+    setattr(_PendingDict, _method, _storing(getattr(dict, _method)))
+
+
+def _optional_property(name):
+    """Return a property for a dictionary that is only stored when it is set or modified"""
+    attribute = '_' + name
+
+    def get_dict(self):
+        value = getattr(self, attribute, _missing)
+        return _get_pending(self, name, lambda: _PendingDict(self, name)) if value is _missing else value
+
+    def set_dict(self, value):
+        _clear_pending(self, name)
+        setattr(self, attribute, value)
+
+    return property(get_dict, set_dict)
+
+
+def _write_json_member(f, key, value, indent, level, first):
+    """Write a member of a json object at the given nesting level, formatted as by json.dump.
+    If value is None, the member is the start of an object, whose members are written next."""
+    separator = '' if first else ','
+    if indent is None:
+        f.write(separator + json.dumps(key) + ':' + ('{' if value is None else
+                                                     json.dumps(value, separators=(',', ':'))))
+    else:
+        text = '{' if value is None else json.dumps(value, indent=indent).replace('\n', '\n' + ' ' * indent * level)
+        f.write(separator + '\n' + ' ' * indent * level + json.dumps(key) + ': ' + text)
 
 
 class Device:
@@ -34,6 +175,9 @@ class Device:
             .place_photo: placement as measured by photogrammetry
             .place_est: current placement estimates
             .place_est_sig: standard deviation of placement estimators
+        - the survey, photo, and estimated placements and the property estimates are only stored once they are set
+          (or modified): until then, the same empty dictionary is returned each time (get_stored reads them
+          without the device keeping an empty dictionary)
     Misc:
         - "device_type" points to a device class (e.g. PMT or LED)
         - "kind" defines the particular version of the device_type (e.g. 'P1' or 'L2')
@@ -53,20 +197,54 @@ class Device:
 
     """
 
+    # names of the attributes that may hold lists of sub-devices
+    # (a list may also collect devices placed in lower level containers, e.g. WCD.mpmts)
+    device_lists = ['wcds', 'sms', 'mpmts', 'cameras', 'targets', 'pmts', 'leds', 'calibs']
+
+    # names of the class design dictionaries used by place_devices to fill each list of sub-devices
+    design_tables = {}
+
+    # the attributes of all devices are kept in slots, as there are many devices (other attributes, such as the lists
+    # of sub-devices, are kept in the instance dictionary)
+    __slots__ = ('name', 'container', 'kind', 'prop_design', 'prop_true', '_prop_est', '_prop_est_sig',
+                 '_place_design', '_place_true', '_place_survey', '_place_photo', '_place_est', '_place_est_sig',
+                 '_transforms', '_derived', '_listeners', '_ancestors', '_pending', '__dict__', '__weakref__')
+
+    # placement dictionaries are stored as Placements, which keep track of changes.
+    # Most devices have no survey, photo, or estimated placements: these are only stored once they are set
+    place_design = _placement_property('place_design')
+    place_true = _placement_property('place_true')
+    place_survey = _placement_property('place_survey', optional=True)
+    place_photo = _placement_property('place_photo', optional=True)
+    place_est = _placement_property('place_est', optional=True)
+    place_est_sig = _placement_property('place_est_sig', optional=True)
+
+    # and the same for the property estimates
+    prop_est = _optional_property('prop_est')
+    prop_est_sig = _optional_property('prop_est_sig')
+
+    # random number generator used to draw true properties and placements
+    sampler = Sampler()
+
+    # numbers of transformations found in (hits) or added to (misses) the device transformation caches
+    transform_cache_info = {'hits': 0, 'misses': 0}
+
     def __init__(self, device_type, name, container, kind, place_design, place_true):
         """Constructor"""
 
+        # cache of transformations to other coordinate systems: {place_info: {device_for_coordinate_system: transform}}
+        # (None until used)
+        self._transforms = None
+        # cache of other quantities derived from the placements (see get_derived), keyed in the same way
+        self._derived = None
+        # functions called when placements change (see add_listener)
+        self._listeners = None
+
         self.prop_design = {}
         self.prop_true = {}
-        self.prop_est = {}
-        self.prop_est_sig = {}
 
-        self.place_design = {}
-        self.place_true = {}
-        self.place_survey = {}
-        self.place_photo = {}
-        self.place_est = {}
-        self.place_est_sig = {}
+        # place_design and place_true are set by set_placement.
+        # The other placements and the property estimates are stored when they are first set
 
         # force the name to be a string
         self.name = str(name)
@@ -81,22 +259,12 @@ class Device:
         """Set the true properties for the device object based on the design distributions"""
         if hasattr(device_type, 'design_mean') and kind in device_type.design_mean:
             self.prop_design = device_type.design_mean[kind]
-            truth = {}
-            for key in device_type.design_mean[kind]:
-                scale = (device_type.design_scale[kind])[key]
-                mean = (device_type.design_mean[kind])[key]
-                if scale > 0.:
-                    var_type = (device_type.design_var[kind]).get(key, 'norm')
-                    if var_type == 'uniform':
-                        val = stats.uniform.rvs(loc=mean - scale, scale=2. * scale)
-                    elif var_type == 'gamma':
-                        val = stats.gamma.rvs(a=mean ** 2 / scale ** 2, scale=scale ** 2 / mean, loc=0.)
-                    else:
-                        val = stats.norm.rvs(loc=mean, scale=scale)
-                    truth[key] = val
-                else:
-                    truth[key] = mean
-            self.prop_true = truth
+            self.prop_true = self.sampler.draw_properties(device_type, kind)
+
+    @classmethod
+    def set_seed(cls, seed=None):
+        """Restart the random generator used for all devices, so that a realization can be reproduced"""
+        Device.sampler = Sampler(seed)
 
     def get_properties(self, prop_info):
         """Return the properties of the device as a dictionary"""
@@ -104,6 +272,16 @@ class Device:
         device_prop = getattr(self, 'prop_' + prop_info, None)
         return device_prop
 
+    def get_stored(self, name):
+        """Return a placement or property dictionary (e.g. 'place_est') for reading only. An optional one that was
+        never set is returned as a read-only empty mapping, rather than an empty dictionary that the device keeps
+        until it is set, so that reading many devices takes no memory. Unknown names give None."""
+        slot = _optional_slots.get(name)
+        if slot is None:
+            return getattr(self, name, None)
+        value = getattr(self, slot, _missing)
+        return _empty if value is _missing else value
+
     def set_property(self, prop, value):
         """Set a true property for a device"""
         self.prop_true[prop] = value
@@ -113,33 +291,479 @@ class Device:
         self.place_design = place_design.copy()
         self.place_true = place_true.copy()
 
-    def place_devices(self, device_type, devices_design, kind):
-        """Creates and places sub_devices that make up this device"""
+    def place_devices(self, device_type, devices_design, kind, **kwargs):
+        """Creates and places sub_devices that make up this device.
+        Other keyword arguments (e.g. lazy) are passed to the constructor of the sub_devices."""
         devices = []
         if kind in devices_design:
-            for device in devices_design[kind]:
+            design_list = devices_design[kind]
+            # draw the true placements of all sub-devices together
+            places_true = self.sampler.draw_placements(design_list)
+            # and the true properties of all sub-devices of the same kind
+            for device_kind in set(device['kind'] for device in design_list):
+                self.sampler.reserve(device_type, device_kind,
+                                     sum(1 for device in design_list if device['kind'] == device_kind))
+
+            for device, place_true in zip(design_list, places_true):
                 device_kind = device['kind']
                 place_design = {'loc': device['loc'],
                                 'rot_axes': device['rot_axes'],
                                 'rot_angles': device['rot_angles']}
-                loc_true = []
-                for i in range(3):
-                    loc_true.append(stats.norm.rvs(device['loc'][i], device['loc_sig'][i]))
-
-                if len(device['rot_axes']) > 1:
-                    rot_angles_true = []
-                    for i in range(len(device['rot_angles'])):
-                        rot_angles_true.append(stats.norm.rvs(device['rot_angles'][i], device['rot_angles_sig'][i]))
-                else:
-                    rot_angles_true = stats.norm.rvs(device['rot_angles'], device['rot_angles_sig'])
-
-                place_true = {'loc': loc_true, 'rot_axes': device['rot_axes'],
-                              'rot_angles': rot_angles_true}
                 name = device.get('name', '')
-                new_device = device_type(name, self, device_kind, place_design, place_true)
+                new_device = device_type(name, self, device_kind, place_design, place_true, **kwargs)
                 devices.append(new_device)
         return devices
 
+    def get_design_entries(self):
+        """Return the design list entries used to place the devices in this device: a list of (device, entry)"""
+        entries = []
+        for device_list_name, table_name in self.design_tables.items():
+            design_list = getattr(self, table_name, {}).get(self.kind) or []
+            # devices that have not been created (in lazy mode) are not included
+            sub_devices = self.__dict__.get(device_list_name, self.__dict__.get('_' + device_list_name)) or []
+            for device, entry in zip(sub_devices, design_list):
+                if device is not None and device.container is self:
+                    entries.append((device, entry))
+        return entries
+
+    def clone(self, redraw=('prop_true', 'place_true'), keep_est=False, seed=None):
+        """Return a copy of the device and all of the devices it contains: a new realization of the same design.
+
+        The structure of the tree is reused, and the design properties and placements are shared with the
+        original (so they should not be modified). Only the
+        true properties and/or placements listed in redraw are drawn again (from the same distributions as used
+        by the constructors), the others are copied.
+        * redraw: 'prop_true' and/or 'place_true' (a string or a list, empty to make an exact copy)
+        * keep_est: if True, the estimated placements and properties are copied (the survey and photo placements,
+          which are measurements of the original realization, are not)
+        * seed: seed for the random draws (None: use the random generator of the devices, see Device.set_seed)
+
+        The copy of the device is in the same container as the original, but it is not added to its device lists.
+        """
+        if isinstance(redraw, str):
+            redraw = [redraw]
+        for item in redraw:
+            if item not in ('prop_true', 'place_true'):
+                raise ValueError('Device: cannot redraw ' + str(item) + ', only prop_true and place_true.')
+        sampler = self.sampler if seed is None else Sampler(seed)
+
+        # the devices in the tree, with containers before the devices they contain
+        devices = []
+        to_do = [self]
+        while to_do:
+            device = to_do.pop()
+            devices.append(device)
+            to_do.extend(reversed(device.get_sub_devices()))
+
+        # the design entries of the devices whose true placements are drawn again
+        entries = []
+        if 'place_true' in redraw:
+            entries = [(device, entry) for container in devices for device, entry in container.get_design_entries()]
+        redrawn = set(id(device) for device, entry in entries)
+
+        place_infos = ('true', 'est', 'est_sig') if keep_est else ('true',)
+        # the true properties to be drawn again are replaced below
+        redraw_properties = 'prop_true' in redraw
+        clones = {}
+        # the clones with other attributes, e.g. the lists of sub-devices
+        containers = []
+        for device in devices:
+            device_type = type(device)
+            device_clone = device_type.__new__(device_type)
+            device_clone._transforms = None
+            device_clone._derived = None
+            device_clone._listeners = None
+            device_clone.name = device.name
+            device_clone.kind = device.kind
+            device_clone.container = clones.get(id(device.container), device.container)
+            device_clone.prop_design = device.prop_design
+            device_clone.prop_true = device.prop_true if redraw_properties else dict(device.prop_true)
+            place_design = getattr(device, '_place_design', None)
+            if place_design is not None:
+                _store_place(device_clone, '_place_design', 'design', place_design, shared=True)
+            for place_info in place_infos:
+                place = getattr(device, '_place_' + place_info, _missing)
+                if place is not _missing and not (place_info == 'true' and id(device) in redrawn):
+                    _store_place(device_clone, '_place_' + place_info, place_info,
+                                 None if place is None else place.duplicate())
+            if keep_est:
+                for attribute in ('_prop_est', '_prop_est_sig'):
+                    value = getattr(device, attribute, _missing)
+                    if value is not _missing:
+                        setattr(device_clone, attribute, dict(value))
+            extras = device.__dict__
+            if extras:
+                device_clone.__dict__.update(extras)
+                containers.append(device_clone)
+            clones[id(device)] = device_clone
+
+        # the lists of sub-devices (including the flat lists of devices in lower level containers)
+        for device_clone in containers:
+            for key, value in device_clone.__dict__.items():
+                if isinstance(value, list) and key.lstrip('_') in self.device_lists:
+                    device_clone.__dict__[key] = [None if device is None else clones.get(id(device), device)
+                                                  for device in value]
+
+        if entries:
+            # all of the placements are drawn together
+            places_true = sampler.draw_placements([entry for device, entry in entries])
+            for (device, entry), place_true in zip(entries, places_true):
+                place_true = Placement.from_lists(place_true['loc'], place_true['rot_axes'], place_true['rot_angles'])
+                _store_place(clones[id(device)], '_place_true', 'true', place_true)
+
+        if redraw_properties:
+            # and the properties of all devices of the same kind
+            groups = {}
+            for device in devices:
+                device_type = type(device)
+                if device.kind in getattr(device_type, 'design_mean', {}):
+                    groups.setdefault((device_type, device.kind), []).append(clones[id(device)])
+                else:
+                    clones[id(device)].prop_true = dict(device.prop_true)
+            for (device_type, kind), device_clones in groups.items():
+                sampler.reserve(device_type, kind, len(device_clones))
+                for device_clone in device_clones:
+                    device_clone.prop_true = sampler.draw_properties(device_type, kind)
+
+        return clones[id(self)]
+
+    def get_sub_devices(self):
+        """Return the list of devices placed directly in this device"""
+        sub_devices = []
+        for device_list in self.device_lists:
+            devices = getattr(self, device_list, None)
+            if devices is not None:
+                # missing devices may be marked as None
+                sub_devices.extend([device for device in devices if device is not None and device.container is self])
+        return sub_devices
+
+    def get_devices(self, devices):
+        """Return the list of all devices of the specified type contained in this device (at any level).
+        devices is the name of the list holding them: 'mpmts', 'pmts', 'leds', 'cameras', 'targets', etc.
+        The order is the same as that of the flat lists, e.g. WCD.mpmts
+        """
+        device_list = []
+        for device_list_name in self.device_lists:
+            sub_devices = getattr(self, device_list_name, None)
+            if sub_devices is None:
+                continue
+            for device in sub_devices:
+                # missing devices may be marked as None
+                if device is not None and device.container is self:
+                    if device_list_name == devices:
+                        device_list.append(device)
+                    device_list.extend(device.get_devices(devices))
+        return device_list
+
+    def get_local_transform(self, place_info):
+        """Return the rotation matrix and translation of the device in the coordinate system of its container.
+        A point p in the device coordinate system is at rotation @ p + translation in the container system.
+        """
+        # place_info is a string: either 'true', 'design', or 'est'
+        device_place = self.get_stored('place_' + place_info)
+        if not device_place:
+            raise ValueError('Device: ' + self.__class__.__name__ + ' ' + self.name +
+                             ' has no ' + place_info + ' placement information.')
+        # the rotation matrix is compiled once and kept by the placement until it is modified (read-only)
+        rotation = device_place.get_matrix()
+        translation = np.array(device_place.get('loc', [0., 0., 0.]), dtype=float)
+        return rotation, translation
+
+    def get_transform(self, place_info, device_for_coordinate_system=None):
+        """Return the rotation matrix and translation that transform points in the device coordinate system
+        to the coordinate system of the specified container. If the specified container is None, use the
+        coordinate system of the top-level container (typically the WCD).
+
+        The transformations are cached until the placement of the device or one of its containers is replaced
+        or modified (see set_dirty). The returned arrays are read-only.
+        A device without the placement information, or with an empty placement, raises ValueError.
+        """
+
+        specified_container = self.get_specified_container(device_for_coordinate_system)
+
+        if self.container is None or self == specified_container:
+            return _identity_transform
+        if not self.get_stored('place_' + place_info):
+            raise ValueError('Device: ' + self.__class__.__name__ + ' ' + self.name +
+                             ' has no ' + place_info + ' placement information.')
+        return self._get_transform(place_info, specified_container)
+
+    def _get_transform(self, place_info, specified_container):
+        """Return the (cached) transformation to the coordinate system of a container, as get_transform.
+        Containers without the placement information are treated as having the identity transformation."""
+
+        if self._transforms is None:
+            self._transforms = {}
+        transforms = self._transforms.get(place_info)
+        if transforms is None:
+            transforms = self._transforms[place_info] = {}
+        cached = transforms.get(specified_container)
+        if cached is not None:
+            Device.transform_cache_info['hits'] += 1
+            return cached
+        Device.transform_cache_info['misses'] += 1
+
+        # start from the (cached) transformation of the container
+        if self.container is specified_container:
+            container_rotation, container_translation = _identity_transform
+        else:
+            container_rotation, container_translation = self.container._get_transform(place_info, specified_container)
+        if self.get_stored('place_' + place_info):
+            device_rotation, device_translation = self.get_local_transform(place_info)
+            rotation = container_rotation @ device_rotation
+            translation = container_rotation @ device_translation + container_translation
+        else:
+            rotation = container_rotation.copy()
+            translation = container_translation.copy()
+        rotation.flags.writeable = False
+        translation.flags.writeable = False
+
+        transforms[specified_container] = (rotation, translation)
+        return rotation, translation
+
+    def get_ancestors(self):
+        """Return the tuple of the device and its containers, up to the top-level container (cached)"""
+        ancestors = getattr(self, '_ancestors', None)
+        if ancestors is None or (ancestors[1] if len(ancestors) > 1 else None) is not self.container:
+            if self.container is None:
+                ancestors = (self,)
+            else:
+                ancestors = (self,) + self.container.get_ancestors()
+            self._ancestors = ancestors
+        return ancestors
+
+    def get_common_ancestor(self, other):
+        """Return the lowest device that contains (or is) both this device and the other device"""
+        ancestors = self.get_ancestors()
+        for ancestor in other.get_ancestors():
+            if ancestor in ancestors:
+                return ancestor
+        raise ValueError('Device: ' + self.__class__.__name__ + ' ' + self.name + ' and ' +
+                         other.__class__.__name__ + ' ' + other.name + ' are not in the same device tree.')
+
+    def get_relative_transform(self, place_info, reference):
+        """Return the rotation matrix and translation that transform points in the device coordinate system
+        to the coordinate system of the reference device, which can be any device in the same tree
+        (e.g. a PMT in the coordinate system of a camera). Both are transformed to their lowest common
+        ancestor using the cached transformations.
+        """
+        common_ancestor = self.get_common_ancestor(reference)
+        if reference is common_ancestor:
+            return self.get_transform(place_info, reference)
+        device_rotation, device_translation = self.get_transform(place_info, common_ancestor)
+        reference_rotation, reference_translation = reference.get_transform(place_info, common_ancestor)
+        rotation = reference_rotation.T @ device_rotation
+        translation = reference_rotation.T @ (device_translation - reference_translation)
+        return rotation, translation
+
+    @staticmethod
+    def get_relative_transforms(devices, references, place_info, pairs=False):
+        """Return the transformations of many devices to the coordinate systems of many reference devices,
+        e.g. all PMTs seen from all cameras.
+
+        If pairs is False, the rotations (n_reference, n_device, 3, 3) and translations (n_reference, n_device, 3)
+        for every combination are returned. If pairs is True, devices and references are lists of the same length,
+        and the rotations (N, 3, 3) and translations (N, 3) for each (device, reference) pair are returned.
+        """
+        devices = list(devices)
+        references = list(references)
+        if not devices or not references:
+            shape = (len(devices),) if pairs else (len(references), len(devices))
+            return np.zeros(shape + (3, 3)), np.zeros(shape + (3,))
+        # all devices are transformed to the lowest common ancestor of all of them
+        common_ancestor = devices[0]
+        for device in devices[1:] + references:
+            if device not in common_ancestor.get_ancestors():
+                common_ancestor = common_ancestor.get_common_ancestor(device)
+
+        def get_transforms(device_list):
+            transforms = [device.get_transform(place_info, common_ancestor) for device in device_list]
+            rotations = np.array([rotation for rotation, _ in transforms])
+            return rotations, np.array([translation for _, translation in transforms])
+
+        device_rotations, device_translations = get_transforms(devices)
+        reference_rotations, reference_translations = get_transforms(references)
+        if pairs:
+            rotations = np.einsum('nji,njk->nik', reference_rotations, device_rotations)
+            translations = np.einsum('nji,nj->ni', reference_rotations, device_translations - reference_translations)
+        else:
+            rotations = np.einsum('rji,djk->rdik', reference_rotations, device_rotations)
+            offsets = device_translations[None, :, :] - reference_translations[:, None, :]
+            translations = np.einsum('rji,rdj->rdi', reference_rotations, offsets)
+        return rotations, translations
+
+    def get_derived(self, name, place_info, device_for_coordinate_system, calculate):
+        """Return a quantity derived from the placements of the device and its containers (e.g. its fiducial
+        points in the coordinate system of the specified container). calculate() is called the first time, and
+        the result is kept until one of those placements is replaced or modified. A copy is returned.
+        name identifies the quantity, and must include any other arguments that it depends on."""
+        specified_container = self.get_specified_container(device_for_coordinate_system)
+        if self._derived is None:
+            self._derived = {}
+        derived = self._derived.get(place_info)
+        if derived is None:
+            derived = self._derived[place_info] = {}
+        key = (name, specified_container)
+        value = derived.get(key)
+        if value is None:
+            value = derived[key] = calculate()
+        return value.copy()
+
+    def set_dirty(self, place_info):
+        """Mark the placements of the device as changed: the cached transformations and derived quantities of the
+        device and all of the devices it contains are discarded, and the listeners of the device and its
+        containers are called. This is done automatically whenever a placement is replaced or modified."""
+        devices = [self]
+        while devices:
+            device = devices.pop()
+            if device._transforms:
+                device._transforms.pop(place_info, None)
+            if device._derived:
+                device._derived.pop(place_info, None)
+            devices.extend(device.get_sub_devices())
+
+        device = self
+        while device is not None:
+            listeners = device._listeners
+            if listeners:
+                for listener in list(listeners):
+                    callback = listener()
+                    if callback is None:
+                        listeners.remove(listener)
+                    else:
+                        callback(self, place_info)
+            device = device.container
+
+    def add_listener(self, callback):
+        """Call callback(device, place_info) whenever a placement of this device or of a device it contains
+        (at any level) is replaced or modified. Bound methods are held by weak references, so that the listener
+        is removed when its object is deleted."""
+        if hasattr(callback, '__self__'):
+            listener = weakref.WeakMethod(callback)
+        else:
+            listener = lambda: callback
+        if self._listeners is None:
+            self._listeners = []
+        self._listeners.append(listener)
+
+    def remove_listener(self, callback):
+        """Stop calling a listener added by add_listener"""
+        listeners = self._listeners or []
+        for listener in listeners:
+            if listener() == callback:
+                listeners.remove(listener)
+                return
+
+    def clear_transform_cache(self):
+        """Remove all cached transformations and derived quantities of this device"""
+        self._transforms = None
+        self._derived = None
+
+    @classmethod
+    def reset_transform_cache_info(cls):
+        """Reset the numbers of transformation cache hits and misses"""
+        Device.transform_cache_info['hits'] = 0
+        Device.transform_cache_info['misses'] = 0
+
+    def get_placements(self, devices, place_info, device_for_coordinate_system=None):
+        """Return the placements of all devices of the specified type contained in this device as arrays.
+        Each container transform is composed once and applied to all of its sub-devices.
+
+        Parameters
+        ----------
+        devices : str
+            name of the device lists to collect: 'mpmts', 'pmts', 'leds', 'cameras', 'targets', etc.
+        place_info : str
+            'design', 'true', 'survey', 'photo', or 'est' : type of placement information to use
+        device_for_coordinate_system : Device
+            device whose coordinate system is used to define the placements
+            If None, use the coordinate system of the top-level container (typically the WCD or room).
+
+        Returns
+        -------
+        dict
+            'devices': list of N devices (same order as Device.get_devices)
+            'location': (N,3) array, 'direction_x', 'direction_z': (N,3) arrays of unit vectors,
+            'rotation': (N,3,3) array of rotation matrices (columns are the device axes)
+            Devices without placement information have NaN entries. Containers without it are treated as having
+            the identity transformation, as in get_placement.
+
+        """
+
+        specified_container = device_for_coordinate_system
+        if specified_container is None:
+            specified_container = self
+            while specified_container.container is not None:
+                specified_container = specified_container.container
+
+        device_list = self.get_devices(devices)
+        n_device = len(device_list)
+
+        # transforms of the containers in the specified coordinate system, each calculated once
+        container_transforms = {}
+
+        def get_container_transform(container):
+            if container is specified_container:
+                return np.identity(3), np.zeros(3)
+            transform = container_transforms.get(id(container))
+            if transform is None:
+                if container.container is None:
+                    device_full_name = container.__class__.__name__ + ' ' + container.name
+                    container_full_name = specified_container.__class__.__name__ + ' ' + specified_container.name
+                    raise ValueError('Device: ' + device_full_name + ' is not in the specified container: '
+                                     + container_full_name + '.')
+                outer_rotation, outer_translation = get_container_transform(container.container)
+                if not container.get_stored('place_' + place_info):
+                    # a container without the placement information has the identity transformation
+                    transform = (outer_rotation, outer_translation)
+                else:
+                    local_rotation, local_translation = container.get_local_transform(place_info)
+                    transform = (outer_rotation @ local_rotation,
+                                 outer_rotation @ local_translation + outer_translation)
+                container_transforms[id(container)] = transform
+            return transform
+
+        local_rotations = np.tile(np.identity(3), (n_device, 1, 1))
+        local_translations = np.zeros((n_device, 3))
+        container_rotations = np.empty((n_device, 3, 3))
+        container_translations = np.empty((n_device, 3))
+        # collect the local rotations by axes sequence so that they are built together
+        angles_by_axes = {}
+        for i, device in enumerate(device_list):
+            container_rotations[i], container_translations[i] = get_container_transform(device.container)
+            device_place = device.get_stored('place_' + place_info)
+            if not device_place:
+                local_rotations[i] = np.nan
+                local_translations[i] = np.nan
+                continue
+            local_translations[i] = device_place.get('loc', [0., 0., 0.])
+            if device_place.is_compiled:
+                local_rotations[i] = device_place.get_matrix()
+            elif 'rot_axes' in device_place:
+                indices, angles, places = angles_by_axes.setdefault(device_place['rot_axes'], ([], [], []))
+                indices.append(i)
+                angles.append(np.ravel(device_place['rot_angles']))
+                places.append(device_place)
+
+        if angles_by_axes:
+            # scipy.spatial is imported when first needed, as it takes much longer to import than this package
+            from scipy.spatial.transform import Rotation
+        for rot_axes, (indices, angles, places) in angles_by_axes.items():
+            matrices = Rotation.from_euler(rot_axes, np.array(angles)).as_matrix()
+            local_rotations[indices] = matrices
+            # keep the matrices in the placements for the next time
+            for device_place, matrix in zip(places, matrices):
+                device_place.compile(matrix)
+
+        rotations = np.matmul(container_rotations, local_rotations)
+        locations = np.einsum('nij,nj->ni', container_rotations, local_translations) + container_translations
+
+        return {'devices': device_list,
+                'location': locations,
+                'direction_x': rotations[:, :, 0],
+                'direction_z': rotations[:, :, 2],
+                'rotation': rotations}
+
     def get_specified_container(self, device_for_coordinate_system):
         """Return the specified container: the device whose coordinate system we want to use"""
 
@@ -171,6 +795,7 @@ class Device:
         """Return the location af device and directions of its x and z axes in the coordinate system
         of the specified container. If the specified container is None, use the coordinate system of
         the top-level container (typically the WCD).
+        A device with an empty placement raises KeyError, and one without the placement information raises ValueError.
         """
 
         specified_container = self.get_specified_container(device_for_coordinate_system)
@@ -181,124 +806,104 @@ class Device:
             direction_x = [1., 0., 0.]
             direction_z = [0., 0., 1.]
         else:
-            # get the location and orientation of the device in the container's coordinate system
-
-            # place_info is a string: either 'true', 'design', or 'est'
-            # head is the location of the device, tail_x,_z are the ends of vectors of
-            # length dist_head aligned with the device's x and z-axes
-            device_place = getattr(self, 'place_' + place_info, None)
+            device_place = self.get_stored('place_' + place_info)
             if device_place is None:
                 raise ValueError('Device: ' + self.__class__.__name__ + ' ' + self.name +
                                  ' has no ' + place_info + ' placement information.')
-            head = device_place['loc']
-            dist_head = 100.
-
-            rot1 = Rotation.from_euler(device_place['rot_axes'], device_place['rot_angles'])
-            x_axis = rot1.apply([1., 0., 0.])
-            z_axis = rot1.apply([0., 0., 1.])
-
-            location = head
-            direction_x = x_axis
-            direction_z = z_axis
-
-            current_container = self.container
-            # if the current container is not the specified container, then apply the container's placement
-            while current_container != specified_container:
-                # apply translation and rotation of current_container
-                tail_x = np.add(location, dist_head * direction_x)
-                tail_z = np.add(location, dist_head * direction_z)
-                container_place = getattr(current_container, 'place_' + place_info, None)
-                if container_place is None:
-                    raise ValueError('Device: ' + current_container.__class__.__name__ + ' ' + self.name +
-                                     ' has no ' + place_info + 'placement information.')
-                rot_head = location
-                rot_tail_x = tail_x
-                rot_tail_z = tail_z
-                if 'rot_axes' in container_place:
-                    rot2 = Rotation.from_euler(container_place['rot_axes'], container_place['rot_angles'])
-                    rot_head = rot2.apply(location)
-                    rot_tail_x = rot2.apply(tail_x)
-                    rot_tail_z = rot2.apply(tail_z)
-                new_direction_x = np.subtract(rot_tail_x, rot_head)
-                new_direction_z = np.subtract(rot_tail_z, rot_head)
-                norm_x = np.linalg.norm(new_direction_x)
-                norm_z = np.linalg.norm(new_direction_z)
-
-                location = np.add(rot_head, container_place.get('loc', [0., 0., 0.]))
-                direction_x = np.divide(new_direction_x, norm_x)
-                direction_z = np.divide(new_direction_z, norm_z)
-
-                current_container = current_container.container
+            # an empty placement has no location
+            if not device_place:
+                raise KeyError('Device: ' + self.__class__.__name__ + ' ' + self.name +
+                               ' has an empty ' + place_info + ' placement.')
+            # get the location and orientation of the device from its (cached) transformation
+            rotation, translation = self._get_transform(place_info, specified_container)
+            location = translation
+            direction_x = rotation[:, 0]
+            direction_z = rotation[:, 2]
 
         return {'location': list(location), 'direction_x': list(direction_x), 'direction_z': list(direction_z)}
 
     def get_transformed_points(self, points, place_info, device_for_coordinate_system=None):
         """Return a set of points transformed to the coordinate system of the specified container.
         If the specified container is None, use the coordinate system of the top-level container (typically the WCD).
+
+        The points are given as an (N,3) array (or a list of N points) in the device coordinate system, and
+        are returned as an (N,3) array. A single point of shape (3,) is returned with shape (3,).
+        A device with an empty placement is at the origin of its container, without rotation.
         """
 
         specified_container = self.get_specified_container(device_for_coordinate_system)
 
+        points = np.array(points, dtype=float)
         if self.container is None or self == specified_container:
             # if a device has no container or if the specified container is itself, then no transformation is needed
             return points
         else:
-            # get the position in the container's coordinate system
-
             # place_info is a string: either 'true', 'design', or 'est'
-            device_place = getattr(self, 'place_' + place_info, None)
-            if device_place is None:
+            if self.get_stored('place_' + place_info) is None:
                 raise ValueError('Device: ' + self.__class__.__name__ + ' ' + self.name +
-                                 ' has no ' + place_info + 'placement information.')
-
-            transformed_points = []
-            for point in points:
-                rot_head = point
-                if 'rot_axes' in device_place:
-                    rot = Rotation.from_euler(device_place['rot_axes'], device_place['rot_angles'])
-                    rot_head = rot.apply(point)
-
-                location = np.add(rot_head, device_place.get('loc', [0., 0., 0.]))
-
-                current_container = self.container
-                # if the current container is not the specified container, then apply the container's placement
-                while current_container != specified_container:
-                    # apply translation and rotation of current_container
-                    container_place = getattr(current_container, 'place_' + place_info, None)
-                    if container_place is None:
-                        raise ValueError('Device: ' + current_container.__class__.__name__ + ' ' + self.name +
-                                         ' has no ' + place_info + 'placement information.')
-                    rot_head = location
-                    if 'rot_axes' in container_place:
-                        rot2 = Rotation.from_euler(container_place['rot_axes'], container_place['rot_angles'])
-                        rot_head = rot2.apply(location)
-
-                    location = np.add(rot_head, container_place.get('loc', [0., 0., 0.]))
-                    current_container = current_container.container
-
-                transformed_points.append(location)
-
+                                 ' has no ' + place_info + ' placement information.')
+            # apply the (cached) transformation to the container's coordinate system to all points at once
+            rotation, translation = self._get_transform(place_info, specified_container)
+            transformed_points = points @ rotation.T
+            transformed_points += translation
             return transformed_points
 
     def get_circle_points(self, n_point, place_info, device_for_coordinate_system=None):
-        """Return a list of length n_point space points of the circle in the x-y plane"""
+        """Return an (n_point,3) array of space points of the circle in the x-y plane"""
         device_prop = getattr(self, 'prop_' + place_info, None)
         radius = device_prop['size'] / 2.
-        p = self.get_placement(place_info, device_for_coordinate_system)
-
-        # change magnitude of direction_x to device radius
-        perp = np.array(p['direction_x']) * radius
-
-        # small rotation about the device z_axis
-        rot = Rotation.from_rotvec(2. * np.pi / n_point * np.array(p['direction_z']))
-        points = []
-        for i in range(n_point):
-            points.append(list(np.add(p['location'], perp)))
-            perp = rot.apply(perp)
-
-        return points
 
-    def save_json(self, filename, prop_info='design', place_info='design', devices='mpmts', device_for_coordinate_system=None):
+        angles = 2. * np.pi * np.arange(n_point) / n_point
+        xy_points = np.zeros((n_point, 3))
+        xy_points[:, 0] = radius * np.cos(angles)
+        xy_points[:, 1] = radius * np.sin(angles)
+
+        return self.get_transformed_points(xy_points, place_info, device_for_coordinate_system)
+
+    # slots that are not saved when pickling
+    _cache_slots = ('_transforms', '_derived', '_listeners', '_ancestors', '_pending', '__dict__', '__weakref__')
+
+    def __getstate__(self):
+        """Return the state for pickling: placements are saved as ordinary dictionaries, placements and property
+        estimates that were never set are left out, and caches are dropped"""
+        state = {}
+        for attribute in Device.__slots__:
+            if attribute in self._cache_slots:
+                continue
+            value = getattr(self, attribute, _missing)
+            if value is _missing:
+                continue
+            if isinstance(value, Placement):
+                value = value.to_dict()
+            elif isinstance(value, _PendingDict):
+                value = dict(value)
+            state[attribute.lstrip('_')] = value
+        state.update(self.__dict__)
+        return state
+
+    def __setstate__(self, state):
+        """Restore the state of a pickled device (also as saved by earlier versions of the package, with placements
+        and property estimates in every device and other names for the cached values)"""
+        self._transforms = None
+        self._derived = None
+        self._listeners = None
+        for key, value in state.items():
+            if key in ('_transforms', '_derived', '_listeners'):
+                continue
+            if key.startswith('_place_'):
+                key = key[1:]
+            if key.startswith('place_') and '_' + key in Device.__slots__:
+                # the placements are stored without informing the device, whose containers may not be restored yet
+                if value != {} or key in ('place_design', 'place_true'):
+                    _store_place(self, '_' + key, key[len('place_'):], value)
+            elif key in ('prop_est', 'prop_est_sig'):
+                if value != {}:
+                    setattr(self, key, value)
+            else:
+                setattr(self, key, value)
+
+    def save_json(self, filename, prop_info='design', place_info='design', devices='mpmts', device_for_coordinate_system=None,
+                  compact=False):
         """Save the properties and/or placements of all the devices of type device_type contained in the device
         to a json formatted file
 
@@ -319,76 +924,129 @@ class Device:
         device_for_coordinate_system : Device
             device whose coordinate system is used to define the placement of the device
             If None, use the coordinate system of the top-level container (typically the WCD or room).
+        compact : bool
+            if True, the file is written without indentation or spaces
 
         Returns
         -------
         None.
 
         """
+        self.save_json_files([(filename, prop_info, place_info)], devices, device_for_coordinate_system, compact)
 
-        info = {}
-        description = {'Date created': datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                       'Device name': self.name,
-                       'prop_info': prop_info if prop_info is not None else 'None',
-                       'place_info': place_info if place_info is not None else 'None',
-                       'devices': devices,
-                       'device_for_coordinate_system': device_for_coordinate_system.name if device_for_coordinate_system is not None else 'None'
-                       }
-        info['description'] = description
-
-        # examine all mPMTs:
-        if getattr(self, 'mpmts', None) is not None:
-            mpmt_info = {}
-            for mpmt in self.mpmts:
-                mpmt_data = {'name': 'MPMT ' + mpmt.name}
-                if 'mpmt' in devices or 'all' in devices:
-                    if prop_info is not None:
-                        mpmt_data['properties'] = mpmt.get_properties(prop_info)
-                    if place_info is not None:
-                        mpmt_data['placement'] = mpmt.get_placement(place_info, device_for_coordinate_system)
-                if getattr(mpmt, 'pmts', None) is not None and ('pmts' in devices or 'all' in devices):
-                    pmt_info = {}
-                    for pmt in mpmt.pmts:
-                        pmt_data = {'name': 'PMT ' + pmt.name}
-                        if prop_info is not None:
-                            pmt_data['properties'] = pmt.get_properties(prop_info)
-                        if place_info is not None:
-                            pmt_data['placement'] = pmt.get_placement(place_info, device_for_coordinate_system)
-                        pmt_info[pmt.name] = pmt_data
-                    mpmt_data['pmts'] = pmt_info
-                if getattr(mpmt, 'leds', None) is not None and ('leds' in devices or 'all' in devices):
-                    led_info = {}
-                    for led in mpmt.leds:
-                        led_data = {'name': 'LED ' + led.name}
-                        if prop_info is not None:
-                            led_data['properties'] = led.get_properties(prop_info)
-                        if place_info is not None:
-                            led_data['placement'] = led.get_placement(place_info, device_for_coordinate_system)
-                        led_info[led.name] = led_data
-                    mpmt_data['leds'] = led_info
-
-                mpmt_info[mpmt.name] = mpmt_data
-
-            info['mpmts'] = mpmt_info
+    def save_json_files(self, outputs, devices='mpmts', device_for_coordinate_system=None, compact=False):
+        """Save several json files (see save_json) in one pass through the devices.
+        The placements are calculated in batches (see get_placements), and the files are written one mPMT at a time.
+        Devices without the requested placement information have null placements.
 
-        try:
-            filepath = Path(filename).resolve()
-        except:
-            raise TypeError('Input arg could not be converted to a valid path: {}' +
-                            '\n It must be a str or Path-like.'.format(filename))
+        Parameters
+        ----------
+        outputs : list of tuples
+            (filename, prop_info, place_info) for each file
+        devices : str
+            'mpmts', 'pmts', 'leds', or 'all' (comma delimited): type(s) of devices to save
+        device_for_coordinate_system : Device
+            device whose coordinate system is used to define the placement of the device
+            If None, use the coordinate system of the top-level container (typically the WCD or room).
+        compact : bool
+            if True, the files are written without indentation or spaces
 
-        if len(filepath.suffix) < 2:
-            filepath = filepath.with_suffix('.json')
+        Returns
+        -------
+        None.
 
-        with open(filepath, 'w') as f:
-            json.dump(info, f, indent=2)
+        """
+
+        filepaths = []
+        for filename, prop_info, place_info in outputs:
+            try:
+                filepath = Path(filename).resolve()
+            except:
+                raise TypeError('Input arg could not be converted to a valid path: {}' +
+                                '\n It must be a str or Path-like.'.format(filename))
+            if len(filepath.suffix) < 2:
+                filepath = filepath.with_suffix('.json')
+            filepaths.append(filepath)
+
+        device_lists = [device_list for device_list, selected in [('mpmts', 'mpmt' in devices),
+                                                                  ('pmts', 'pmts' in devices),
+                                                                  ('leds', 'leds' in devices)]
+                        if selected or 'all' in devices]
+
+        # the placements of all devices to save, calculated in batches
+        placements = {}
+        if getattr(self, 'mpmts', None) is not None:
+            for place_info in set(output[2] for output in outputs if output[2] is not None):
+                for device_list in device_lists:
+                    batch = self.get_placements(device_list, place_info, device_for_coordinate_system)
+                    for device, location, direction_x, direction_z in zip(batch['devices'], batch['location'].tolist(),
+                                                                          batch['direction_x'].tolist(),
+                                                                          batch['direction_z'].tolist()):
+                        placement = None
+                        if not np.isnan(location).any():
+                            placement = {'location': location, 'direction_x': direction_x, 'direction_z': direction_z}
+                        placements[(id(device), place_info)] = placement
+
+        def get_device_data(device, prefix, prop_info, place_info):
+            device_data = {'name': prefix + device.name}
+            if prop_info is not None:
+                device_data['properties'] = device.get_properties(prop_info)
+            if place_info is not None:
+                key = (id(device), place_info)
+                device_data['placement'] = placements[key] if key in placements else \
+                    device.get_placement(place_info, device_for_coordinate_system)
+            return device_data
+
+        indent = None if compact else 2
+        files = [open(filepath, 'w') for filepath in filepaths]
+        try:
+            for f, (filename, prop_info, place_info) in zip(files, outputs):
+                description = {'Date created': datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                               'Device name': self.name,
+                               'prop_info': prop_info if prop_info is not None else 'None',
+                               'place_info': place_info if place_info is not None else 'None',
+                               'devices': devices,
+                               'device_for_coordinate_system': device_for_coordinate_system.name if device_for_coordinate_system is not None else 'None'
+                               }
+                f.write('{')
+                _write_json_member(f, 'description', description, indent, 1, True)
+
+            # examine all mPMTs:
+            if getattr(self, 'mpmts', None) is not None:
+                for f in files:
+                    _write_json_member(f, 'mpmts', None, indent, 1, False)
+                first = True
+                for mpmt in self.mpmts:
+                    # missing devices may be marked as None
+                    if mpmt is None:
+                        continue
+                    for f, (filename, prop_info, place_info) in zip(files, outputs):
+                        mpmt_data = {'name': 'MPMT ' + mpmt.name}
+                        if 'mpmts' in device_lists:
+                            mpmt_data.update(get_device_data(mpmt, 'MPMT ', prop_info, place_info))
+                        for device_list, prefix in [('pmts', 'PMT '), ('leds', 'LED ')]:
+                            if getattr(mpmt, device_list, None) is not None and device_list in device_lists:
+                                mpmt_data[device_list] = {device.name: get_device_data(device, prefix, prop_info,
+                                                                                       place_info)
+                                                          for device in getattr(mpmt, device_list) if device is not None}
+                        _write_json_member(f, mpmt.name, mpmt_data, indent, 2, first)
+                    first = False
+                for f in files:
+                    f.write('}' if first or indent is None else '\n' + ' ' * indent + '}')
+
+            for f in files:
+                f.write('}' if indent is None else '\n}')
+        finally:
+            for f in files:
+                f.close()
 
     def save_file(self, filename):
         """
         Save a copy of the current device to a file. The device can be restored
         at a late time using Device.open_file(filename).
 
-        If no extension is provided, the default extension, .geo is added.
+        If no extension is provided, the default extension, .geo is added. If the extension is .geob, the device
+        is saved in the binary geometry file format (see GeometryFile), otherwise it is pickled.
 
         Parameters
         ----------
@@ -410,18 +1068,26 @@ class Device:
         if len(filepath.suffix) < 2:
             filepath = filepath.with_suffix('.geo')
 
+        if filepath.suffix == '.geob':
+            from Geometry.GeometryFile import GeometryFile
+            GeometryFile.write(self, filepath)
+            return
+
         with open(filepath, 'wb') as f:
             pickle.dump(self, f, protocol=4)
 
     @classmethod
-    def open_file(cls, filepath):
+    def open_file(cls, filepath, as_table=False):
         """
         Restore a device that was saved to a file using Device.save_file(filename)
 
         Parameters
         ----------
         filepath : Path or str
-            name of existing device file to open
+            name of existing device file to open (pickled or binary geometry file format)
+        as_table : bool
+            if True and the file is in the binary format, return the GeometryTable with memory mapped arrays
+            instead of the device, so that only the arrays that are used are read from the file
 
         Returns
         -------
@@ -442,5 +1108,10 @@ class Device:
         if not filepath.exists():
             raise ValueError('Filepath does not exist: {}'.format(filepath))
 
+        from Geometry.GeometryFile import GeometryFile
+        if GeometryFile.is_geometry_file(filepath):
+            table = GeometryFile.read(filepath)
+            return table if as_table else table.to_device()
+
         with open(filepath, 'rb') as f:
             return pickle.load(f)
@@ -0,0 +1,180 @@
+"""
+DeviceIndex: find devices by path, flat id, or electronics channel, and back, without searching the device lists
+
+The index is built once for a device tree (e.g. a WCD or a HALL). Each device contained in it has:
+
+    path:     the names of the devices from the top-level device down, each preceded by the name of the list that
+              holds it, e.g. 'sms:barrel/mpmts:21/pmts:0'. A device without a name (or with the same name as
+              another in the list) is identified by its position in the list instead.
+    flat id:  its position in the flat list of all devices of its type, top.get_devices('pmts') etc.
+
+    >>> index = DeviceIndex(wcte)
+    >>> pmt = index.get('sms:barrel/mpmts:21/pmts:0')
+    >>> index.get_path(pmt), index.get_flat_id(pmt)
+    ('sms:barrel/mpmts:21/pmts:0', ('pmts', 399))
+    >>> index.get_device('pmts', 399) is pmt
+    True
+
+Channel maps give the device for each channel id of the electronics (channel ids are any integers). Large arrays of
+channel ids, e.g. of the hits in an event, are translated to flat device indices with array operations:
+
+    >>> index.add_channel_map('daq', channel_ids, pmt_flat_ids)
+    >>> flat_ids = index.translate('daq', hit_channel_ids)   # -1 for unknown channels
+"""
+
+import numpy as np
+
+
+class DeviceIndex:
+    """Lookup tables of the devices in a device tree"""
+
+    # a channel map is stored as a lookup table indexed by channel id if its range of channel ids is no larger
+    # than this many times the number of channels (otherwise the channel ids are searched in a sorted array)
+    max_table_ratio = 4
+
+    def __init__(self, device, devices=('wcds', 'sms', 'mpmts', 'cameras', 'targets', 'pmts', 'leds', 'calibs')):
+        """
+        * device: the top-level device of the tree to index (e.g. a WCD or HALL)
+        * devices: the names of the device lists for which flat ids are made. Devices in lazy mPMTs are created.
+        """
+        self.device = device
+        self.paths = {}
+        self.devices_by_path = {}
+        self.add_paths(device, '')
+
+        self.flat_devices = {}
+        self.flat_ids = {}
+        for devices_name in devices:
+            flat_devices = device.get_devices(devices_name)
+            if flat_devices:
+                self.flat_devices[devices_name] = flat_devices
+                for flat_id, flat_device in enumerate(flat_devices):
+                    self.flat_ids[flat_device] = (devices_name, flat_id)
+
+        # the channel maps: name -> dictionary of arrays and lookup tables
+        self.channel_maps = {}
+
+    def add_paths(self, device, path):
+        """Add the paths of the devices contained in a device (at any level)"""
+        for device_list_name in device.device_lists:
+            sub_devices = getattr(device, device_list_name, None) or []
+            names = [sub_device.name for sub_device in sub_devices if sub_device is not None]
+            for position, sub_device in enumerate(sub_devices):
+                if sub_device is None or sub_device.container is not device:
+                    continue
+                key = sub_device.name if sub_device.name and names.count(sub_device.name) == 1 else str(position)
+                sub_path = path + device_list_name + ':' + key
+                self.paths[sub_device] = sub_path
+                self.devices_by_path[sub_path] = sub_device
+                self.add_paths(sub_device, sub_path + '/')
+
+    def __len__(self):
+        return len(self.paths)
+
+    def get(self, path):
+        """Return the device with the path (None if there is none)"""
+        if path == '':
+            return self.device
+        return self.devices_by_path.get(path.strip('/'))
+
+    def get_path(self, device):
+        """Return the path of a device"""
+        if device is self.device:
+            return ''
+        return self.paths[device]
+
+    def get_flat_id(self, device):
+        """Return the name of the flat list of devices and the position of the device in it, e.g. ('pmts', 399)"""
+        return self.flat_ids[device]
+
+    def get_device(self, devices, flat_id):
+        """Return the device with a flat id, e.g. get_device('pmts', 399)"""
+        return self.flat_devices[devices][flat_id]
+
+    def get_flat_ids(self, devices, container_flat_ids, positions, container_devices='mpmts'):
+        """Return the flat ids of devices (e.g. PMTs) from the flat ids of their containers (e.g. mPMTs) and their
+        positions in the lists of the containers (arrays of the same shape)"""
+        key = ('positions', devices, container_devices)
+        if key not in self.channel_maps:
+            # the flat id of the first device in each container and the number of devices in it
+            containers = self.flat_devices[container_devices]
+            first = np.full(len(containers), -1)
+            counts = np.zeros(len(containers), dtype=int)
+            for flat_id, flat_device in enumerate(self.flat_devices[devices]):
+                container_flat_id = self.flat_ids[flat_device.container][1]
+                if first[container_flat_id] < 0:
+                    first[container_flat_id] = flat_id
+                counts[container_flat_id] += 1
+            self.channel_maps[key] = (first, counts)
+        first, counts = self.channel_maps[key]
+        container_flat_ids = np.asarray(container_flat_ids)
+        positions = np.asarray(positions)
+        valid = (positions >= 0) & (positions < counts[container_flat_ids])
+        return np.where(valid, first[container_flat_ids] + positions, -1)
+
+    def add_channel_map(self, name, channel_ids, flat_ids, devices='pmts'):
+        """Add a map from channel ids to devices.
+        * channel_ids: integer channel ids (N,)
+        * flat_ids: flat ids of the devices for the channels (N,), or devices, or paths of devices
+        * devices: the name of the flat list of devices that the flat ids refer to
+        """
+        channel_ids = np.asarray(channel_ids, dtype=np.int64)
+        flat_ids = list(flat_ids)
+        if flat_ids and not isinstance(flat_ids[0], (int, np.integer)):
+            flat_ids = [self.get_flat_id(self.get(target) if isinstance(target, str) else target)[1]
+                        for target in flat_ids]
+        flat_ids = np.asarray(flat_ids, dtype=np.int64)
+        if len(np.unique(channel_ids)) != len(channel_ids):
+            raise ValueError('DeviceIndex: channel map ' + name + ' has repeated channel ids.')
+
+        channel_map = {'devices': devices, 'channel_ids': channel_ids, 'flat_ids': flat_ids,
+                       'channels': dict(zip(channel_ids.tolist(), flat_ids.tolist()))}
+        # the channel of each device (-1: none)
+        device_channels = np.full(len(self.flat_devices[devices]), -1, dtype=np.int64)
+        device_channels[flat_ids] = channel_ids
+        channel_map['device_channels'] = device_channels
+
+        if len(channel_ids) > 0:
+            first_channel = int(channel_ids.min())
+            table_size = int(channel_ids.max()) - first_channel + 1
+            if table_size <= self.max_table_ratio * len(channel_ids) + 1024:
+                table = np.full(table_size, -1, dtype=np.int64)
+                table[channel_ids - first_channel] = flat_ids
+                channel_map['table'] = (first_channel, table)
+            else:
+                order = np.argsort(channel_ids)
+                channel_map['sorted'] = (channel_ids[order], flat_ids[order])
+        self.channel_maps[name] = channel_map
+
+    def get_channel_device(self, name, channel_id):
+        """Return the device for a channel id (None if the channel is not in the map)"""
+        channel_map = self.channel_maps[name]
+        flat_id = channel_map['channels'].get(channel_id)
+        return None if flat_id is None else self.flat_devices[channel_map['devices']][flat_id]
+
+    def get_channel(self, name, device):
+        """Return the channel id of a device (None if the device has no channel)"""
+        channel_map = self.channel_maps[name]
+        devices, flat_id = self.get_flat_id(device)
+        channel_id = channel_map['device_channels'][flat_id] if devices == channel_map['devices'] else -1
+        return None if channel_id < 0 else int(channel_id)
+
+    def translate(self, name, channel_ids):
+        """Return the flat device ids for an array of channel ids (of any shape): -1 for unknown channels"""
+        channel_map = self.channel_maps[name]
+        channel_ids = np.asarray(channel_ids, dtype=np.int64)
+        if 'table' in channel_map:
+            first_channel, table = channel_map['table']
+            offsets = channel_ids - first_channel
+            inside = (offsets >= 0) & (offsets < len(table))
+            return np.where(inside, table[np.where(inside, offsets, 0)], -1)
+        if 'sorted' not in channel_map:
+            return np.full(channel_ids.shape, -1, dtype=np.int64)
+        sorted_channels, sorted_flat_ids = channel_map['sorted']
+        positions = np.minimum(np.searchsorted(sorted_channels, channel_ids), len(sorted_channels) - 1)
+        return np.where(sorted_channels[positions] == channel_ids, sorted_flat_ids[positions], -1)
+
+    def translate_back(self, name, flat_ids):
+        """Return the channel ids for an array of flat device ids: -1 for devices without a channel"""
+        device_channels = self.channel_maps[name]['device_channels']
+        return device_channels[np.asarray(flat_ids)]
@@ -0,0 +1,210 @@
+"""
+Ensemble: many random realizations of a detector, drawn together as stacked arrays
+
+Systematic studies need many "true" detectors. Rather than constructing a device tree for each one, the ensemble
+draws the true placements and properties of all devices of many realizations at once, using the same distributions
+as the device constructors: the placement uncertainties ('loc_sig', 'rot_angles_sig') in the design lists and the
+property distributions (design_mean, design_scale, design_var) of the device classes.
+
+    >>> ensemble = Ensemble(WCD('wcte', kind='WCTE'), seed=1)
+    >>> pmts = ensemble.draw(200, 'PMT')
+    >>> pmts['location'].shape, pmts['properties'].shape
+    ((200, 2014, 3), (200, 2014, 6))
+
+Realizations are drawn in chunks, so that the memory used for the intermediate transformations is bounded, and
+each realization has its own random generator (from the seed and the realization number), so that it does not
+depend on the chunk size. A single realization can be turned back into a device tree with ensemble.materialize(k).
+"""
+
+import numpy as np
+
+from Geometry.GeometryTable import GeometryTable, _is_number
+from Geometry.Sampler import Sampler
+
+
+class Ensemble:
+    """Random realizations of a device tree, drawn as stacked arrays"""
+
+    def __init__(self, device, seed=None, chunk_size=16):
+        """
+        * device: the top-level device of a design device tree (e.g. WCD('wcte', kind='WCTE')), used as a template.
+          Its design placements and the design dictionaries of the device classes define the distributions.
+        * seed: seed for the random generators (None: a random seed is chosen, see ensemble.entropy)
+        * chunk_size: number of realizations drawn together
+        """
+        self.table = GeometryTable.from_device(device)
+        self.entropy = np.random.SeedSequence(seed).entropy
+        self.chunk_size = chunk_size
+
+        n_device = len(self.table)
+        self.loc = np.nan_to_num(self.table['place_design_loc'], nan=0.)
+        self.rot_angles = self.table['place_design_rot_angles']
+        self.rot_axes = self.table['place_design_rot_axes']
+
+        # the placement uncertainties, from the design list entries that the devices were placed from
+        self.loc_sig = np.zeros((n_device, 3))
+        self.rot_angles_sig = np.zeros((n_device, 3))
+        for row, design in enumerate(self.get_design_entries(device)):
+            if design is None:
+                continue
+            self.loc_sig[row] = design.get('loc_sig', 0.)
+            n_angle = len(design.get('rot_axes', ''))
+            sig = np.ravel(design.get('rot_angles_sig', 0.)).astype(float)
+            self.rot_angles_sig[row, :n_angle] = sig if sig.size == 1 else sig[:n_angle]
+
+        # the property distributions of each kind of device: (device class, kind, rows, keys)
+        self.property_groups = []
+        classes = self.table.classes
+        class_codes = self.table['class_code']
+        kind_codes = self.table['kind_code']
+        device_classes = {type(the_device).__module__ + '.' + type(the_device).__qualname__: type(the_device)
+                          for the_device in self.get_devices(device)}
+        for class_code, class_path in enumerate(classes):
+            device_class = device_classes[class_path]
+            for kind_code, kind in enumerate(self.table.kinds):
+                if kind not in getattr(device_class, 'design_mean', {}):
+                    continue
+                rows = np.flatnonzero((class_codes == class_code) & (kind_codes == kind_code))
+                keys = [key for key, value in device_class.design_mean[kind].items() if _is_number(value)]
+                if len(rows) > 0:
+                    self.property_groups.append((device_class, kind, rows, keys))
+
+    @staticmethod
+    def get_devices(device):
+        """Return the device and all of the devices it contains, in the order of the GeometryTable rows"""
+        devices = [device]
+        for device_list_name in device.device_lists:
+            for sub_device in getattr(device, device_list_name, None) or []:
+                if sub_device is not None and sub_device.container is device:
+                    devices.extend(Ensemble.get_devices(sub_device))
+        return devices
+
+    @staticmethod
+    def get_design_entries(device):
+        """Return the design list entry (with 'loc_sig' etc.) that each device was placed from, in the order of
+        the GeometryTable rows (None if it is not known, e.g. for the top-level device)"""
+        entries = [None]
+        for device_list_name in device.device_lists:
+            sub_devices = getattr(device, device_list_name, None) or []
+            design_list = []
+            table_name = device.design_tables.get(device_list_name)
+            if table_name is not None:
+                design_list = getattr(device, table_name).get(device.kind) or []
+            for index, sub_device in enumerate(sub_devices):
+                if sub_device is not None and sub_device.container is device:
+                    sub_entries = Ensemble.get_design_entries(sub_device)
+                    if index < len(design_list):
+                        sub_entries[0] = design_list[index]
+                    entries.extend(sub_entries)
+        return entries
+
+    def get_rng(self, realization):
+        """Return the random generator for a realization"""
+        return np.random.default_rng(np.random.SeedSequence(self.entropy, spawn_key=(realization,)))
+
+    def draw_realization(self, realization):
+        """Return the true locations (N,3), rotation angles (N,3) and properties (N,n_property) of all devices
+        in one realization (the property columns are those of ensemble.table.property_keys)"""
+        rng = self.get_rng(realization)
+        loc = rng.normal(self.loc, self.loc_sig)
+        rot_angles = np.where(np.isnan(self.rot_angles), np.nan,
+                              rng.normal(np.nan_to_num(self.rot_angles), self.rot_angles_sig))
+
+        sampler = Sampler(rng)
+        properties = np.full((len(self.table), len(self.table.property_keys)), np.nan)
+        for device_class, kind, rows, keys in self.property_groups:
+            design_mean = {key: device_class.design_mean[kind][key] for key in keys}
+            values = sampler.draw_values(design_mean, device_class.design_scale[kind], device_class.design_var[kind],
+                                         len(rows))
+            columns = [self.table.property_keys.index(key) for key in keys]
+            properties[np.ix_(rows, columns)] = values
+        return loc, rot_angles, properties
+
+    def get_transforms(self, loc, rot_angles):
+        """Return the rotation matrices (K,N,3,3) and locations (K,N,3) of all devices in the coordinate system of
+        the top-level device, for the true locations and angles (K,N,3) of K realizations"""
+        # scipy.spatial is imported when first needed, as it takes much longer to import than this package
+        from scipy.spatial.transform import Rotation
+
+        n_realization, n_device = loc.shape[:2]
+        local_rotations = np.tile(np.identity(3), (n_realization, n_device, 1, 1))
+        for axes_code, axes in enumerate(self.table.rot_axes):
+            rows = np.flatnonzero(self.rot_axes == axes_code)
+            if len(rows) > 0:
+                angles = rot_angles[:, rows, :len(axes)].reshape(-1, len(axes))
+                local_rotations[:, rows] = Rotation.from_euler(axes, angles).as_matrix().reshape(
+                    n_realization, len(rows), 3, 3)
+
+        # compose the transformations one level at a time (the top-level device defines the coordinate system)
+        rotations = local_rotations.copy()
+        locations = loc.copy()
+        rotations[:, 0] = np.identity(3)
+        locations[:, 0] = 0.
+        depths = self.table.get_depths()
+        parent = self.table['parent']
+        for depth in range(1, depths.max() + 1):
+            level = np.flatnonzero(depths == depth)
+            container_rotations = rotations[:, parent[level]]
+            rotations[:, level] = container_rotations @ local_rotations[:, level]
+            locations[:, level] = (np.einsum('knij,knj->kni', container_rotations, loc[:, level]) +
+                                   locations[:, parent[level]])
+        return rotations, locations
+
+    def generate(self, n_realization, device_class='PMT', kind=None, first=0):
+        """Generate the realizations first, ..., first + n_realization - 1, one chunk at a time. For the devices
+        of the specified class (and kind), each chunk is a dictionary of stacked arrays: 'location', 'direction_x',
+        and 'direction_z' (k,N,3) in the coordinate system of the top-level device, and 'properties' (k,N,P) for
+        the properties listed in 'property_keys'. 'realizations' gives the realization numbers of the chunk."""
+        rows = self.table.select(device_class, kind)
+        columns = np.flatnonzero(~np.isnan(self.table['prop_design'][rows]).all(axis=0))
+        property_keys = [self.table.property_keys[column] for column in columns]
+        for start in range(first, first + n_realization, self.chunk_size):
+            realizations = list(range(start, min(start + self.chunk_size, first + n_realization)))
+            draws = [self.draw_realization(realization) for realization in realizations]
+            loc = np.stack([draw[0] for draw in draws])
+            rot_angles = np.stack([draw[1] for draw in draws])
+            rotations, locations = self.get_transforms(loc, rot_angles)
+            rotations = rotations[:, rows]
+            yield {'realizations': realizations,
+                   'location': locations[:, rows],
+                   'direction_x': rotations[..., 0],
+                   'direction_z': rotations[..., 2],
+                   'properties': np.stack([draw[2][np.ix_(rows, columns)] for draw in draws]),
+                   'property_keys': property_keys}
+
+    def draw(self, n_realization, device_class='PMT', kind=None, first=0):
+        """Return the stacked arrays of all of the realizations (see generate)"""
+        chunks = list(self.generate(n_realization, device_class, kind, first))
+        result = {key: np.concatenate([chunk[key] for chunk in chunks])
+                  for key in ['location', 'direction_x', 'direction_z', 'properties']}
+        result['realizations'] = [realization for chunk in chunks for realization in chunk['realizations']]
+        result['property_keys'] = chunks[0]['property_keys'] if chunks else []
+        return result
+
+    def materialize(self, realization):
+        """Return a device tree (a copy of the template) with the true placements and properties of a realization"""
+        loc, rot_angles, properties = self.draw_realization(realization)
+        device = self.table.to_device()
+        devices = self.get_devices(device)
+        angle_is_scalar = self.table['place_design_angle_is_scalar']
+        property_keys = self.table.property_keys
+        for row, the_device in enumerate(devices):
+            design = the_device.place_design
+            if row > 0 and design:
+                place_true = {'loc': loc[row].tolist()}
+                if 'rot_axes' in design:
+                    n_angle = len(design['rot_axes'])
+                    place_true['rot_axes'] = design['rot_axes']
+                    place_true['rot_angles'] = (rot_angles[row, 0].item() if angle_is_scalar[row] else
+                                                rot_angles[row, :n_angle].tolist())
+                the_device.place_true = place_true
+        for device_class, kind, rows, keys in self.property_groups:
+            # properties without variation keep their design value (and type), as in Sampler.draw_properties
+            fixed = {key: value for key, value in device_class.design_mean[kind].items()
+                     if not device_class.design_scale[kind].get(key, 0.) > 0.}
+            columns = [property_keys.index(key) for key in keys]
+            for row, values in zip(rows.tolist(), properties[np.ix_(rows, columns)].tolist()):
+                prop_true = dict(zip(keys, values))
+                prop_true.update(fixed)
+                devices[row].prop_true = prop_true
+        return device
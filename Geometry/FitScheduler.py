@@ -0,0 +1,114 @@
+"""
+FitScheduler: fit the placements of devices in many supermodules together
+
+The fits of different supermodules (and of different devices within a supermodule) are independent. The scheduler
+prepares each fit as a small set of arrays (the fiducial points of the devices, the survey data, and the
+transformations of the containers), solves them, and writes the fitted placements back to the devices:
+
+    >>> scheduler = FitScheduler()
+    >>> scheduler.add_sm(bottom, bottom_mpmt_points, bottom_camera_points, z_offset=-178.08)
+    >>> scheduler.add_sm(top, top_mpmt_points, top_camera_points, z_offset=-178.08)
+    >>> scheduler.add_devices(barrel.mpmts, barrel_mpmt_points, device_for_coordinate_system=wcte, z_offset=-49.06)
+    >>> bottom_fit, top_fit, barrel_fit = scheduler.run()
+
+By default the fits are solved in this process. The problems are prepared in this process in any case, as that needs
+the device tree, and solving them is a few numpy operations on all devices at once: the fits of all supermodules of
+WCTE take a few ms, less than starting a pool of processes. With max_workers > 1 (or None) the problems are solved in
+a pool of worker processes, which receive only the arrays. This is only worthwhile for problems with very many
+devices (see the synthetic_hall_*_fit_workers_* benchmarks).
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+from Geometry.Fitter import Fitter
+
+
+class FitScheduler:
+    """Schedule independent fits of device placements to survey data, optionally over a pool of processes"""
+
+    def __init__(self, max_workers=1, chunk_size=None):
+        """
+        * max_workers: number of worker processes to solve the fits (None: the number of processors). If 1, the
+          fits are solved in this process.
+        * chunk_size: maximum number of devices in a problem sent to a worker (None: one problem for each
+          supermodule or set of devices added)
+        """
+        self.max_workers = max_workers
+        self.chunk_size = chunk_size
+        # the fits to do: (devices, surveyed_points, device_for_coordinate_system, z_offsets, n_mpmt)
+        self.fits = []
+
+    def add_devices(self, devices, surveyed_points, device_for_coordinate_system=None, z_offset=0.):
+        """Add a fit of the placements of devices to their surveyed fiducials (see Fitter.fit_devices)"""
+        devices = list(devices)
+        if len(surveyed_points) != len(devices):
+            raise ValueError('FitScheduler: ' + str(len(devices)) + ' devices to fit, survey has ' +
+                             str(len(surveyed_points)))
+        z_offsets = np.broadcast_to(np.asarray(z_offset, dtype=float), (len(devices),))
+        self.fits.append((devices, list(surveyed_points), device_for_coordinate_system, z_offsets, None))
+
+    def add_sm(self, sm, mpmt_points, camera_points=None, device_for_coordinate_system=None, z_offset=0.):
+        """Add a fit of the mPMTs and cameras of a supermodule (see Fitter.fit_sm)"""
+        if device_for_coordinate_system is None:
+            device_for_coordinate_system = sm
+        devices, surveyed_points, z_offsets = Fitter.get_sm_survey(sm, mpmt_points, camera_points, z_offset)
+        self.fits.append((devices, surveyed_points, device_for_coordinate_system, z_offsets, len(sm.mpmts)))
+
+    def get_problems(self, place_info='est'):
+        """Return the problems to solve: a list of (index of fit, first device, problem)"""
+        problems = []
+        for i_fit, (devices, surveyed_points, device_for_coordinate_system, z_offsets, n_mpmt) in enumerate(self.fits):
+            chunk_size = self.chunk_size or max(len(devices), 1)
+            for start in range(0, len(devices), chunk_size):
+                stop = start + chunk_size
+                problem = Fitter.get_problem(devices[start:stop], surveyed_points[start:stop], place_info,
+                                             device_for_coordinate_system, z_offsets[start:stop])
+                problems.append((i_fit, start, problem))
+        return problems
+
+    def run(self, place_info='est', update=True, executor=None):
+        """Solve all of the fits and return their results, in the order they were added. The result of a
+        supermodule fit is as returned by Fitter.fit_sm, and that of a set of devices as by Fitter.fit_devices.
+        * update: if True, the fitted placements are written to the devices (e.g. place_est)
+        * executor: a concurrent.futures executor to use instead of a new process pool
+        """
+        problems = self.get_problems(place_info)
+        if executor is not None:
+            solutions = list(executor.map(Fitter.solve_problem, [problem for i_fit, start, problem in problems]))
+        elif self.max_workers == 1 or len(problems) <= 1:
+            solutions = [Fitter.solve_problem(problem) for i_fit, start, problem in problems]
+        else:
+            with ProcessPoolExecutor(max_workers=self.max_workers) as pool:
+                solutions = list(pool.map(Fitter.solve_problem, [problem for i_fit, start, problem in problems]))
+
+        # merge the solutions of the chunks of each fit
+        results = []
+        for i_fit, (devices, surveyed_points, device_for_coordinate_system, z_offsets, n_mpmt) in enumerate(self.fits):
+            parts = [solution for (j_fit, start, problem), solution in zip(problems, solutions) if j_fit == i_fit]
+            fit = _concatenate(parts) if parts else Fitter.solve_problem(
+                Fitter.get_problem([], [], place_info, device_for_coordinate_system))
+            fit['devices'] = devices
+            if update:
+                Fitter.set_placements(fit, place_info)
+            if n_mpmt is not None:
+                fit = {'mpmts': {key: value[:n_mpmt] for key, value in fit.items()},
+                       'cameras': {key: value[n_mpmt:] for key, value in fit.items()}}
+            results.append(fit)
+        return results
+
+
+def _concatenate(parts):
+    """Join the fit results of consecutive sets of devices (the residuals may have different numbers of points)"""
+    fit = {}
+    for key in parts[0]:
+        values = [part[key] for part in parts]
+        if isinstance(values[0], list):
+            fit[key] = [value for part_values in values for value in part_values]
+        elif key == 'residuals':
+            n_point = max(value.shape[1] for value in values)
+            fit[key] = np.concatenate([np.pad(value, ((0, 0), (0, n_point - value.shape[1]), (0, 0)),
+                                              constant_values=np.nan) for value in values])
+        else:
+            fit[key] = np.concatenate(values)
+    return fit
@@ -0,0 +1,234 @@
+"""
+Fitter: closed-form fits of device placements to surveyed fiducial points
+
+The placement (rotation and location) of a device that best matches its surveyed fiducials, in the least squares
+sense, is found directly from the singular value decomposition of the cross-covariance of the design fiducial
+points (in the device coordinate system) and the surveyed points (the Kabsch solution). No iterations or starting
+values are needed, and all devices are fit together with numpy array operations:
+
+    >>> fit = Fitter.fit_sm(bottom, mpmt_points, camera_points, z_offset=-178.08)
+    >>> fit['mpmts']['rms']
+
+Surveyed points are given as arrays of shape (n_device, n_fiducial, 3), in mm, in the coordinate system of
+device_for_coordinate_system. Fiducials that were not surveyed are set to NaN. Devices with fewer than
+three surveyed fiducials are not fit, and their placements are not changed.
+"""
+
+import numpy as np
+from Geometry.Placement import Placement
+
+
+class Fitter:
+    """Fit the placements of mPMTs and cameras to surveyed fiducial points"""
+
+    # a rotation is only defined by three or more (non-collinear) points
+    min_fiducials = 3
+    # Euler convention used for fitted placements, when the device placement does not give a 3 axis convention
+    default_rot_axes = 'ZYX'
+
+    @staticmethod
+    def get_body_points(device, z_offset=0.):
+        """Return the fiducial points of a device in its own coordinate system (z_offset is added to z)"""
+        points = np.array(device.fiducials, dtype=float)
+        points[:, 2] += z_offset
+        return points
+
+    @staticmethod
+    def solve(body_points, surveyed_points):
+        """Return the rotation matrices (N,3,3) and translations (N,3) that best transform the body points
+        (N,M,3) to the surveyed points (N,M,3). Points that are NaN in either array are ignored.
+        Also return the rms of the residuals and the number of points used for each fit."""
+        body_points = np.asarray(body_points, dtype=float)
+        surveyed_points = np.asarray(surveyed_points, dtype=float)
+        used = ~(np.isnan(body_points).any(axis=-1) | np.isnan(surveyed_points).any(axis=-1))
+        n_used = used.sum(axis=1)
+        weights = used / np.maximum(n_used, 1)[:, None]
+        body = np.where(used[..., None], body_points, 0.)
+        surveyed = np.where(used[..., None], surveyed_points, 0.)
+
+        body_centre = np.einsum('nm,nmi->ni', weights, body)
+        surveyed_centre = np.einsum('nm,nmi->ni', weights, surveyed)
+        body = np.where(used[..., None], body - body_centre[:, None, :], 0.)
+        surveyed = np.where(used[..., None], surveyed - surveyed_centre[:, None, :], 0.)
+
+        # cross-covariance and its singular value decomposition, with the sign chosen to exclude reflections
+        covariance = np.einsum('nmi,nmj->nij', body, surveyed)
+        u, s, vt = np.linalg.svd(covariance)
+        d = np.sign(np.linalg.det(u @ vt))
+        d[d == 0.] = 1.
+        vt[:, 2, :] *= d[:, None]
+        rotation = np.swapaxes(u @ vt, 1, 2)
+        translation = surveyed_centre - np.einsum('nij,nj->ni', rotation, body_centre)
+
+        residuals = np.einsum('nij,nmj->nmi', rotation, body) - surveyed
+        sum2 = np.where(used, (residuals ** 2).sum(axis=-1), 0.).sum(axis=1)
+        rms = np.sqrt(sum2 / np.maximum(n_used, 1))
+        rms[n_used == 0] = np.nan
+        return rotation, translation, rms, n_used
+
+    @classmethod
+    def fit_devices(cls, devices, surveyed_points, place_info='est', device_for_coordinate_system=None, z_offset=0.,
+                    update=True):
+        """Fit the placements of devices (in their containers) to their surveyed fiducials.
+
+        * surveyed_points: sequence with an array (n_fiducial, 3) for each device (None if not surveyed),
+          in the coordinate system of device_for_coordinate_system (None: the top-level container).
+          The devices can have different numbers of fiducials.
+        * place_info: the placement that is fit. The placements of the containers for this place_info are
+          used to transform the survey to the coordinate system of each container.
+        * z_offset: added to the z of the fiducial points (see MPMT.get_fiducials): a value or one value per device
+        * update: if True, the fitted placements are written to the devices (e.g. place_est)
+
+        Returns a dictionary of arrays, with one entry per device: 'devices', 'fitted' (bool), 'n_fiducial' (the
+        number of points used), 'rms' (of the residuals), 'residuals' (surveyed - fitted fiducial points, NaN where
+        not surveyed), and the fitted placements in the device containers: 'rotation', 'loc', 'rot_axes' and
+        'rot_angles' (NaN or None for devices not fit).
+        """
+        problem = cls.get_problem(devices, surveyed_points, place_info, device_for_coordinate_system, z_offset)
+        fit = cls.solve_problem(problem)
+        fit['devices'] = list(devices)
+        if update:
+            cls.set_placements(fit, place_info)
+        return fit
+
+    @classmethod
+    def get_problem(cls, devices, surveyed_points, place_info='est', device_for_coordinate_system=None, z_offset=0.):
+        """Return the arrays needed to fit the placements of the devices (see fit_devices for the arguments).
+        The problem does not refer to the devices, so that it can be solved in another process."""
+        devices = list(devices)
+        n_device = len(devices)
+        if len(surveyed_points) != n_device:
+            raise ValueError('Fitter: ' + str(n_device) + ' devices to fit, survey has ' + str(len(surveyed_points)))
+        z_offsets = np.broadcast_to(np.asarray(z_offset, dtype=float), (n_device,))
+        body_list = [None if device is None else cls.get_body_points(device, z_offsets[i])
+                     for i, device in enumerate(devices)]
+        n_point = max([0] + [len(points) for points in body_list if points is not None])
+        body = np.full((n_device, n_point, 3), np.nan)
+        surveyed = np.full((n_device, n_point, 3), np.nan)
+        for i, (points, survey) in enumerate(zip(body_list, surveyed_points)):
+            if points is None or survey is None:
+                continue
+            survey = np.asarray(survey, dtype=float)
+            if survey.shape != points.shape:
+                raise ValueError('Fitter: device ' + devices[i].name + ' has ' + str(len(points)) +
+                                 ' fiducials, survey has shape ' + str(survey.shape))
+            body[i, :len(points)] = points
+            surveyed[i, :len(points)] = survey
+
+        # transformations from the containers to the survey coordinate system (the transforms are cached)
+        container_rotation = np.tile(np.identity(3), (n_device, 1, 1))
+        container_translation = np.zeros((n_device, 3))
+        for i, device in enumerate(devices):
+            if device is not None and device.container is not device_for_coordinate_system:
+                container_rotation[i], container_translation[i] = \
+                    device.container.get_transform(place_info, device_for_coordinate_system)
+
+        # the Euler convention and the range of the angles follow the existing (or design) placement
+        rot_axes = [None if device is None else cls.default_rot_axes for device in devices]
+        reference_angles = np.zeros((n_device, 3))
+        for i, device in enumerate(devices):
+            for info in [place_info, 'design']:
+                device_place = device.get_stored('place_' + info)
+                if device_place and len(device_place.get('rot_axes', '')) == 3:
+                    rot_axes[i] = device_place['rot_axes']
+                    reference_angles[i] = device_place['rot_angles']
+                    break
+
+        return {'body': body, 'surveyed': surveyed, 'container_rotation': container_rotation,
+                'container_translation': container_translation, 'rot_axes': rot_axes,
+                'reference_angles': reference_angles}
+
+    @classmethod
+    def solve_problem(cls, problem):
+        """Return the fit results (see fit_devices, without the devices) for a problem made by get_problem"""
+        body = problem['body']
+        surveyed = problem['surveyed']
+        container_rotation = problem['container_rotation']
+        container_translation = problem['container_translation']
+
+        # transform the survey to the coordinate system of each container
+        local_surveyed = np.einsum('nji,nmj->nmi', container_rotation, surveyed - container_translation[:, None, :])
+        rotation, loc, rms, n_used = cls.solve(body, local_surveyed)
+        fitted = n_used >= cls.min_fiducials
+        rotation[~fitted] = np.nan
+        loc[~fitted] = np.nan
+        rms[~fitted] = np.nan
+
+        fitted_points = np.einsum('nij,nmj->nmi', rotation, body) + loc[:, None, :]
+        fitted_points = np.einsum('nij,nmj->nmi', container_rotation, fitted_points) + \
+            container_translation[:, None, :]
+
+        rot_axes = [axes if fit_ok else None for axes, fit_ok in zip(problem['rot_axes'], fitted)]
+        rot_angles = cls.get_euler_angles(rotation, rot_axes, problem['reference_angles'])
+        return {'fitted': fitted, 'n_fiducial': n_used, 'rms': rms, 'residuals': surveyed - fitted_points,
+                'rotation': rotation, 'loc': loc, 'rot_axes': rot_axes, 'rot_angles': rot_angles}
+
+    @classmethod
+    def fit_sm(cls, sm, mpmt_points, camera_points=None, place_info='est', device_for_coordinate_system=None,
+               z_offset=0., update=True):
+        """Fit the placements of the mPMTs and cameras of a supermodule in one call.
+
+        * mpmt_points: array (n_mpmt, 4, 3) of surveyed mPMT fiducials, in the order of sm.mpmts, NaN if not surveyed
+        * camera_points: array (n_camera, n_fiducial, 3) of surveyed camera fiducials, in the order of sm.cameras
+        * device_for_coordinate_system: coordinate system of the survey (None: the supermodule)
+        * z_offset: offset of the mPMT fiducials from the mPMT baseplate (the camera fiducials are not offset)
+
+        Returns the dictionaries of fit results (see fit_devices) for the mPMTs and cameras.
+        """
+        if device_for_coordinate_system is None:
+            device_for_coordinate_system = sm
+        devices, surveyed_points, z_offsets = cls.get_sm_survey(sm, mpmt_points, camera_points, z_offset)
+        n_mpmt = len(sm.mpmts)
+
+        fit = cls.fit_devices(devices, surveyed_points, place_info, device_for_coordinate_system, z_offsets, update)
+        return {'mpmts': {key: value[:n_mpmt] for key, value in fit.items()},
+                'cameras': {key: value[n_mpmt:] for key, value in fit.items()}}
+
+    @staticmethod
+    def get_sm_survey(sm, mpmt_points, camera_points=None, z_offset=0.):
+        """Return the devices of a supermodule to fit, their surveyed points and their fiducial z offsets"""
+        devices = list(sm.mpmts)
+        surveyed_points = list(mpmt_points)
+        if camera_points is not None:
+            devices += list(sm.cameras)
+            surveyed_points += list(camera_points)
+        # the camera fiducials are not offset
+        z_offsets = np.zeros(len(devices))
+        z_offsets[:len(sm.mpmts)] = z_offset
+        return devices, surveyed_points, z_offsets
+
+    @staticmethod
+    def get_euler_angles(rotation, rot_axes, reference_angles):
+        """Return the angles of the rotation matrices in the Euler convention (rot_axes) of each device (NaN where
+        rot_axes is None). Of the equivalent sets of angles, those closest to the reference angles are chosen."""
+        # scipy.spatial is imported when first needed, as it takes much longer to import than this package
+        from scipy.spatial.transform import Rotation
+
+        rot_angles = np.full((len(rot_axes), 3), np.nan)
+        for axes in set(rot_axes) - {None}:
+            rows = [i for i in range(len(rot_axes)) if rot_axes[i] == axes]
+            angles = Rotation.from_matrix(rotation[rows]).as_euler(axes)
+            # the same rotation is given by a second set of angles: (a + pi, pi - b, c + pi) for three different
+            # axes, or (a + pi, -b, c + pi) when the first and last axes are the same
+            other = angles + np.pi
+            other[:, 1] = (np.pi if axes[0].lower() != axes[2].lower() else 0.) - angles[:, 1]
+            choices = []
+            for choice in [angles, other]:
+                choice = choice + 2. * np.pi * np.round((reference_angles[rows] - choice) / (2. * np.pi))
+                choices.append(choice)
+            closer = (np.abs(choices[1] - reference_angles[rows]).sum(axis=1) <
+                      np.abs(choices[0] - reference_angles[rows]).sum(axis=1))
+            rot_angles[rows] = np.where(closer[:, None], choices[1], choices[0])
+        return rot_angles
+
+    @staticmethod
+    def set_placements(fit, place_info='est'):
+        """Set the placements of the devices that were fit"""
+        for device, fitted, loc, rot_axes, rot_angles, rotation in zip(fit['devices'], fit['fitted'], fit['loc'],
+                                                                       fit['rot_axes'], fit['rot_angles'],
+                                                                       fit['rotation']):
+            if fitted:
+                place = Placement({'loc': loc.tolist(), 'rot_axes': rot_axes, 'rot_angles': rot_angles.tolist()})
+                # the fitted matrix is the rotation for the angles, so it need not be calculated again
+                place.compile(rotation)
+                setattr(device, 'place_' + place_info, place)
@@ -0,0 +1,176 @@
+"""
+GeometryFile: a binary file format for device trees, based on GeometryTable
+
+The file starts with an 8 byte magic string and the length of a json header (8 byte little-endian integer).
+The header holds the format version, the code lists of the GeometryTable, and for each array of the table
+its dtype, shape, and offset of its data within the file. The array data follow the header, each aligned to
+64 bytes, so that they can be read directly as numpy memory maps. Arrays with a single repeated value
+(e.g. placements that were never measured) are stored in the header only. Float arrays that are mostly NaN
+(e.g. the property arrays, with a column for every property key of all device classes) are stored sparsely, as a
+bit mask of the other entries and their values: they are read into memory when first used, instead of being
+memory mapped. A converted .geo file is then somewhat smaller than the pickle.
+
+Reading is lazy: an array is mapped from the file when it is first used, so that a process that only needs
+the estimated placements of the mPMTs only reads those arrays:
+
+    >>> table = GeometryFile.read('wcte.geob')
+    >>> mpmt_locations = table['place_est_loc'][table.select('MPMT')]
+    >>> wcte = table.to_device()
+
+Legacy .geo files (pickled devices) are converted using GeometryFile.convert('wcte.geo').
+"""
+
+import json
+import pickle
+from collections.abc import Mapping
+from pathlib import Path
+import numpy as np
+
+from Geometry.GeometryTable import GeometryTable
+
+
+class GeometryFile:
+    """Read and write device trees in the binary geometry file format"""
+
+    magic = b'WCTEGEOB'
+    version = 2
+    extension = '.geob'
+    alignment = 64
+    # a float array is stored sparsely if that takes less than this fraction of its size
+    sparse_fraction = 0.5
+
+    @classmethod
+    def is_geometry_file(cls, filepath):
+        """Return True if the file is in the binary geometry file format"""
+        with open(filepath, 'rb') as f:
+            return f.read(len(cls.magic)) == cls.magic
+
+    @classmethod
+    def write(cls, table, filepath):
+        """Write a GeometryTable (or a device and all of the devices it contains) to a file"""
+        if not isinstance(table, GeometryTable):
+            table = GeometryTable.from_device(table)
+
+        array_info = {}
+        data = []
+        offset = 0
+        for name, array in table.arrays.items():
+            array = np.ascontiguousarray(array)
+            info = {'dtype': array.dtype.str, 'shape': list(array.shape)}
+            values = array.reshape(-1)
+            if array.size > 1 and ((values == values[0]).all() or (array.dtype.kind == 'f' and np.isnan(values).all())):
+                # an array with a single repeated value is not saved
+                info['fill'] = values[0].item()
+            elif array.size > 0:
+                stored = [('offset', array)]
+                if array.dtype.kind == 'f':
+                    is_value = ~np.isnan(values)
+                    n_value = int(is_value.sum())
+                    if (array.size + 7) // 8 + n_value * array.itemsize < cls.sparse_fraction * array.nbytes:
+                        # the other entries are NaN
+                        info['fill'] = np.nan
+                        stored = [('mask_offset', np.packbits(is_value)), ('values_offset', values[is_value])]
+                for key, stored_array in stored:
+                    offset = -(-offset // cls.alignment) * cls.alignment
+                    info[key] = offset
+                    data.append((offset, stored_array))
+                    offset += stored_array.nbytes
+            array_info[name] = info
+
+        header = {'version': cls.version,
+                  'classes': table.classes,
+                  'kinds': table.kinds,
+                  'rot_axes': table.rot_axes,
+                  'property_keys': table.property_keys,
+                  'arrays': array_info}
+        if len(table.extras) > 0:
+            # values that do not fit in the arrays are pickled
+            header['extras'] = pickle.dumps(table.extras, protocol=4).hex()
+        header_bytes = json.dumps(header).encode()
+        data_start = cls.data_start(len(header_bytes))
+
+        with open(filepath, 'wb') as f:
+            f.write(cls.magic)
+            f.write(len(header_bytes).to_bytes(8, 'little'))
+            f.write(header_bytes)
+            for array_offset, array in data:
+                f.seek(data_start + array_offset)
+                f.write(array.tobytes())
+
+    @classmethod
+    def data_start(cls, header_length):
+        """Return the location of the array data in a file"""
+        return -(-(len(cls.magic) + 8 + header_length) // cls.alignment) * cls.alignment
+
+    @classmethod
+    def read(cls, filepath, mmap=True):
+        """Return the GeometryTable saved in a file. If mmap is True, the arrays are memory mapped when first used.
+        Otherwise they are all read immediately."""
+        with open(filepath, 'rb') as f:
+            if f.read(len(cls.magic)) != cls.magic:
+                raise ValueError('File is not a binary geometry file: {}'.format(filepath))
+            header_length = int.from_bytes(f.read(8), 'little')
+            header = json.loads(f.read(header_length).decode())
+        if header['version'] > cls.version:
+            raise ValueError('Binary geometry file version {} is not supported (version <= {}): {}'
+                             .format(header['version'], cls.version, filepath))
+
+        arrays = GeometryArrays(filepath, header['arrays'], cls.data_start(header_length))
+        if not mmap:
+            arrays = {name: np.array(arrays[name]) for name in arrays}
+        extras = pickle.loads(bytes.fromhex(header['extras'])) if 'extras' in header else []
+        return GeometryTable(arrays, header['classes'], header['kinds'], header['rot_axes'],
+                             header['property_keys'], extras)
+
+    @classmethod
+    def convert(cls, geo_filepath, filepath=None):
+        """Convert a legacy .geo file (a pickled device) to the binary format. By default, the new file has the
+        same name with the extension .geob. Returns the path of the new file."""
+        with open(geo_filepath, 'rb') as f:
+            device = pickle.load(f)
+        if filepath is None:
+            filepath = Path(geo_filepath).with_suffix(cls.extension)
+        cls.write(device, filepath)
+        return filepath
+
+
+class GeometryArrays(Mapping):
+    """The arrays of a binary geometry file, memory mapped when first accessed"""
+
+    def __init__(self, filepath, array_info, data_start):
+        self.filepath = filepath
+        self.array_info = array_info
+        self.data_start = data_start
+        self.arrays = {}
+
+    def __getitem__(self, name):
+        array = self.arrays.get(name)
+        if array is None:
+            info = self.array_info[name]
+            dtype = np.dtype(info['dtype'])
+            shape = tuple(info['shape'])
+            if 'mask_offset' in info:
+                size = int(np.prod(shape))
+                mask = np.fromfile(self.filepath, dtype=np.uint8, count=(size + 7) // 8,
+                                   offset=self.data_start + info['mask_offset'])
+                mask = np.unpackbits(mask, count=size).astype(bool)
+                array = np.full(size, info['fill'], dtype=dtype)
+                array[mask] = np.fromfile(self.filepath, dtype=dtype, count=int(mask.sum()),
+                                          offset=self.data_start + info['values_offset'])
+                array = array.reshape(shape)
+                array.flags.writeable = False
+            elif 'fill' in info:
+                array = np.broadcast_to(np.array(info['fill'], dtype=dtype), shape)
+            elif 'offset' not in info:
+                array = np.empty(shape, dtype=dtype)
+            else:
+                array = np.memmap(self.filepath, dtype=dtype, mode='r', offset=self.data_start + info['offset'],
+                                  shape=shape)
+            self.arrays[name] = array
+        return array
+
+    def __iter__(self):
+        return iter(self.array_info)
+
+    def __len__(self):
+        return len(self.array_info)
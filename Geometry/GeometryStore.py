@@ -0,0 +1,258 @@
+"""
+GeometryStore: a record of the revisions of a device geometry, kept as a base snapshot and the changes since
+
+Rather than saving a full .geo file for each revision (e.g. after each re-survey), the store saves the device once,
+and for each later revision only the placement and property dictionaries of the devices that changed:
+
+    >>> store = GeometryStore.create('wcte_store', wcte, tag='as_built')
+    >>> wcte.mpmts[43].place_est = fitted_placement
+    >>> store.commit(wcte, tag='survey_2024', message='re-survey of the barrel')
+    1
+    >>> wcte_as_built = store.checkout('as_built')
+    >>> store.get_changed('as_built', 'survey_2024')
+    ['sms:barrel/mpmts:43']
+
+The directory holds:
+    manifest.json:  the list of revisions, with their tags, timestamps, messages, and the paths (see DeviceIndex) of
+                    the devices changed with the names of the changed dictionaries. Listing the changes between
+                    revisions only reads the manifest.
+    base.geo:       the device at revision 0 (pickled, as by Device.save_file)
+    rev_NNNN.pkl:   for each later revision with changes, the changed dictionaries: {path: {attribute: dictionary}}
+
+A revision is checked out by opening the base and replacing the dictionaries changed in each revision up to it.
+The structure of the device tree (the devices it contains) must be the same in all revisions.
+
+To find the changes quickly, the store listens for placement changes (see Device.add_listener) of the device at the
+latest revision: the device given to create, the device last committed, or the device returned by checkout() of
+the latest revision. A commit of that device compares the placements only of the devices that reported changes.
+Property dictionaries do not report changes, so they are compared for every device (a plain dictionary comparison).
+Committing any other device compares all of its placement and property dictionaries with the latest revision,
+which takes a time proportional to the number of devices (about 0.2 s for WCTE). After a store is reopened, the
+latest revision is read once (by checkout, or by the first commit) to know its dictionaries.
+"""
+
+import datetime
+import json
+import pickle
+from pathlib import Path
+
+import numpy as np
+
+from Geometry.DeviceIndex import DeviceIndex
+from Geometry.Placement import Placement
+
+
+def _plain(value):
+    """Return a copy of a dictionary value with numpy arrays and scalars replaced by lists and floats"""
+    if isinstance(value, dict):
+        return {key: _plain(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return [_plain(item) for item in value]
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+class GeometryStore:
+    """Revisions of a device geometry: a base snapshot and the dictionaries changed in each revision"""
+
+    # the placement and property dictionaries recorded for each device
+    attributes = ['place_design', 'place_true', 'place_survey', 'place_photo', 'place_est', 'place_est_sig',
+                  'prop_design', 'prop_true', 'prop_est', 'prop_est_sig']
+
+    manifest_name = 'manifest.json'
+    base_name = 'base.geo'
+
+    def __init__(self, directory):
+        """Open an existing store (use GeometryStore.create to make a new one)"""
+        self.directory = Path(directory)
+        manifest_path = self.directory / self.manifest_name
+        if not manifest_path.exists():
+            raise ValueError('GeometryStore: no store in directory: ' + str(self.directory))
+        with open(manifest_path) as f:
+            self.manifest = json.load(f)
+        # the pickled base and the state of the latest revision are read when first needed
+        self.base_bytes = None
+        self.head_state = None
+        # the device at the latest revision whose placement changes are followed, its index, and the changed devices
+        self.tracked_device = None
+        self.tracked_index = None
+        self.changed_devices = set()
+
+    @classmethod
+    def create(cls, directory, device, tag=None, message=''):
+        """Make a new store in a directory, with the device as revision 0"""
+        directory = Path(directory)
+        if (directory / cls.manifest_name).exists():
+            raise ValueError('GeometryStore: a store already exists in directory: ' + str(directory))
+        directory.mkdir(parents=True, exist_ok=True)
+        device.save_file(directory / cls.base_name)
+        manifest = {'version': 1, 'base': cls.base_name, 'revisions': []}
+        manifest['revisions'].append(cls.get_entry(0, tag, message, None, {}))
+        with open(directory / cls.manifest_name, 'w') as f:
+            json.dump(manifest, f, indent=1)
+        store = cls(directory)
+        index = DeviceIndex(device, devices=())
+        store.head_state = cls.get_state(device, index)
+        store.track(device, index)
+        return store
+
+    @staticmethod
+    def get_entry(revision, tag, message, filename, changed):
+        """Return the manifest entry of a revision"""
+        return {'revision': revision, 'tag': tag, 'message': message,
+                'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+                'file': filename, 'changed': changed}
+
+    @classmethod
+    def get_state(cls, device, index=None):
+        """Return the placement and property dictionaries of a device and all devices it contains:
+        {path: {attribute: dictionary}}, with numpy values replaced by lists and floats"""
+        index = index or DeviceIndex(device, devices=())
+        state = {}
+        for path, sub_device in [('', device)] + list(index.devices_by_path.items()):
+            state[path] = {attribute: cls.get_value(sub_device, attribute) for attribute in cls.attributes}
+        return state
+
+    @staticmethod
+    def get_value(device, attribute):
+        """Return a placement or property dictionary of a device, with numpy values replaced by lists and floats"""
+        value = device.get_stored(attribute) or {}
+        return _plain(value.to_dict() if isinstance(value, Placement) else value)
+
+    def track(self, device, index):
+        """Follow the placement changes of the device, which is at the latest revision"""
+        if self.tracked_device is not None and self.tracked_device is not device:
+            self.tracked_device.remove_listener(self.placement_changed)
+        if self.tracked_device is not device:
+            device.add_listener(self.placement_changed)
+        self.tracked_device = device
+        self.tracked_index = index
+        self.changed_devices = set()
+
+    def placement_changed(self, device, place_info):
+        """Listener for the placement changes of the tracked device"""
+        self.changed_devices.add(device)
+
+    def __len__(self):
+        return len(self.manifest['revisions'])
+
+    def save_manifest(self):
+        with open(self.directory / self.manifest_name, 'w') as f:
+            json.dump(self.manifest, f, indent=1)
+
+    def log(self):
+        """Return the manifest entries of the revisions (without the lists of changes)"""
+        return [{key: value for key, value in entry.items() if key != 'changed'}
+                for entry in self.manifest['revisions']]
+
+    def get_revision(self, revision):
+        """Return the revision number of a revision given by number or tag (negative numbers count from the end)"""
+        if isinstance(revision, str):
+            for entry in reversed(self.manifest['revisions']):
+                if entry['tag'] == revision:
+                    return entry['revision']
+            raise ValueError('GeometryStore: unknown tag: ' + revision)
+        n_revision = len(self.manifest['revisions'])
+        if not -n_revision <= revision < n_revision:
+            raise ValueError('GeometryStore: unknown revision: ' + str(revision))
+        return revision % n_revision
+
+    def set_tag(self, revision, tag):
+        """Tag a revision"""
+        self.manifest['revisions'][self.get_revision(revision)]['tag'] = tag
+        self.save_manifest()
+
+    def commit(self, device, tag=None, message=''):
+        """Record the current state of the device as a new revision, saving only the dictionaries that changed
+        since the latest revision. Return the new revision number."""
+        if self.head_state is None:
+            self.checkout(-1)
+        if device is self.tracked_device:
+            delta = self.get_tracked_delta()
+            index = self.tracked_index
+        else:
+            index = DeviceIndex(device, devices=())
+            delta = self.get_delta(self.get_state(device, index))
+
+        revision = len(self.manifest['revisions'])
+        filename = None
+        if delta:
+            filename = 'rev_{:04d}.pkl'.format(revision)
+            with open(self.directory / filename, 'wb') as f:
+                pickle.dump(delta, f, protocol=4)
+        changed = {path: list(device_delta) for path, device_delta in delta.items()}
+        self.manifest['revisions'].append(self.get_entry(revision, tag, message, filename, changed))
+        self.save_manifest()
+        for path, device_delta in delta.items():
+            self.head_state[path].update(device_delta)
+        self.track(device, index)
+        return revision
+
+    def get_delta(self, state):
+        """Return the dictionaries that differ from those of the latest revision: {path: {attribute: dictionary}}"""
+        if state.keys() != self.head_state.keys():
+            raise ValueError('GeometryStore: the device does not contain the same devices as the stored revisions.')
+        delta = {}
+        for path, device_state in state.items():
+            head_device_state = self.head_state[path]
+            changed = {attribute: value for attribute, value in device_state.items()
+                       if value != head_device_state[attribute]}
+            if changed:
+                delta[path] = changed
+        return delta
+
+    def get_tracked_delta(self):
+        """Return the changed dictionaries of the tracked device: the placements of the devices that reported
+        changes, and the property dictionaries of all devices"""
+        index = self.tracked_index
+        place_attributes = [attribute for attribute in self.attributes if attribute.startswith('place_')]
+        prop_attributes = [attribute for attribute in self.attributes if attribute.startswith('prop_')]
+        delta = {}
+        for path, sub_device in [('', self.tracked_device)] + list(index.devices_by_path.items()):
+            head_device_state = self.head_state[path]
+            attributes = [attribute for attribute in prop_attributes
+                          if (sub_device.get_stored(attribute) or {}) != head_device_state[attribute]]
+            if sub_device in self.changed_devices:
+                attributes += place_attributes
+            for attribute in attributes:
+                value = self.get_value(sub_device, attribute)
+                if value != head_device_state[attribute]:
+                    delta.setdefault(path, {})[attribute] = value
+        return delta
+
+    def checkout(self, revision=-1):
+        """Return the device at a revision (given by number or tag). The placement changes of the device at the
+        latest revision are followed, so that it is committed quickly."""
+        revision = self.get_revision(revision)
+        if self.base_bytes is None:
+            self.base_bytes = (self.directory / self.manifest['base']).read_bytes()
+        device = pickle.loads(self.base_bytes)
+        index = DeviceIndex(device, devices=())
+        for entry in self.manifest['revisions'][1:revision + 1]:
+            if entry['file'] is None:
+                continue
+            with open(self.directory / entry['file'], 'rb') as f:
+                delta = pickle.load(f)
+            for path, device_delta in delta.items():
+                sub_device = index.get(path)
+                for attribute, value in device_delta.items():
+                    setattr(sub_device, attribute, value)
+        if revision == len(self.manifest['revisions']) - 1:
+            # the placement changes of the latest revision are followed, to be committed quickly
+            if self.head_state is None:
+                self.head_state = self.get_state(device, index)
+            self.track(device, index)
+        return device
+
+    def get_changed(self, revision_1, revision_2=-1):
+        """Return the paths of the devices changed between two revisions (from the manifest only)"""
+        revision_1, revision_2 = sorted([self.get_revision(revision_1), self.get_revision(revision_2)])
+        changed = set()
+        for entry in self.manifest['revisions'][revision_1 + 1:revision_2 + 1]:
+            changed.update(entry['changed'])
+        return sorted(changed)
+
+    def get_changes(self, revision):
+        """Return the changed dictionaries of each device changed in a revision: {path: [attribute, ...]}"""
+        return self.manifest['revisions'][self.get_revision(revision)]['changed']
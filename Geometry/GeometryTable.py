@@ -0,0 +1,364 @@
+"""
+GeometryTable: a columnar (structure of arrays) representation of a device tree
+
+Each device in the tree (e.g. a HALL, WCD, or SM and all of the devices it contains) is a row of the table.
+The rows are in depth-first order, so the devices contained in a device follow it in a contiguous block.
+The columns are numpy arrays:
+
+    parent                       index of the container row (-1 for the top-level device)
+    class_code, kind_code        indices into the lists table.classes and table.kinds
+    name                         device names
+    place_<info>_status          0: no placement dictionary (None), 1: placement dictionary
+    place_<info>_loc             (N,3) locations (NaN if not specified)
+    place_<info>_rot_axes        index into table.rot_axes (-1 if not specified)
+    place_<info>_rot_angles      (N,3) rotation angles (padded with NaN)
+    place_<info>_loc_is_array    True if the location is a numpy array rather than a list
+    place_<info>_angle_is_scalar True if a single rotation angle is given as a scalar
+    prop_<info>                  (N,n_property) property values, for the properties in table.property_keys
+                                 (NaN if the device does not have the property)
+    list_owner, list_name,       the lists of sub-devices held by the devices (e.g. WCD.mpmts), as the
+    list_start, list_stop,       owner row, index into Device.device_lists and range of list_members
+    list_members                 (list_start = -1 for a list set to None, member -1 for a missing device)
+
+where <info> is one of 'design', 'true', 'survey', 'photo', 'est', 'est_sig' for placements and 'design', 'true',
+'est', 'est_sig' for properties. Values that do not fit into the columns (e.g. non-numeric properties) are kept
+in table.extras.
+
+Bulk calculations can be done on the arrays directly, for example:
+    >>> table = GeometryTable.from_device(wcte)
+    >>> rotations, locations = table.get_transforms('design')
+    >>> pmt_locations = locations[table.select('PMT')]
+and the device tree can be rebuilt with table.to_device().
+"""
+
+import importlib
+import numpy as np
+
+from Geometry.Device import Device
+from Geometry.Placement import Placement
+
+
+class GeometryTable:
+    """A device tree stored as numpy arrays"""
+
+    place_infos = ['design', 'true', 'survey', 'photo', 'est', 'est_sig']
+    prop_infos = ['design', 'true', 'est', 'est_sig']
+
+    def __init__(self, arrays, classes, kinds, rot_axes, property_keys, extras=None):
+        """Constructor: use GeometryTable.from_device to build a table from a device tree"""
+        self.arrays = arrays
+        self.classes = classes
+        self.kinds = kinds
+        self.rot_axes = rot_axes
+        self.property_keys = property_keys
+        # values that do not fit in the columns: [row, attribute name, key, value]
+        self.extras = extras if extras is not None else []
+
+    def __len__(self):
+        return len(self.arrays['parent'])
+
+    def __getitem__(self, column):
+        return self.arrays[column]
+
+    @classmethod
+    def from_device(cls, device):
+        """Return the table for the device and all of the devices it contains"""
+
+        # assign the rows in depth-first order
+        devices = []
+        rows = {}
+
+        def add_device(the_device):
+            rows[id(the_device)] = len(devices)
+            devices.append(the_device)
+            for device_list_name in the_device.device_lists:
+                for sub_device in getattr(the_device, device_list_name, None) or []:
+                    # missing devices may be marked as None
+                    if sub_device is not None and sub_device.container is the_device:
+                        add_device(sub_device)
+
+        add_device(device)
+        n_device = len(devices)
+
+        classes, kinds, rot_axes, property_keys = [], [], [], []
+        extras = []
+
+        def code(values, value):
+            if value not in values:
+                values.append(value)
+            return values.index(value)
+
+        arrays = {'parent': np.array([-1 if i == 0 else rows[id(the_device.container)]
+                                      for i, the_device in enumerate(devices)], dtype=np.int32),
+                  'class_code': np.array([code(classes, the_device.__class__.__module__ + '.' +
+                                               the_device.__class__.__qualname__) for the_device in devices],
+                                         dtype=np.int16),
+                  'kind_code': np.array([code(kinds, the_device.kind) for the_device in devices], dtype=np.int16),
+                  'name': np.array([the_device.name for the_device in devices], dtype=str)}
+
+        for place_info in cls.place_infos:
+            attribute = 'place_' + place_info
+            status = np.zeros(n_device, dtype=np.int8)
+            locs = np.full((n_device, 3), np.nan)
+            axes_codes = np.full(n_device, -1, dtype=np.int16)
+            angles = np.full((n_device, 3), np.nan)
+            loc_is_array = np.zeros(n_device, dtype=bool)
+            angle_is_scalar = np.zeros(n_device, dtype=bool)
+            for i, the_device in enumerate(devices):
+                place = the_device.get_stored(attribute)
+                if place is None:
+                    continue
+                status[i] = 1
+                has_rotation = (isinstance(place.get('rot_axes'), str) and 0 < len(place['rot_axes']) <= 3 and
+                                'rot_angles' in place and np.size(place['rot_angles']) == len(place['rot_axes']))
+                for key, value in place.items():
+                    if key == 'loc' and np.shape(value) == (3,):
+                        locs[i] = value
+                        loc_is_array[i] = isinstance(value, np.ndarray)
+                    elif key == 'rot_axes' and has_rotation:
+                        axes_codes[i] = code(rot_axes, value)
+                        angles[i, :len(value)] = np.ravel(place['rot_angles'])
+                        angle_is_scalar[i] = np.ndim(place['rot_angles']) == 0
+                    elif key == 'rot_angles' and has_rotation:
+                        continue
+                    else:
+                        extras.append([i, attribute, key, value])
+            arrays[attribute + '_status'] = status
+            arrays[attribute + '_loc'] = locs
+            arrays[attribute + '_rot_axes'] = axes_codes
+            arrays[attribute + '_rot_angles'] = angles
+            arrays[attribute + '_loc_is_array'] = loc_is_array
+            arrays[attribute + '_angle_is_scalar'] = angle_is_scalar
+
+        for prop_info in cls.prop_infos:
+            attribute = 'prop_' + prop_info
+            for the_device in devices:
+                for key, value in (the_device.get_stored(attribute) or {}).items():
+                    if _is_number(value):
+                        code(property_keys, key)
+        for prop_info in cls.prop_infos:
+            attribute = 'prop_' + prop_info
+            values = np.full((n_device, len(property_keys)), np.nan)
+            for i, the_device in enumerate(devices):
+                device_prop = the_device.get_stored(attribute)
+                if device_prop is None:
+                    extras.append([i, attribute, None, None])
+                    continue
+                for key, value in device_prop.items():
+                    if _is_number(value):
+                        values[i, property_keys.index(key)] = value
+                    else:
+                        extras.append([i, attribute, key, value])
+            arrays[attribute] = values
+
+        # the lists of sub-devices (including flat lists of devices placed in lower level containers)
+        list_owner, list_name, list_start, list_stop, list_members = [], [], [], [], []
+        for i, the_device in enumerate(devices):
+            for j, device_list_name in enumerate(Device.device_lists):
+                if not hasattr(the_device, device_list_name):
+                    continue
+                sub_devices = getattr(the_device, device_list_name)
+                list_owner.append(i)
+                list_name.append(j)
+                if sub_devices is None:
+                    list_start.append(-1)
+                    list_stop.append(-1)
+                    continue
+                list_start.append(len(list_members))
+                list_members.extend([-1 if sub_device is None else rows[id(sub_device)]
+                                     for sub_device in sub_devices])
+                list_stop.append(len(list_members))
+        arrays['list_owner'] = np.array(list_owner, dtype=np.int32)
+        arrays['list_name'] = np.array(list_name, dtype=np.int8)
+        arrays['list_start'] = np.array(list_start, dtype=np.int32)
+        arrays['list_stop'] = np.array(list_stop, dtype=np.int32)
+        arrays['list_members'] = np.array(list_members, dtype=np.int32)
+
+        return cls(arrays, classes, kinds, rot_axes, property_keys, extras)
+
+    def to_device(self):
+        """Rebuild the device tree and return the top-level device"""
+        arrays = self.arrays
+        n_device = len(self)
+        device_classes = []
+        for class_path in self.classes:
+            module_name, class_name = class_path.rsplit('.', 1)
+            device_classes.append(getattr(importlib.import_module(module_name), class_name))
+
+        # the columns are converted together, rather than one device at a time
+        properties = {prop_info: self.get_properties(prop_info) for prop_info in self.prop_infos}
+        placements = {place_info: self.get_placements(place_info) for place_info in self.place_infos}
+
+        devices = [None] * n_device
+        parents = arrays['parent'].tolist()
+        class_codes = arrays['class_code'].tolist()
+        kind_codes = arrays['kind_code'].tolist()
+        names = arrays['name'].tolist()
+        for i in range(n_device):
+            device_class = device_classes[class_codes[i]]
+            kind = self.kinds[kind_codes[i]]
+            state = {'name': names[i],
+                     'container': None if parents[i] < 0 else devices[parents[i]],
+                     'kind': kind}
+            for prop_info in self.prop_infos:
+                state['prop_' + prop_info] = properties[prop_info][i]
+            # devices share the design properties of their kind, unless they have been changed
+            design_mean = getattr(device_class, 'design_mean', {}).get(kind)
+            if design_mean is not None and design_mean == state['prop_design']:
+                state['prop_design'] = design_mean
+            for place_info in self.place_infos:
+                state['place_' + place_info] = placements[place_info][i]
+            device = device_class.__new__(device_class)
+            device.__setstate__(state)
+            devices[i] = device
+
+        owners = arrays['list_owner'].tolist()
+        list_names = arrays['list_name'].tolist()
+        starts = arrays['list_start'].tolist()
+        stops = arrays['list_stop'].tolist()
+        members = arrays['list_members'].tolist()
+        for owner, j, start, stop in zip(owners, list_names, starts, stops):
+            sub_devices = None
+            if start >= 0:
+                sub_devices = [None if member < 0 else devices[member] for member in members[start:stop]]
+            setattr(devices[owner], Device.device_lists[j], sub_devices)
+
+        return devices[0]
+
+    def get_extras(self, attribute):
+        """Return a dictionary of the extra values of an attribute (e.g. 'place_est'): lists of (key, value) by row"""
+        extras = {}
+        for row, extra_attribute, key, value in self.extras:
+            if extra_attribute == attribute:
+                extras.setdefault(row, []).append((key, value))
+        return extras
+
+    def get_properties(self, prop_info, rows=None):
+        """Return the list of property dictionaries of the devices in the rows (by default, all rows)"""
+        rows = np.arange(len(self)) if rows is None else np.asarray(rows)
+        values = np.asarray(self.arrays['prop_' + prop_info])[rows]
+        present = ~np.isnan(values)
+        extras = self.get_extras('prop_' + prop_info)
+        keys = self.property_keys
+        properties = []
+        for row, row_values, row_present in zip(rows.tolist(), values.tolist(), present.tolist()):
+            device_prop = {key: value for key, value, is_present in zip(keys, row_values, row_present) if is_present}
+            for key, value in extras.get(row, []):
+                if key is None:
+                    # the dictionary was None
+                    device_prop = None
+                    break
+                device_prop[key] = value
+            properties.append(device_prop)
+        return properties
+
+    def get_placements(self, place_info, rows=None):
+        """Return the list of placement dictionaries of the devices in the rows (by default, all rows)"""
+        attribute = 'place_' + place_info
+        rows = np.arange(len(self)) if rows is None else np.asarray(rows)
+        columns = {column: np.asarray(self.arrays[attribute + '_' + column])[rows]
+                   for column in ['status', 'loc', 'rot_axes', 'rot_angles', 'loc_is_array', 'angle_is_scalar']}
+        has_loc = (~np.isnan(columns['loc']).all(axis=1)).tolist()
+        status, axes_codes, loc_is_array, angle_is_scalar = [columns[column].tolist() for column in
+                                                             ['status', 'rot_axes', 'loc_is_array', 'angle_is_scalar']]
+        locs = columns['loc'].tolist()
+        angles = columns['rot_angles'].tolist()
+        extras = self.get_extras(attribute)
+        placements = []
+        for i, row in enumerate(rows.tolist()):
+            if status[i] == 0:
+                placements.append(None)
+                continue
+            place = {}
+            if has_loc[i]:
+                place['loc'] = np.array(locs[i]) if loc_is_array[i] else locs[i]
+            if axes_codes[i] >= 0:
+                rot_axes = self.rot_axes[axes_codes[i]]
+                place['rot_axes'] = rot_axes
+                place['rot_angles'] = angles[i][0] if angle_is_scalar[i] else angles[i][:len(rot_axes)]
+            for key, value in extras.get(row, []):
+                place[key] = value
+            placements.append(Placement(place))
+        return placements
+
+    def select(self, device_class=None, kind=None):
+        """Return the rows of the devices of a class (class name, e.g. 'PMT') and/or kind"""
+        selected = np.ones(len(self), dtype=bool)
+        if device_class is not None:
+            class_codes = [i for i, class_path in enumerate(self.classes)
+                           if class_path.rsplit('.', 1)[-1] == device_class]
+            selected &= np.isin(self.arrays['class_code'], class_codes)
+        if kind is not None:
+            selected &= np.isin(self.arrays['kind_code'], [i for i, k in enumerate(self.kinds) if k == kind])
+        return np.flatnonzero(selected)
+
+    def get_depths(self):
+        """Return the number of containers above each device"""
+        parent = self.arrays['parent']
+        depths = np.zeros(len(self), dtype=np.int32)
+        above = parent.copy()
+        while (above >= 0).any():
+            inside = above >= 0
+            depths[inside] += 1
+            above[inside] = parent[above[inside]]
+        return depths
+
+    def get_local_transforms(self, place_info):
+        """Return the (N,3,3) rotation matrices and (N,3) translations of the devices in the coordinate systems
+        of their containers. Devices without placement information have NaN entries."""
+        attribute = 'place_' + place_info
+        n_device = len(self)
+        rotations = np.tile(np.identity(3), (n_device, 1, 1))
+        translations = np.nan_to_num(self.arrays[attribute + '_loc'], nan=0.)
+        axes_codes = self.arrays[attribute + '_rot_axes']
+        angles = self.arrays[attribute + '_rot_angles']
+        from scipy.spatial.transform import Rotation
+        for axes_code, rot_axes in enumerate(self.rot_axes):
+            rows = np.flatnonzero(axes_codes == axes_code)
+            if len(rows) > 0:
+                rotations[rows] = Rotation.from_euler(rot_axes, angles[rows, :len(rot_axes)]).as_matrix()
+        # placements that are None or empty
+        missing = (self.arrays[attribute + '_status'] == 0) | (np.isnan(self.arrays[attribute + '_loc']).all(axis=1) &
+                                                               (axes_codes < 0))
+        rotations[missing] = np.nan
+        translations[missing] = np.nan
+        return rotations, translations
+
+    def get_transforms(self, place_info, reference=0):
+        """Return the (N,3,3) rotation matrices and (N,3) translations that transform points in the coordinate
+        system of each device to that of the device in the reference row (by default the top-level device).
+        Devices that are not inside the reference device, or whose placement is missing, have NaN entries.
+        Containers without the placement information are treated as having the identity transformation,
+        as in Device.get_placements."""
+        n_device = len(self)
+        local_rotations, local_translations = self.get_local_transforms(place_info)
+        missing = np.isnan(local_rotations).any(axis=(1, 2))
+        local_rotations[missing] = np.identity(3)
+        local_translations[missing] = 0.
+        rotations = np.full((n_device, 3, 3), np.nan)
+        translations = np.full((n_device, 3), np.nan)
+        rotations[reference] = np.identity(3)
+        translations[reference] = 0.
+
+        # the devices inside the reference device follow it (rows are in depth-first order)
+        depths = self.get_depths()
+        outside = np.flatnonzero(depths[reference + 1:] <= depths[reference])
+        stop = reference + 1 + outside[0] if len(outside) > 0 else n_device
+        rows = np.arange(reference + 1, stop)
+        parent = self.arrays['parent']
+        # compose the transformations one level at a time
+        for depth in range(depths[reference] + 1, depths[rows].max() + 1 if len(rows) > 0 else 0):
+            level = rows[depths[rows] == depth]
+            container_rotations = rotations[parent[level]]
+            rotations[level] = np.matmul(container_rotations, local_rotations[level])
+            translations[level] = (np.einsum('nij,nj->ni', container_rotations, local_translations[level]) +
+                                   translations[parent[level]])
+        # the devices without the placement information (their containers used the identity in their place)
+        missing_rows = rows[missing[rows]]
+        rotations[missing_rows] = np.nan
+        translations[missing_rows] = np.nan
+        return rotations, translations
+
+
+def _is_number(value):
+    return isinstance(value, (int, float, np.integer, np.floating)) and not isinstance(value, (bool, np.bool_))
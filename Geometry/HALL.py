@@ -4,7 +4,6 @@ from Geometry.SM import SM
 from Geometry.WCD import WCD
 
 import numpy as np
-from scipy.spatial.transform import Rotation
 
 
 class HALL(Device):
@@ -12,6 +11,9 @@ class HALL(Device):
     The hall is the top level of the geometry hierarchy, defining the coordinate system for the experiment or survey.
     """
 
+    # design dictionaries used to place the sub-devices in each list
+    design_tables = {'wcds': 'wcds_design', 'sms': 'sms_design', 'mpmts': 'mpmts_design'}
+
     mpmts_design = {}
     sms_design = {}
 
@@ -29,16 +31,17 @@ class HALL(Device):
 
     wcds_design = {'WCTE':wcte_wcds}
 
-    def __init__(self, name, container=None, kind='WCTE', place_design={}, place_true={}, device_type=WCD):
+    def __init__(self, name, container=None, kind='WCTE', place_design={}, place_true={}, device_type=WCD,
+                 lazy=False):
         super().__init__(HALL, name, container, kind, place_design, place_true)
 
-        # create and place the set of devices
+        # create and place the set of devices (if lazy, the PMTs and LEDs of the mPMTs are created when first accessed)
         if device_type == MPMT:
-            self.mpmts = self.place_devices(device_type, self.mpmts_design, kind)
+            self.mpmts = self.place_devices(device_type, self.mpmts_design, kind, lazy=lazy)
             self.sms = None
             self.wcds = None
         elif device_type == SM:
-            self.sms = self.place_devices(device_type, self.sms_design, kind)
+            self.sms = self.place_devices(device_type, self.sms_design, kind, lazy=lazy)
             # collect all the mpmts in the WCD
             self.mpmts = []
             for sm in self.sms:
@@ -48,5 +51,5 @@ class HALL(Device):
                 mpmt.name = str(i)
             self.wcds = None
         elif device_type == WCD:
-            self.wcds = self.place_devices(device_type, self.wcds_design, kind)
+            self.wcds = self.place_devices(device_type, self.wcds_design, kind, lazy=lazy)
             self.sms = None
@@ -0,0 +1,117 @@
+"""
+Illumination: which PMTs are illuminated by which LEDs, and at which angles
+
+For every light source (the LEDs in the mPMTs followed by the calibration sources, as in TofTable) and every PMT:
+    emission angle:  between the LED axis (direction_z) and the line from the LED to the PMT
+    incidence angle: between the PMT axis (direction_z) and the line from the PMT to the LED
+    in cone:         the emission angle is within the LED cone_angle (for cone_ring_width > 0, within the ring
+                     of that width at the edge of the cone: cone_angle - cone_ring_width to cone_angle)
+    in fov:          the incidence angle is within the PMT fov
+
+Most pairs are outside the LED cones, so the results are kept in sparse (coordinate list) form: the source and PMT
+indices of the pairs inside the cones, and their angles, distances and fov flags. The pairs are calculated for
+chunks of sources at a time, so that the temporary (chunk, n_pmt) arrays stay small:
+
+    >>> illumination = Illumination.build(wcte, 'design')
+    >>> pmts_seen = illumination.get_pmts(led_index)
+    >>> mask = illumination.get_mask()   # (n_source, n_pmt) illuminated pairs
+"""
+
+import numpy as np
+
+
+class Illumination:
+    """LED to PMT illumination, for the pairs of sources and PMTs inside the LED cones"""
+
+    def __init__(self, n_source, n_pmt, source, pmt, emission_angle, incidence_angle, distance, in_fov):
+        self.n_source = n_source
+        self.n_pmt = n_pmt
+        # the pairs inside the LED cones, sorted by source then PMT
+        self.source = source
+        self.pmt = pmt
+        self.emission_angle = emission_angle
+        self.incidence_angle = incidence_angle
+        self.distance = distance
+        self.in_fov = in_fov
+
+    def __len__(self):
+        return len(self.source)
+
+    @staticmethod
+    def get_property(devices, prop_info, key):
+        """Return an array of a property of the devices (NaN if missing)"""
+        values = []
+        for device in devices:
+            value = (device.get_properties(prop_info) or {}).get(key)
+            values.append(np.nan if value is None else value)
+        return np.array(values, dtype=float)
+
+    @classmethod
+    def build(cls, wcd, place_info='design', prop_info='design', chunk_size=128):
+        """Calculate the illumination for a WCD using the placements and properties specified"""
+        sources = wcd.get_devices('leds') + wcd.get_devices('calibs')
+        source_placements = [wcd.get_placements(devices, place_info, wcd) for devices in ['leds', 'calibs']]
+        source_locations = np.concatenate([placements['location'] for placements in source_placements])
+        source_directions = np.concatenate([placements['direction_z'] for placements in source_placements])
+        pmt_placements = wcd.get_placements('pmts', place_info, wcd)
+
+        cone_angle = cls.get_property(sources, prop_info, 'cone_angle')
+        ring_width = np.nan_to_num(cls.get_property(sources, prop_info, 'cone_ring_width'))
+        fov = cls.get_property(pmt_placements['devices'], prop_info, 'fov')
+
+        return cls.from_arrays(source_locations, source_directions, cone_angle, ring_width,
+                               pmt_placements['location'], pmt_placements['direction_z'], fov, chunk_size)
+
+    @classmethod
+    def from_arrays(cls, source_locations, source_directions, cone_angle, ring_width, pmt_locations, pmt_directions,
+                    fov, chunk_size=128):
+        """Calculate the illumination from arrays of source and PMT locations (N,3), directions (N,3), LED cone
+        angles and ring widths (n_source,) and PMT fields of view (n_pmt,)"""
+        n_source, n_pmt = len(source_locations), len(pmt_locations)
+        # the cones are compared using cosines: inside when cos(max angle) <= cos(angle) <= cos(min angle)
+        cos_max = np.cos(cone_angle)
+        cos_min = np.where(ring_width > 0., np.cos(np.maximum(cone_angle - ring_width, 0.)), 1.)
+        cos_fov = np.cos(fov)
+
+        parts = []
+        for start in range(0, n_source, chunk_size):
+            stop = min(start + chunk_size, n_source)
+            offsets = pmt_locations[None, :, :] - source_locations[start:stop, None, :]
+            distance = np.sqrt(np.einsum('spi,spi->sp', offsets, offsets))
+            cos_emission = np.einsum('spi,si->sp', offsets, source_directions[start:stop]) / distance
+            inside = ((cos_emission >= cos_max[start:stop, None]) & (cos_emission <= cos_min[start:stop, None]) &
+                      (distance > 0.))
+            rows, columns = np.nonzero(inside)
+            distance = distance[rows, columns]
+            cos_incidence = -np.einsum('ni,ni->n', offsets[rows, columns], pmt_directions[columns]) / distance
+            parts.append((rows + start, columns, np.arccos(np.clip(cos_emission[rows, columns], -1., 1.)),
+                          np.arccos(np.clip(cos_incidence, -1., 1.)), distance, cos_incidence >= cos_fov[columns]))
+
+        source, pmt, emission_angle, incidence_angle, distance, in_fov = [
+            np.concatenate([part[i] for part in parts]) if parts else np.zeros(0) for i in range(6)]
+        return cls(n_source, n_pmt, source.astype(np.int32), pmt.astype(np.int32), emission_angle.astype(np.float32),
+                   incidence_angle.astype(np.float32), distance.astype(np.float32), in_fov.astype(bool))
+
+    def get_mask(self, fov=True):
+        """Return the (n_source, n_pmt) boolean array of pairs inside the LED cones (and the PMT fov if fov is True)"""
+        mask = np.zeros((self.n_source, self.n_pmt), dtype=bool)
+        selected = self.in_fov if fov else slice(None)
+        mask[self.source[selected], self.pmt[selected]] = True
+        return mask
+
+    def get_dense(self, values, fill=np.nan):
+        """Return a (n_source, n_pmt) array of the values of the pairs (e.g. illumination.incidence_angle)"""
+        dense = np.full((self.n_source, self.n_pmt), fill, dtype=np.asarray(values).dtype)
+        dense[self.source, self.pmt] = values
+        return dense
+
+    def get_pmts(self, source, fov=True):
+        """Return the indices of the PMTs illuminated by a source (within their fov if fov is True)"""
+        start, stop = np.searchsorted(self.source, [source, source + 1])
+        pmts = self.pmt[start:stop]
+        return pmts[self.in_fov[start:stop]] if fov else pmts
+
+    def get_sources(self, pmt, fov=True):
+        """Return the indices of the sources that illuminate a PMT (within its fov if fov is True)"""
+        selected = (self.pmt == pmt) & self.in_fov if fov else self.pmt == pmt
+        return self.source[selected]
@@ -1,9 +1,17 @@
 from Geometry.Device import Device
+from Geometry.DesignTable import DesignTable, DesignList
 from Geometry.PMT import PMT
 from Geometry.LED import LED
 import numpy as np
-import copy
-from scipy.spatial.transform import Rotation
+
+
+def get_circle_xy_points(centre_xy, radius, n_point):
+    """Return an (n_point,3) array of points on a circle in the x-y plane"""
+    theta = 2. * np.pi * np.arange(n_point) / n_point
+    xy_points = np.zeros((n_point, 3))
+    xy_points[:, 0] = centre_xy[0] + radius * np.cos(theta)
+    xy_points[:, 1] = centre_xy[1] + radius * np.sin(theta)
+    return xy_points
 
 
 class MPMT(Device):
@@ -14,11 +22,14 @@ class MPMT(Device):
     design_scale = {}  # scale of variations of properties used to create objects
     design_var = {}  # distribution of variations
 
+    # design dictionaries used to place the sub-devices in each list
+    design_tables = {'pmts': 'pmts_design', 'leds': 'leds_design'}
+
     # A dictionary of pmt kinds and placements in the mPMT:
-    pmts_design = {}
+    pmts_design = DesignTable()
 
     # A dictionary of led kinds and placements in the mPMT:
-    leds_design = {}
+    leds_design = DesignTable()
 
     # default properties of (rectangular) MPMTs
     # all properties are defined by primitives, so shallow dictionary copy works
@@ -81,17 +92,12 @@ class MPMT(Device):
     leds_design['MR'] = def_leds
 
     # A dome MPMT (for both ME and MI)
-    dome_pmts = []
     # dome pattern of PMTs:
     number_by_row = [1, 6, 12]  # number of PMTs per row
     angle_by_row = [0., -0.297, -0.593]  # radians
     dz_by_row = [0., -14.242, -55.724]  # mm wrt PMT 0
     distance_by_row = [0., 96.355, 190.594]  # mm distance to PMT centres
-    # transverse_radius_by_row = [np.sqrt(distance_by_row[i]**2 - dz_by_row[i]**2) for i in range(len(number_by_row))]
-    transverse_radius_by_row = []
-    for i in range(len(number_by_row)):
-        val = np.sqrt(distance_by_row[i] ** 2 - dz_by_row[i] ** 2)
-        transverse_radius_by_row.append(val)
+    transverse_radius_by_row = np.sqrt(np.array(distance_by_row) ** 2 - np.array(dz_by_row) ** 2).tolist()
 
     # baseplate top surface definition
     dz_to_pmt0 = 246.8  # mm from top surface to PMT0
@@ -99,21 +105,14 @@ class MPMT(Device):
     long_edge_separation = 528.0  # mm separation of the long edges
     halfs = [long_edge_separation / 2., long_edge / 2.]
     signs = [1., -1.]
-    base_xy_points = []
-    for i in range(8):
-        x = halfs[[0, 1, 1, 0, 0, 1, 1, 0][i]] * signs[[0, 0, 1, 1, 1, 1, 0, 0][i]]
-        y = halfs[[1, 0, 0, 1, 1, 0, 0, 1][i]] * signs[[1, 1, 1, 1, 0, 0, 0, 0][i]]
-        base_xy_points.append([x, y, 0.])
+    base_xy_points = np.zeros((8, 3))
+    base_xy_points[:, 0] = np.array(halfs)[[0, 1, 1, 0, 0, 1, 1, 0]] * np.array(signs)[[0, 0, 1, 1, 1, 1, 0, 0]]
+    base_xy_points[:, 1] = np.array(halfs)[[1, 0, 0, 1, 1, 0, 0, 1]] * np.array(signs)[[1, 1, 1, 1, 0, 0, 0, 0]]
     # feedthrough hole definition (to show orientation clearly)
     ft_xy = [195.26, -43.29]  # mm centre of feedthrough hole
     ft_diameter = 43.  # mm as seen from outside
-    feedthough_xy_points = []
     nft = 20
-    for i in range(nft):
-        theta = 2. * np.pi * i / nft
-        x = ft_xy[0] + ft_diameter / 2. * np.cos(theta)
-        y = ft_xy[1] + ft_diameter / 2. * np.sin(theta)
-        feedthough_xy_points.append([x, y, 0.])
+    feedthough_xy_points = get_circle_xy_points(ft_xy, ft_diameter / 2., nft)
     # Survey holes definition (to show orientation clearly) - these are labelled by C1, C2, C3, C4
     survey_c = 196.58  # mm xm or ym coordinates are +/- this value
     # Note: Fiducial points (centres of corner cube reflectors) are offset in zm: that is specified in get_fiducials
@@ -123,44 +122,11 @@ class MPMT(Device):
                  [survey_c, survey_c, 0.]]
     # Survey holes are 8 mm diameter
     survey_holes_diameter = 8  # mm
-    survey_holes_xy_points = []
     nsh = 20
+    survey_holes_xy_points = []
     for fiducial in fiducials:
-        xs, ys = fiducial[0], fiducial[1]
-        survey_hole_xy_points = []
-        for i in range(nsh):
-            theta = 2. * np.pi * i / nsh
-            x = xs + survey_holes_diameter / 2. * np.cos(theta)
-            y = ys + survey_holes_diameter / 2. * np.sin(theta)
-            survey_hole_xy_points.append([x, y, 0.])
-        survey_holes_xy_points.append(survey_hole_xy_points)
-
-    for i_row, number in enumerate(number_by_row):
-        if i_row == 0:
-            dome_pmts.append({'name': str(len(dome_pmts)), 'kind': 'P3',
-                              'loc': [0., 0., dz_to_pmt0],
-                              'loc_sig': [1.0, 1.0, 1.0],
-                              'rot_axes': 'xz',
-                              'rot_angles': [0., 0.],
-                              'rot_angles_sig': [0.01, 0.01]})
-        else:
-            for i_pmt in range(number):
-                # start with a PMT located on the mpmt y axis
-                loc = [0., transverse_radius_by_row[i_row], dz_by_row[i_row] + dz_to_pmt0]
-                # now rotate it around the mpmt z axis
-                phi_angle = 2. * np.pi * i_pmt / number
-                rot_phi = Rotation.from_euler('Z', phi_angle)
-                rot_loc = rot_phi.apply(loc)
-                # rotations of the normal defined by 2 extrinsic rotations
-                rot_angles = [angle_by_row[i_row], phi_angle]
-                dome_pmts.append({'name': str(len(dome_pmts)), 'kind': 'P3',
-                                  'loc': rot_loc,
-                                  'loc_sig': [1.0, 1.0, 1.0],
-                                  'rot_axes': 'xz',
-                                  'rot_angles': rot_angles,
-                                  'rot_angles_sig': [0.01, 0.01]})
+        survey_holes_xy_points.append(get_circle_xy_points(fiducial, survey_holes_diameter / 2., nsh))
 
-    dome_leds = []
     # The dome LED holes are located with respect to the outer top flat surface of the matrix
     matrix_z = 115.85  # mm in zm coordinate of outer top flat surface of the matrix
     # The LED diffuser location is the end of the LED diffuser holder
@@ -171,45 +137,9 @@ class MPMT(Device):
     led_dz_by_row = [68.709, 52.644, 8.504]  # mm wrt outer top flat surface of the matrix
     led_xm_by_row = [39.221, 0., 167.804]  # mm xm coordinate for first LED hole in the row (numbering azimuthally)
     led_ym_by_row = [22.645, 101.328, 44.963]  # mm ym coordinate for first LED hole in the row (numbering azimuthally)
-    led_transverse_radius_by_row = []
-    for i in range(len(number_by_row)):
-        val = np.sqrt(led_xm_by_row[i] ** 2 + led_ym_by_row[i] ** 2)
-        led_transverse_radius_by_row.append(val)
-
-    for i_row, number in enumerate(led_number_by_row):
-        if i_row == 0:
-            kind = 'LC'
-        else:
-            kind = 'LD'
-
-        # azimuthal angle of first LED hole in row
-        phi_0 = np.arctan2(led_ym_by_row[i_row], led_xm_by_row[i_row])
-        for i_led in range(number):
-            # start with the first LED hole located at positive azimuth angle wrt ym axis
-            # start with a vertically oriented diffuser holder
-            loc = [0., 0., diffuser_holder_length]
-            # rotate it about the y-axis
-            rot_holder = Rotation.from_euler('Y', led_angle_by_row[i_row])
-            rot_loc = rot_holder.apply(loc)
-            # translate to the mPMT coordinates on xm axis (had it been located on the xm axis)
-            trans_loc = [rot_loc[0] + led_transverse_radius_by_row[i_row], rot_loc[1],
-                         rot_loc[2] + matrix_z + led_dz_by_row[i_row]]
-            # now rotate it about the mpmt z axis (add extra 90 degrees, because of change on 2023-09-17)
-
-            phi_angle = 2. * np.pi * i_led / number + phi_0 + np.pi / 2.
-            rot_phi = Rotation.from_euler('Z', phi_angle)
-            rot_trans = rot_phi.apply(trans_loc)
-            # rotations of the normal defined by 2 extrinsic rotations
-            rot_angles = [led_angle_by_row[i_row], phi_angle]
-            dome_leds.append({'name': str(len(dome_leds)), 'kind': kind,
-                              'loc': rot_trans,
-                              'loc_sig': [1.0, 1.0, 1.0],
-                              'rot_axes': 'yz',
-                              'rot_angles': rot_angles,
-                              'rot_angles_sig': [0.01, 0.01]})
+    led_transverse_radius_by_row = np.hypot(led_xm_by_row, led_ym_by_row).tolist()
 
     # A FD-MPMT (included in the WCTE bottom endcap)
-    fd_pmts = []
     # dome pattern of PMTs:
     fd_dz_by_row = [0., -20.8, -75.543]  # mm wrt PMT 0
     fd_transverse_radius_by_row = [0., 109.487, 199.909]
@@ -217,53 +147,19 @@ class MPMT(Device):
     # baseplate top surface definition
     fd_dz_to_pmt0 = 224.678  # mm from top surface to PMT0
     fd_baseplate_radius = 590.00/2. # mm
-    fd_base_xy_points = []
-    for i in range(40):
-        theta = 2. * np.pi * i / 40
-        x = fd_baseplate_radius * np.cos(theta)
-        y = fd_baseplate_radius * np.sin(theta)
-        fd_base_xy_points.append([x, y, 0.])
+    fd_base_xy_points = get_circle_xy_points([0., 0.], fd_baseplate_radius, 40)
 
     # feedthrough hole definitions (to show orientation clearly)
     fd_ft1_xy = [201.886, 35.598]  # mm centre of feedthrough hole
     fd_ft2_xy = [201.886, -35.598]  # mm centre of feedthrough hole
     fd_ft_diameter = 44.  # mm as seen from outside
-    fd_feedthough1_xy_points = []
-    fd_feedthough2_xy_points = []
-    nft = 20
-    for i in range(nft):
-        theta = 2. * np.pi * i / nft
-        x = fd_ft1_xy[0] + fd_ft_diameter / 2. * np.cos(theta)
-        y = fd_ft1_xy[1] + fd_ft_diameter / 2. * np.sin(theta)
-        fd_feedthough1_xy_points.append([x, y, 0.])
-        x = fd_ft2_xy[0] + fd_ft_diameter / 2. * np.cos(theta)
-        y = fd_ft2_xy[1] + fd_ft_diameter / 2. * np.sin(theta)
-        fd_feedthough2_xy_points.append([x, y, 0.])
-
-    for i_row, number in enumerate(number_by_row):
-        if i_row == 0:
-            fd_pmts.append({'name': str(len(fd_pmts)), 'kind': 'P3',
-                              'loc': [0., 0., fd_dz_to_pmt0],
-                              'loc_sig': [1.0, 1.0, 1.0],
-                              'rot_axes': 'xz',
-                              'rot_angles': [0., 0.],
-                              'rot_angles_sig': [0.01, 0.01]})
-        else:
-            for i_pmt in range(number):
-                # start with a PMT located on the mpmt y axis
-                loc = [0., fd_transverse_radius_by_row[i_row], fd_dz_by_row[i_row] + fd_dz_to_pmt0]
-                # now rotate it around the mpmt z axis
-                phi_angle = 2. * np.pi * i_pmt / number
-                rot_phi = Rotation.from_euler('Z', phi_angle)
-                rot_loc = rot_phi.apply(loc)
-                # rotations of the normal defined by 2 extrinsic rotations
-                rot_angles = [angle_by_row[i_row], phi_angle]
-                fd_pmts.append({'name': str(len(fd_pmts)), 'kind': 'P3',
-                                  'loc': rot_loc,
-                                  'loc_sig': [1.0, 1.0, 1.0],
-                                  'rot_axes': 'xz',
-                                  'rot_angles': rot_angles,
-                                  'rot_angles_sig': [0.01, 0.01]})
+    fd_feedthough1_xy_points = get_circle_xy_points(fd_ft1_xy, fd_ft_diameter / 2., nft)
+    fd_feedthough2_xy_points = get_circle_xy_points(fd_ft2_xy, fd_ft_diameter / 2., nft)
+
+    # The dome PMT and LED layouts are built when first used (see build_dome_pmts, build_dome_leds, build_fd_pmts)
+    dome_pmts = DesignList('pmts_design', 'ME')
+    dome_leds = DesignList('leds_design', 'ME')
+    fd_pmts = DesignList('pmts_design', 'FD')
 
     # Standard dome MPMTs:
     md_design_mean = def_design_mean.copy()
@@ -276,25 +172,88 @@ class MPMT(Device):
     design_scale['ME'] = md_design_scale
     design_var['ME'] = md_design_var
 
-    pmts_design['ME'] = dome_pmts
-    leds_design['ME'] = dome_leds
+    pmts_design.add_builder('ME', 'build_dome_pmts')
+    leds_design.add_builder('ME', 'build_dome_leds')
 
     # ex-situ and in-situ are currently the same
     design_mean['MI'] = md_design_mean
     design_scale['MI'] = md_design_scale
     design_var['MI'] = md_design_var
 
-    pmts_design['MI'] = dome_pmts
-    leds_design['MI'] = dome_leds
+    pmts_design.add_builder('MI', 'build_dome_pmts')
+    leds_design.add_builder('MI', 'build_dome_leds')
 
     # Far detector dome MPMTs:
     design_mean['FD'] = md_design_mean
     design_scale['FD'] = md_design_scale
     design_var['FD'] = md_design_var
 
-    pmts_design['FD'] = fd_pmts
+    pmts_design.add_builder('FD', 'build_fd_pmts')
     leds_design['FD'] = []
 
+    @classmethod
+    def build_dome_pmts(cls, transverse_radius_by_row=None, dz_by_row=None, dz_to_pmt0=None):
+        """Return the design list of the PMTs in a dome mPMT (by default for ME and MI mPMTs)"""
+        if transverse_radius_by_row is None:
+            transverse_radius_by_row, dz_by_row, dz_to_pmt0 = (cls.transverse_radius_by_row, cls.dz_by_row,
+                                                               cls.dz_to_pmt0)
+        dome_pmts = [{'name': '0', 'kind': 'P3',
+                      'loc': [0., 0., dz_to_pmt0],
+                      'loc_sig': [1.0, 1.0, 1.0],
+                      'rot_axes': 'xz',
+                      'rot_angles': [0., 0.],
+                      'rot_angles_sig': [0.01, 0.01]}]
+        for i_row, number in enumerate(cls.number_by_row[1:], start=1):
+            # start with PMTs located on the mpmt y axis, then rotate them around the mpmt z axis
+            phi_angles = 2. * np.pi * np.arange(number) / number
+            locs = np.zeros((number, 3))
+            locs[:, 0] = -transverse_radius_by_row[i_row] * np.sin(phi_angles)
+            locs[:, 1] = transverse_radius_by_row[i_row] * np.cos(phi_angles)
+            locs[:, 2] = dz_by_row[i_row] + dz_to_pmt0
+            for loc, phi_angle in zip(locs, phi_angles.tolist()):
+                # rotations of the normal defined by 2 extrinsic rotations
+                dome_pmts.append({'name': str(len(dome_pmts)), 'kind': 'P3',
+                                  'loc': loc,
+                                  'loc_sig': [1.0, 1.0, 1.0],
+                                  'rot_axes': 'xz',
+                                  'rot_angles': [cls.angle_by_row[i_row], phi_angle],
+                                  'rot_angles_sig': [0.01, 0.01]})
+        return dome_pmts
+
+    @classmethod
+    def build_fd_pmts(cls):
+        """Return the design list of the PMTs in an FD mPMT"""
+        return cls.build_dome_pmts(cls.fd_transverse_radius_by_row, cls.fd_dz_by_row, cls.fd_dz_to_pmt0)
+
+    @classmethod
+    def build_dome_leds(cls):
+        """Return the design list of the LEDs in a dome mPMT"""
+        dome_leds = []
+        for i_row, number in enumerate(cls.led_number_by_row):
+            kind = 'LC' if i_row == 0 else 'LD'
+            angle = cls.led_angle_by_row[i_row]
+            # start with a vertically oriented diffuser holder, rotated about the y-axis and translated to
+            # the mPMT coordinates on xm axis (had it been located on the xm axis)
+            trans_loc = [cls.diffuser_holder_length * np.sin(angle) + cls.led_transverse_radius_by_row[i_row], 0.,
+                         cls.diffuser_holder_length * np.cos(angle) + cls.matrix_z + cls.led_dz_by_row[i_row]]
+            # now rotate them about the mpmt z axis (add extra 90 degrees, because of change on 2023-09-17)
+            # the azimuthal angle of first LED hole in row is at positive azimuth angle wrt ym axis
+            phi_0 = np.arctan2(cls.led_ym_by_row[i_row], cls.led_xm_by_row[i_row])
+            phi_angles = 2. * np.pi * np.arange(number) / number + phi_0 + np.pi / 2.
+            locs = np.zeros((number, 3))
+            locs[:, 0] = trans_loc[0] * np.cos(phi_angles)
+            locs[:, 1] = trans_loc[0] * np.sin(phi_angles)
+            locs[:, 2] = trans_loc[2]
+            for loc, phi_angle in zip(locs, phi_angles.tolist()):
+                # rotations of the normal defined by 2 extrinsic rotations
+                dome_leds.append({'name': str(len(dome_leds)), 'kind': kind,
+                                  'loc': loc,
+                                  'loc_sig': [1.0, 1.0, 1.0],
+                                  'rot_axes': 'yz',
+                                  'rot_angles': [angle, phi_angle],
+                                  'rot_angles_sig': [0.01, 0.01]})
+        return dome_leds
+
     def get_xy_points(self, place_info, feature='base', device_for_coordinate_system=None):
         """Return set of points that shows features on x-y plane (z=0)
         To show feedthrough, set feature='feedthrough'
@@ -317,21 +276,75 @@ class MPMT(Device):
             elif n == 2:
                 xy_points = self.fd_feedthough2_xy_points
 
-        return self.get_transformed_points(xy_points, place_info, device_for_coordinate_system)
+        # the transformed points are kept until the placements change
+        return self.get_derived(('xy_points', feature), place_info, device_for_coordinate_system,
+                                lambda: self.get_transformed_points(xy_points, place_info, device_for_coordinate_system))
 
     def get_fiducials(self, place_info, device_for_coordinate_system=None, z_offset = 0.):
         """Return the set of fiducial points for surveying (locations of the corner cube reflectors)
            * z_offset specifies the total offset due to target holders and plate thickness etc"""
-        fiducials = copy.deepcopy(self.fiducials)
-        for fiducial in fiducials:
-            fiducial[2] += z_offset
-        return self.get_transformed_points(fiducials, place_info, device_for_coordinate_system)
-
-    def __init__(self, name, container=None, kind='ME', place_design={}, place_true={}):
+        fiducials = np.array(self.fiducials)
+        fiducials[:, 2] += z_offset
+        return self.get_derived(('fiducials', float(z_offset)), place_info, device_for_coordinate_system,
+                                lambda: self.get_transformed_points(fiducials, place_info, device_for_coordinate_system))
+
+    @property
+    def pmts(self):
+        """The PMTs in the mPMT (in lazy mode, created and placed when first accessed)"""
+        if self._pmts is None:
+            self._pmts = self.place_devices(PMT, self.pmts_design, self.kind)
+        return self._pmts
+
+    @pmts.setter
+    def pmts(self, pmts):
+        self._pmts = pmts
+
+    @property
+    def leds(self):
+        """The LEDs in the mPMT (in lazy mode, created and placed when first accessed)"""
+        if self._leds is None:
+            self._leds = self.place_devices(LED, self.leds_design, self.kind)
+        return self._leds
+
+    @leds.setter
+    def leds(self, leds):
+        self._leds = leds
+
+    def get_sub_devices(self):
+        """Return the list of devices placed directly in this mPMT (PMTs and LEDs that have been created)"""
+        return [device for device in (self._pmts or []) + (self._leds or []) if device is not None]
+
+    def get_devices(self, devices):
+        """Return the list of all devices of the specified type contained in this mPMT.
+        In lazy mode, only the PMTs or LEDs that are asked for are created."""
+        if devices == 'pmts':
+            return [pmt for pmt in self.pmts if pmt is not None]
+        if devices == 'leds':
+            return [led for led in self.leds if led is not None]
+        return []
+
+    def __getstate__(self):
+        # save the PMTs and LEDs under their usual names (they are created if not done already)
+        state = super().__getstate__()
+        state.pop('_pmts', None)
+        state.pop('_leds', None)
+        state['pmts'] = self.pmts
+        state['leds'] = self.leds
+        return state
+
+    def __setstate__(self, state):
+        self._pmts = None
+        self._leds = None
+        super().__setstate__(state)
+
+    def __init__(self, name, container=None, kind='ME', place_design={}, place_true={}, lazy=False):
         super().__init__(MPMT, name, container, kind, place_design, place_true)
 
-        # create and place the set of PMTs
-        self.pmts = self.place_devices(PMT, self.pmts_design, kind)
-
-        # create and place the set of LEDs
-        self.leds = self.place_devices(LED, self.leds_design, kind)
+        # create and place the set of PMTs and the set of LEDs.
+        # If lazy, they are only created (and randomized) when first accessed, which saves time and memory
+        # when only the mPMT placements are needed.
+        self._pmts = None
+        self._leds = None
+        if not lazy:
+            self._pmts = self.place_devices(PMT, self.pmts_design, kind)
+            self._leds = self.place_devices(LED, self.leds_design, kind)
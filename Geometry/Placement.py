@@ -0,0 +1,304 @@
+import itertools
+import weakref
+import numpy as np
+
+# all placements draw their versions from one counter, so a version number is never reused
+_versions = itertools.count(1)
+
+
+class Placement(dict):
+    """
+    Placement: a placement dictionary ('loc', 'rot_axes', 'rot_angles') that keeps track of changes.
+
+    The version number changes whenever the placement is modified. Lists and arrays stored as 'loc' or
+    'rot_angles' are tracked as well, so that changing an element, e.g. place_est['loc'][2] += 10.,
+    also changes the version. The devices holding the placement (its owners) are told of every change, so that
+    they discard their cached transformations (see Device.set_dirty).
+
+    The rotation given by 'rot_axes' and 'rot_angles' is compiled to a rotation matrix (and quaternion) when
+    first needed, and kept until the placement is modified, so that the Euler angles are not parsed again for each
+    transformation. A placement can also be made from a rotation matrix or quaternion (from_matrix, from_quat).
+
+    When pickled or deep copied, the tracked values are saved as ordinary lists and arrays.
+    """
+
+    tracked_keys = ('loc', 'rot_angles')
+
+    # placements are numerous (several for each device), so their attributes are kept in slots
+    __slots__ = ('version', 'owners', 'pending', '_matrix', '_quat')
+
+    def __init__(self, *args, **kwargs):
+        # the dictionary is filled by update, so that the values are tracked
+        self.version = next(_versions)
+        # the devices holding the placement: ((device, place_info), ...)
+        self.owners = ()
+        # (device, attribute name) of an empty placement returned for a placement that a device does not have:
+        # it is given to the device when it is first modified
+        self.pending = None
+        # the compiled rotation: matrix and quaternion (None until needed)
+        self._matrix = None
+        self._quat = None
+        if kwargs or (args and args[0]):
+            self.update(*args, **kwargs)
+
+    @classmethod
+    def pending_for(cls, device, name):
+        """Return an empty placement that becomes device.<name> when it is first modified"""
+        placement = cls()
+        placement.pending = (device, name)
+        return placement
+
+    def touch(self):
+        """Mark the placement as modified"""
+        self.version = next(_versions)
+        self._matrix = None
+        self._quat = None
+        if self.pending is not None:
+            device, name = self.pending
+            self.pending = None
+            # the device stores the placement and is informed of the change
+            setattr(device, name, self)
+            return
+        for owner, place_info in self.owners:
+            if isinstance(owner, weakref.ref):
+                owner = owner()
+                if owner is None:
+                    continue
+            owner.set_dirty(place_info)
+
+    def add_owner(self, device, place_info, weak=False):
+        """Inform the device (as its place_<place_info>) of changes to the placement. A weak owner (e.g. a clone
+        sharing the design placement of a device) does not keep the device from being deleted."""
+        owners = self.owners
+        if owners:
+            # owners that have been deleted are removed
+            owners = tuple((owner, info) for owner, info in owners
+                           if not isinstance(owner, weakref.ref) or owner() is not None)
+        self.owners = owners + ((weakref.ref(device) if weak else device, place_info),)
+
+    def remove_owner(self, device, place_info):
+        """Stop informing the device of changes to the placement"""
+        self.owners = tuple((owner, info) for owner, info in self.owners
+                            if (owner() if isinstance(owner, weakref.ref) else owner) is not device
+                            or info != place_info)
+
+    @classmethod
+    def from_matrix(cls, matrix, rot_axes='ZYX', loc=(0., 0., 0.)):
+        """Return a placement with the rotation matrix (3,3) described by Euler angles for rot_axes (3 axes)"""
+        # scipy.spatial is imported when first needed, as it takes much longer to import than this package
+        from scipy.spatial.transform import Rotation
+        return cls._from_rotation(Rotation.from_matrix(matrix), rot_axes, loc)
+
+    @classmethod
+    def from_quat(cls, quat, rot_axes='ZYX', loc=(0., 0., 0.)):
+        """Return a placement with the rotation quaternion (x, y, z, w) described by Euler angles for rot_axes"""
+        from scipy.spatial.transform import Rotation
+        return cls._from_rotation(Rotation.from_quat(quat), rot_axes, loc)
+
+    @classmethod
+    def _from_rotation(cls, rotation, rot_axes, loc):
+        placement = cls({'loc': list(np.array(loc, dtype=float)), 'rot_axes': rot_axes,
+                         'rot_angles': list(rotation.as_euler(rot_axes))})
+        placement.compile(rotation.as_matrix())
+        return placement
+
+    @property
+    def is_compiled(self):
+        """True if the rotation matrix is up to date with the Euler angles"""
+        return self._matrix is not None
+
+    def compile(self, matrix=None):
+        """Calculate the rotation matrix from the Euler angles, or keep the matrix given, if it is already known
+        to be the rotation for the current angles"""
+        if matrix is None:
+            if 'rot_axes' in self:
+                from scipy.spatial.transform import Rotation
+                matrix = Rotation.from_euler(self['rot_axes'], self['rot_angles']).as_matrix()
+            else:
+                matrix = np.identity(3)
+        matrix = np.array(matrix, dtype=float)
+        matrix.flags.writeable = False
+        self._matrix = matrix
+
+    def get_matrix(self):
+        """Return the rotation matrix (read-only)"""
+        if self._matrix is None:
+            self.compile()
+        return self._matrix
+
+    def get_quat(self):
+        """Return the rotation quaternion (x, y, z, w) (read-only)"""
+        if self._quat is None:
+            from scipy.spatial.transform import Rotation
+            quat = Rotation.from_matrix(self.get_matrix()).as_quat()
+            quat.flags.writeable = False
+            self._quat = quat
+        return self._quat
+
+    def _track(self, key, value):
+        if key in self.tracked_keys:
+            if isinstance(value, list):
+                return TrackedList(value, self)
+            if isinstance(value, np.ndarray):
+                return TrackedArray(value, self)
+        return value
+
+    def to_dict(self):
+        """Return a copy as an ordinary dictionary, with ordinary lists and arrays"""
+        plain = {}
+        for key, value in self.items():
+            if isinstance(value, TrackedList):
+                value = list(value)
+            elif isinstance(value, TrackedArray):
+                value = np.array(value)
+            plain[key] = value
+        return plain
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, self._track(key, value))
+        self.touch()
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self.touch()
+
+    def update(self, *args, **kwargs):
+        if len(args) == 1 and not kwargs and isinstance(args[0], dict):
+            items = args[0].items()
+        else:
+            items = dict(*args, **kwargs).items()
+        set_item = super().__setitem__
+        for key, value in items:
+            set_item(key, self._track(key, value))
+        self.touch()
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def pop(self, *args):
+        value = super().pop(*args)
+        self.touch()
+        return value
+
+    def popitem(self):
+        item = super().popitem()
+        self.touch()
+        return item
+
+    def clear(self):
+        super().clear()
+        self.touch()
+
+    def copy(self):
+        return self.to_dict()
+
+    @classmethod
+    def from_lists(cls, loc, rot_axes, rot_angles):
+        """Return a placement from a list of 3 floats, the rotation axes, and a list of floats (or a scalar) for the
+        angles, without the checks made by the constructor (faster, for placements made in bulk)"""
+        placement = cls()
+        set_item = dict.__setitem__
+        tracked = TrackedList.__new__(TrackedList)
+        list.extend(tracked, loc)
+        tracked.placement = placement
+        set_item(placement, 'loc', tracked)
+        set_item(placement, 'rot_axes', rot_axes)
+        if isinstance(rot_angles, list):
+            tracked = TrackedList.__new__(TrackedList)
+            list.extend(tracked, rot_angles)
+            tracked.placement = placement
+            rot_angles = tracked
+        set_item(placement, 'rot_angles', rot_angles)
+        return placement
+
+    def duplicate(self):
+        """Return a copy as a new Placement, with the same compiled rotation (faster than Placement(self))"""
+        placement = Placement()
+        set_item = dict.__setitem__
+        for key, value in self.items():
+            if isinstance(value, TrackedList):
+                tracked = TrackedList.__new__(TrackedList)
+                list.extend(tracked, value)
+                tracked.placement = placement
+                value = tracked
+            elif isinstance(value, TrackedArray):
+                value = TrackedArray(value, placement)
+            set_item(placement, key, value)
+        placement._matrix = self._matrix
+        placement._quat = self._quat
+        return placement
+
+    def __reduce__(self):
+        return Placement, (self.to_dict(),)
+
+
+class TrackedList(list):
+    """A list stored in a placement that marks the placement as modified when it is changed.
+    Numpy scalars are stored as python floats, which take less memory."""
+
+    __slots__ = ('placement',)
+
+    def __init__(self, values, placement):
+        super().__init__([float(value) if isinstance(value, np.floating) else value for value in values])
+        self.placement = placement
+
+    def __reduce__(self):
+        return list, (list(self),)
+
+
+def _touching(method):
+    def tracked_method(self, *args):
+        result = method(self, *args)
+        self.placement.touch()
+        return result
+    tracked_method.__name__ = method.__name__
+    return tracked_method
+
+
+for _method in ['__setitem__', '__delitem__', '__iadd__', '__imul__', 'append', 'extend', 'insert', 'pop', 'remove',
+                'clear', 'sort', 'reverse']:
+    setattr(TrackedList, _method, _touching(getattr(list, _method)))
+
+
+class TrackedArray(np.ndarray):
+    """An array stored in a placement that marks the placement as modified when it is changed.
+    Views and the results of calculations are ordinary arrays."""
+
+    def __new__(cls, values, placement):
+        tracked = np.array(values).view(cls)
+        tracked.placement = placement
+        return tracked
+
+    def __array_finalize__(self, obj):
+        self.placement = None
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        if self.placement is not None:
+            self.placement.touch()
+
+    def __array_ufunc__(self, ufunc, method, *inputs, out=None, **kwargs):
+        inputs = tuple(np.asarray(x) if isinstance(x, TrackedArray) else x for x in inputs)
+        if out is not None:
+            kwargs['out'] = tuple(np.asarray(x) if isinstance(x, TrackedArray) else x for x in out)
+        result = getattr(ufunc, method)(*inputs, **kwargs)
+        if out is not None:
+            # in place operations, e.g. loc += [1., 0., 0.]
+            for x in out:
+                if isinstance(x, TrackedArray) and x.placement is not None:
+                    x.placement.touch()
+            if len(out) == 1:
+                return out[0]
+        return result
+
+    def __repr__(self):
+        return repr(np.asarray(self))
+
+    def __reduce__(self):
+        return np.asarray(self).copy().__reduce__()
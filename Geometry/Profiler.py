@@ -0,0 +1,164 @@
+"""
+Profiler: count and time the calls to the main Device methods, by device class and placement type
+
+The methods are only instrumented while the profiler is enabled, so there is no cost otherwise:
+
+    >>> with Profiler() as profiler:
+    ...     wcte = WCD('wcte', kind='WCTE')
+    ...     wcte.get_placements('pmts', 'design')
+    >>> profiler.print_summary()
+    >>> profiler.save_report('profile.json')
+
+The methods of Device (and of the subclasses that override them) listed in Profiler.methods are replaced by timed
+wrappers when the profiler is started, and restored when it is stopped. For each (class, method, place_info) the
+report gives the number of calls, the total time (including the time in other instrumented methods called by it,
+so that recursive calls are counted more than once) and the own time (excluding that time).
+"""
+
+import inspect
+import json
+import time
+
+from Geometry.Device import Device
+from Geometry.Placement import Placement
+from Geometry.Sampler import Sampler
+
+
+class Profiler:
+    """Counts and times the calls to Device methods while enabled"""
+
+    # the methods to instrument: for Device, also those of its subclasses that override them
+    methods = {
+        Device: ['randomly_set_properties', 'set_placement', 'place_devices', 'get_sub_devices', 'get_devices',
+                 'get_local_transform', 'get_transform', 'get_relative_transform', 'get_relative_transforms',
+                 'get_derived', 'set_dirty', 'get_placements', 'get_specified_container', 'get_placement',
+                 'get_transformed_points', 'get_circle_points', 'get_xy_points', 'get_fiducials', '__getstate__',
+                 '__setstate__', 'save_json', 'save_json_files', 'save_file', 'open_file'],
+        Placement: ['compile'],
+        Sampler: ['draw_values', 'draw_properties', 'draw_placements'],
+    }
+
+    # the profiler that is enabled (only one at a time)
+    active = None
+
+    def __init__(self):
+        # statistics keyed by (class name, method name, place_info): [calls, total time, own time]
+        self.stats = {}
+        self.originals = []
+        # the times spent in instrumented methods called by the methods being timed
+        self.child_times = []
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def start(self):
+        """Instrument the methods"""
+        if Profiler.active is not None:
+            raise RuntimeError('Profiler: another profiler is already enabled.')
+        Profiler.active = self
+        for base_class, names in self.methods.items():
+            for cls in [base_class] + self.get_subclasses(base_class):
+                for name in names:
+                    if name in cls.__dict__:
+                        self.originals.append((cls, name, cls.__dict__[name]))
+                        setattr(cls, name, self.wrap(cls.__dict__[name], name, cls))
+
+    def stop(self):
+        """Restore the original methods"""
+        for cls, name, original in reversed(self.originals):
+            setattr(cls, name, original)
+        self.originals = []
+        Profiler.active = None
+
+    def reset(self):
+        """Discard the statistics collected so far"""
+        self.stats = {}
+
+    @staticmethod
+    def get_subclasses(cls):
+        """Return all of the subclasses of a class, at any level"""
+        subclasses = []
+        for subclass in cls.__subclasses__():
+            subclasses.append(subclass)
+            subclasses.extend(Profiler.get_subclasses(subclass))
+        return subclasses
+
+    def wrap(self, method, name, cls):
+        """Return a timed version of a method (or classmethod or staticmethod) of a class. The calls are counted
+        under the class of the instance (for a method), the class called (for a classmethod), or the class that
+        defines it (for a staticmethod)."""
+        if isinstance(method, staticmethod):
+            return staticmethod(self.wrap_function(method.__func__, name, lambda args: cls.__name__))
+        if isinstance(method, classmethod):
+            return classmethod(self.wrap_function(method.__func__, name, lambda args: args[0].__name__))
+        return self.wrap_function(method, name, lambda args: type(args[0]).__name__)
+
+    def wrap_function(self, method, name, get_class_name):
+        """Return a timed version of a function, with the class name given by get_class_name(args)"""
+        # the position of the place_info argument, if any
+        parameters = list(inspect.signature(method).parameters)
+        place_info_index = parameters.index('place_info') if 'place_info' in parameters else None
+        stats = self.stats
+        child_times = self.child_times
+        perf_counter = time.perf_counter
+
+        def timed_method(*args, **kwargs):
+            place_info = None
+            if place_info_index is not None:
+                if len(args) > place_info_index:
+                    place_info = args[place_info_index]
+                else:
+                    place_info = kwargs.get('place_info')
+            class_name = get_class_name(args)
+
+            child_times.append(0.)
+            start = perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                elapsed = perf_counter() - start
+                children = child_times.pop()
+                if child_times:
+                    child_times[-1] += elapsed
+                key = (class_name, name, place_info)
+                entry = stats.get(key)
+                if entry is None:
+                    entry = stats[key] = [0, 0., 0.]
+                entry[0] += 1
+                entry[1] += elapsed
+                entry[2] += elapsed - children
+
+        timed_method.__name__ = method.__name__
+        timed_method.__doc__ = method.__doc__
+        timed_method.__wrapped__ = method
+        return timed_method
+
+    def get_report(self):
+        """Return the statistics as a list of dictionaries, in decreasing order of own time"""
+        report = [{'class': class_name, 'method': name, 'place_info': place_info, 'calls': calls,
+                   'total_time': total_time, 'own_time': own_time}
+                  for (class_name, name, place_info), (calls, total_time, own_time) in self.stats.items()]
+        return sorted(report, key=lambda entry: entry['own_time'], reverse=True)
+
+    def get_summary(self, n_row=None):
+        """Return the statistics as a table (the n_row methods with the most own time)"""
+        lines = ['{:10s} {:28s} {:10s} {:>10s} {:>12s} {:>12s}'.format(
+            'class', 'method', 'place_info', 'calls', 'total (s)', 'own (s)')]
+        for entry in self.get_report()[:n_row]:
+            lines.append('{:10s} {:28s} {:10s} {:10d} {:12.4f} {:12.4f}'.format(
+                entry['class'], entry['method'], str(entry['place_info'] or ''), entry['calls'], entry['total_time'],
+                entry['own_time']))
+        return '\n'.join(lines)
+
+    def print_summary(self, n_row=None):
+        """Print the statistics as a table"""
+        print(self.get_summary(n_row))
+
+    def save_report(self, filename):
+        """Save the statistics in a json file"""
+        with open(filename, 'w') as f:
+            json.dump(self.get_report(), f, indent=2)
@@ -0,0 +1,211 @@
+"""
+RenderGeometry: line drawings of whole detectors, for viewers
+
+The outlines drawn in the example notebooks (mPMT baseplates, feedthroughs and survey holes, PMT faces, camera domes
+and housings) and the axes of the mPMTs and cameras are made for all devices of a detector at once. The outline of
+each feature is transformed with the placements of all devices of a type (from get_placements), so no calculation is
+done device by device. The drawing is a set of vertices (N,3) with colours (N,3), and line segments (M,2) given by
+the indices of their two vertices:
+
+    >>> render = RenderGeometry.build(wcte, 'design')
+    >>> render.vertices.shape, render.segments.shape
+    >>> render.save('wcte.glb')   # or 'wcte.ply'
+
+The segments of each feature are given by render.groups, e.g. render.segments[slice(*render.groups['pmt_face'])].
+The files are binary PLY (vertex and edge elements) or glTF binary (a single mesh of lines with vertex colours),
+which can be opened by most 3D viewers (e.g. MeshLab, Blender, three.js). The coordinates are in mm: use scale=0.001
+for viewers that expect metres.
+"""
+
+import json
+import struct
+from pathlib import Path
+
+import numpy as np
+
+from Geometry.MPMT import MPMT, get_circle_xy_points
+
+
+def get_loop_segments(n_point, start=0):
+    """Return the (n_point,2) vertex indices of the segments of a closed loop of points"""
+    indices = np.arange(n_point)
+    return np.stack([indices, (indices + 1) % n_point], axis=1) + start
+
+
+class RenderGeometry:
+    """Vertices, colours and line segments of a detector drawing"""
+
+    # colours (red, green, blue) of the features
+    colors = {'mpmt': (0xab, 0xb2, 0xb9), 'pmt': (0x34, 0x98, 0xdb), 'camera': (0xed, 0x4e, 0xf2),
+              'axis_x': (0xff, 0x00, 0x00), 'axis_y': (0x00, 0xff, 0x00), 'axis_z': (0x00, 0x00, 0xff)}
+
+    # number of points in the circles of PMT faces and cameras
+    n_circle = 20
+
+    def __init__(self, vertices, segments, colors, groups):
+        self.vertices = vertices
+        self.segments = segments
+        self.colors = colors
+        # the range of segments (start, stop) of each feature
+        self.groups = groups
+
+    @classmethod
+    def build(cls, device, place_info='design', prop_info='design', features=('mpmts', 'pmts', 'cameras', 'axes'),
+              axis_length=100.):
+        """Make the drawing of a device (e.g. a WCD) with the placements and properties specified.
+        * features: the devices to draw ('mpmts', 'pmts', 'cameras'), and 'axes' for the mPMT and camera axes
+        * axis_length: the length (mm) of the axes
+        """
+        parts = []
+        if 'mpmts' in features:
+            placements = device.get_placements('mpmts', place_info)
+            kinds = np.array([mpmt.kind for mpmt in placements['devices']])
+            survey_holes = list(MPMT.survey_holes_xy_points)
+            for kind, loops in [('ME', [MPMT.base_xy_points, MPMT.feedthough_xy_points] + survey_holes),
+                                ('FD', [MPMT.fd_base_xy_points, MPMT.fd_feedthough1_xy_points,
+                                        MPMT.fd_feedthough2_xy_points] + survey_holes)]:
+                selected = kinds == 'FD' if kind == 'FD' else kinds != 'FD'
+                parts.append(('mpmt_' + kind, 'mpmt', cls.get_loops(placements, selected, loops)))
+
+        if 'pmts' in features:
+            placements = device.get_placements('pmts', place_info)
+            radii = cls.get_property(placements['devices'], prop_info, 'size') / 2.
+            circle = get_circle_xy_points([0., 0.], 1., cls.n_circle)
+            parts.append(('pmt_face', 'pmt', cls.get_loops(placements, np.isfinite(radii),
+                                                           [radii[:, None, None] * circle])))
+
+        if 'cameras' in features:
+            placements = device.get_placements('cameras', place_info)
+            cameras = placements['devices']
+            circle = get_circle_xy_points([0., 0.], 1., cls.n_circle)
+            dome = cls.get_property(cameras, prop_info, 'size')[:, None, None] / 2. * circle
+            housing = cls.get_property(cameras, prop_info, 'housing_size')[:, None, None] / 2. * circle
+            back_housing = housing.copy()
+            back_housing[:, :, 2] = -cls.get_property(cameras, prop_info, 'housing_length')[:, None]
+            loops = [dome, housing, back_housing]
+            selected = np.all([np.isfinite(loop).all(axis=(1, 2)) for loop in loops], axis=0)
+            parts.append(('camera', 'camera', cls.get_loops(placements, selected, loops)))
+
+        if 'axes' in features:
+            for devices in ['mpmts', 'cameras']:
+                placements = device.get_placements(devices, place_info)
+                selected = np.isfinite(placements['location']).all(axis=1)
+                origins = placements['location'][selected]
+                for i_axis, axis in enumerate('xyz'):
+                    ends = origins + axis_length * placements['rotation'][selected][:, :, i_axis]
+                    vertices = np.stack([origins, ends], axis=1).reshape(-1, 3)
+                    segments = np.arange(len(vertices)).reshape(-1, 2)
+                    parts.append((devices[:-1] + '_axis_' + axis, 'axis_' + axis, (vertices, segments)))
+
+        return cls.from_parts(parts)
+
+    @classmethod
+    def from_parts(cls, parts):
+        """Make the drawing from a list of (group name, colour name, (vertices, segments)) of the features"""
+        vertices, segments, colors, groups = [], [], [], {}
+        n_vertex, n_segment = 0, 0
+        for name, color, (part_vertices, part_segments) in parts:
+            vertices.append(part_vertices)
+            segments.append(part_segments + n_vertex)
+            colors.append(np.broadcast_to(np.array(cls.colors[color], dtype=np.uint8), part_vertices.shape))
+            groups[name] = (n_segment, n_segment + len(part_segments))
+            n_vertex += len(part_vertices)
+            n_segment += len(part_segments)
+        if not parts:
+            return cls(np.zeros((0, 3), dtype=np.float32), np.zeros((0, 2), dtype=np.uint32),
+                       np.zeros((0, 3), dtype=np.uint8), groups)
+        return cls(np.concatenate(vertices).astype(np.float32), np.concatenate(segments).astype(np.uint32),
+                   np.concatenate(colors), groups)
+
+    @staticmethod
+    def get_property(devices, prop_info, key):
+        """Return an array of a property of the devices (NaN if missing)"""
+        values = [(device.get_properties(prop_info) or {}).get(key) for device in devices]
+        return np.array([np.nan if value is None else value for value in values], dtype=float)
+
+    @staticmethod
+    def get_loops(placements, selected, loops):
+        """Return the vertices and segments of closed loops of points for the selected devices.
+        Each loop is given in the device coordinate system, either (n_point,3) for all devices or
+        (n_device,n_point,3) for each device.
+        """
+        n_device = len(placements['devices'])
+        selected = selected & np.isfinite(placements['location']).all(axis=1)
+        rotations = placements['rotation'][selected]
+        locations = placements['location'][selected]
+        local_points = np.concatenate([np.broadcast_to(loop, (n_device,) + np.shape(loop)[-2:])[selected]
+                                       for loop in loops], axis=1)
+        n_point = local_points.shape[1]
+        vertices = np.einsum('nij,npj->npi', rotations, local_points) + locations[:, None, :]
+
+        loop_segments = []
+        start = 0
+        for loop in loops:
+            loop_segments.append(get_loop_segments(np.shape(loop)[-2], start))
+            start += np.shape(loop)[-2]
+        loop_segments = np.concatenate(loop_segments)
+        segments = loop_segments[None, :, :] + n_point * np.arange(len(locations))[:, None, None]
+        return vertices.reshape(-1, 3), segments.reshape(-1, 2)
+
+    def save(self, filename, scale=1.):
+        """Save the drawing in a PLY (.ply) or glTF binary (.glb) file"""
+        suffix = Path(filename).suffix.lower()
+        if suffix == '.ply':
+            self.save_ply(filename, scale)
+        elif suffix == '.glb':
+            self.save_glb(filename, scale)
+        else:
+            raise ValueError('RenderGeometry: unknown file type: ' + str(filename) + '. Use .ply or .glb')
+
+    def save_ply(self, filename, scale=1.):
+        """Save the drawing in a binary PLY file, with vertex and edge elements"""
+        vertices = np.zeros(len(self.vertices), dtype=[('x', '<f4'), ('y', '<f4'), ('z', '<f4'),
+                                                       ('red', 'u1'), ('green', 'u1'), ('blue', 'u1')])
+        for i, coordinate in enumerate('xyz'):
+            vertices[coordinate] = self.vertices[:, i] * scale
+        for i, color in enumerate(['red', 'green', 'blue']):
+            vertices[color] = self.colors[:, i]
+        header = '\n'.join(['ply', 'format binary_little_endian 1.0', 'comment WCTE Geometry drawing',
+                            'element vertex ' + str(len(vertices)),
+                            'property float x', 'property float y', 'property float z',
+                            'property uchar red', 'property uchar green', 'property uchar blue',
+                            'element edge ' + str(len(self.segments)),
+                            'property int vertex1', 'property int vertex2', 'end_header']) + '\n'
+        with open(filename, 'wb') as f:
+            f.write(header.encode('ascii'))
+            f.write(vertices.tobytes())
+            f.write(self.segments.astype('<i4').tobytes())
+
+    def save_glb(self, filename, scale=1.):
+        """Save the drawing in a glTF binary file, as a mesh of lines with vertex colours"""
+        vertices = (self.vertices * scale).astype('<f4')
+        # the colours are padded to 4 bytes per vertex, as required for the vertex attributes
+        colors = np.zeros((len(vertices), 4), dtype=np.uint8)
+        colors[:, :3] = self.colors
+        colors[:, 3] = 255
+        buffers = [vertices.tobytes(), colors.tobytes(), self.segments.astype('<u4').tobytes()]
+        offsets = np.cumsum([0] + [len(buffer) for buffer in buffers]).tolist()
+        gltf = {
+            'asset': {'version': '2.0', 'generator': 'WCTE Geometry'},
+            'scene': 0, 'scenes': [{'nodes': [0]}], 'nodes': [{'mesh': 0}],
+            'meshes': [{'primitives': [{'attributes': {'POSITION': 0, 'COLOR_0': 1}, 'indices': 2, 'mode': 1}]}],
+            'buffers': [{'byteLength': offsets[-1]}],
+            'bufferViews': [{'buffer': 0, 'byteOffset': offsets[0], 'byteLength': len(buffers[0]), 'target': 34962},
+                            {'buffer': 0, 'byteOffset': offsets[1], 'byteLength': len(buffers[1]), 'target': 34962},
+                            {'buffer': 0, 'byteOffset': offsets[2], 'byteLength': len(buffers[2]), 'target': 34963}],
+            'accessors': [{'bufferView': 0, 'componentType': 5126, 'count': len(vertices), 'type': 'VEC3',
+                           'min': vertices.min(axis=0).tolist() if len(vertices) else [0., 0., 0.],
+                           'max': vertices.max(axis=0).tolist() if len(vertices) else [0., 0., 0.]},
+                          {'bufferView': 1, 'componentType': 5121, 'normalized': True, 'count': len(vertices),
+                           'type': 'VEC4'},
+                          {'bufferView': 2, 'componentType': 5125, 'count': self.segments.size, 'type': 'SCALAR'}]}
+        json_chunk = json.dumps(gltf, separators=(',', ':')).encode()
+        json_chunk += b' ' * (-len(json_chunk) % 4)
+        binary_chunk = b''.join(buffers)
+        binary_chunk += b'\0' * (-len(binary_chunk) % 4)
+        with open(filename, 'wb') as f:
+            f.write(struct.pack('<4sII', b'glTF', 2, 12 + 8 + len(json_chunk) + 8 + len(binary_chunk)))
+            f.write(struct.pack('<I4s', len(json_chunk), b'JSON'))
+            f.write(json_chunk)
+            f.write(struct.pack('<I4s', len(binary_chunk), b'BIN\0'))
+            f.write(binary_chunk)
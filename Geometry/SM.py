@@ -3,8 +3,9 @@ from Geometry.MPMT import MPMT
 from Geometry.CAMERA import CAMERA
 from Geometry.TARGET import TARGET
 
+from Geometry.DesignTable import DesignTable, DesignList
+
 import numpy as np
-from scipy.spatial.transform import Rotation
 
 
 class SM(Device):
@@ -12,12 +13,16 @@ class SM(Device):
     It can also contain cameras and targets. It only has geometry information, no other properties.
     """
 
+    # design dictionaries used to place the sub-devices in each list
+    design_tables = {'sms': 'devices_design', 'mpmts': 'devices_design', 'cameras': 'cameras_design',
+                     'targets': 'targets_design'}
+
     # A dictionary of device kinds and placements in the super module:
-    devices_design = {}
+    devices_design = DesignTable()
     # A dictionary of camera kinds and placements in the super module:
-    cameras_design = {}
+    cameras_design = DesignTable()
     # A dictionary of target kinds and placements in the super module:
-    targets_design = {}
+    targets_design = DesignTable()
 
     ssm_mpmts = []
     # 3 x 2 rectangular pattern of MPMTs (for testing):
@@ -61,69 +66,35 @@ class SM(Device):
     # Origin and z-axis coincides with that of centre mPMT origin.
     # Ordering of MPTs increases with phi. Second mPMT is displaced along SM +x axis.
 
-    bottom_mpmts = []
-
     # Start with mPMT at centre of bottom
     offsets = [[0., 0., 0.]]
 
-    offs = [-tb_pitch, 0, tb_pitch]
-    for i in range(8):
-        offset = [offs[[2, 2, 1, 0, 0, 0, 1, 2][i]], offs[[1, 2, 2, 2, 1, 0, 0, 0][i]], 0.]
-        offsets.append(offset)
+    offs = np.array([-tb_pitch, 0, tb_pitch])
+    offsets += np.stack([offs[[2, 2, 1, 0, 0, 0, 1, 2]], offs[[1, 2, 2, 2, 1, 0, 0, 0]], np.zeros(8)], axis=1).tolist()
 
-    offs = [-2. * tb_pitch, -tb_pitch, 0, tb_pitch, 2. * tb_pitch]
-    for i in range(12):
-        offset = [offs[[4, 4, 3, 2, 1, 0, 0, 0, 1, 2, 3, 4][i]], offs[[2, 3, 4, 4, 4, 3, 2, 1, 0, 0, 0, 1][i]], 0.]
-        offsets.append(offset)
+    offs = np.array([-2. * tb_pitch, -tb_pitch, 0, tb_pitch, 2. * tb_pitch])
+    offsets += np.stack([offs[[4, 4, 3, 2, 1, 0, 0, 0, 1, 2, 3, 4]], offs[[2, 3, 4, 4, 4, 3, 2, 1, 0, 0, 0, 1]],
+                         np.zeros(12)], axis=1).tolist()
 
     # rotate mPMTs to put feed-throughs in correct orientations... pi multiplier starting at #0
-    y_rots = [0, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0]
-    y_rots = [0.5, 0.5, 0.5, 1.5, 1.5, 1.5, 1.5, 1.5, 0.5, 0.5, 0.5, 0.5, 0.5, 1.5, 1.5, 1.5, 1.5, 1.5, 1.5, 0.5, 0.5]
+    bottom_y_rots = [0.5, 0.5, 0.5, 1.5, 1.5, 1.5, 1.5, 1.5, 0.5, 0.5, 0.5, 0.5, 0.5, 1.5, 1.5, 1.5, 1.5, 1.5, 1.5, 0.5,
+                     0.5]
 
     mpmt_kinds = ['ME']*12 + ['FD','ME','FD','ME','FD','ME','FD','ME','ME']
 
-    for i, (offset, y_rot, mpmt_kind) in enumerate(zip(offsets, y_rots, mpmt_kinds)):
-        location = offset.copy()
-        if i in [12, 14, 16, 18]:
-            location[2] = 7.775  # mm offset for FD mPMTs
-        bottom_mpmts.append({
-            'kind': mpmt_kind,
-            'loc': location,
-            'loc_sig': loc_sig,
-            'rot_axes': 'ZYX',
-            'rot_angles': [(y_rot + 0.5) * np.pi, 0., 0.],
-            'rot_angles_sig': [rot_angle_sig] * 3
-        })
-
-    devices_design['bottom'] = bottom_mpmts
-
-    bottom_cameras = []
+    # The layouts are built when first used (see build_bottom_mpmts etc.)
+    bottom_mpmts = DesignList('devices_design', 'bottom')
+    devices_design.add_builder('bottom', 'build_bottom_mpmts')
+
     # located at 4 corners of bottom super module
     # they are movable: for now, a typical location is given (same for all)
     camera_radius = 990 * np.sqrt(2)  # typically 990 mm transverse from centre
     camera_z_bot = 200.  # typically 200 mm
     camera_angle = 0.92729  # radians (sin(0.92729) = 0.8)
 
-    for i_cam in range(4):
-        # start with a camera located on the bottom endcap x axis
-        loc = [camera_radius, 0., camera_z_bot]
-        # now rotate it around the bottom endcap z axis
-        phi_angle = np.pi / 4. + 2. * np.pi * i_cam / 4
-        rot_phi = Rotation.from_euler('Z', phi_angle)
-        rot_loc = rot_phi.apply(loc)
-        # rotations of the normal defined by 3 rotations
-        rot_angles = [phi_angle + np.pi / 2., 0., -camera_angle]
-
-        bottom_cameras.append({'name': str(i_cam), 'kind': 'C',
-                               'loc': rot_loc,
-                               'loc_sig': [1.0, 1.0, 1.0],
-                               'rot_axes': 'ZYX',
-                               'rot_angles': rot_angles,
-                               'rot_angles_sig': [rot_angle_sig] * 3})
-
-    cameras_design['bottom'] = bottom_cameras
-
-    bottom_targets = []
+    bottom_cameras = DesignList('cameras_design', 'bottom')
+    cameras_design.add_builder('bottom', 'build_bottom_cameras')
+
     # located at a point extending from the support beams of bottom super module
     # they are not to be used to define the coordinate system of the super module
     # instead, they serve as references for determining the placement of the super module after full assembly
@@ -168,65 +139,28 @@ class SM(Device):
                  -1. * tb_pitch - dist_mpmt_to_beam_centre,
                  -dist_mpmt_to_beam_centre]
 
-    for i_target in range(16):
-        loc = [target_xs[i_target], target_ys[i_target], target_z]
-
-        bottom_targets.append({'name': str(i_target), 'kind': 'T',
-                               'loc': loc,
-                               'loc_sig': [1.0, 1.0, 1.0],
-                               'rot_axes': 'Z',
-                               'rot_angles': 0.,
-                               'rot_angles_sig': 0.})
+    bottom_target_z = target_z
 
-    targets_design['bottom'] = bottom_targets
+    bottom_targets = DesignList('targets_design', 'bottom')
+    targets_design.add_builder('bottom', 'build_bottom_targets')
 
     # Top super module:
     ###################
     # Constructed with the mPMTs z-axes pointing downwards, unlike the bottom super module.
     # Second mPMT is displaced along SM +x axis.
 
-    top_mpmts = []
-
     # as built:
-    y_rots = [0, 0.5, 0.5, 1.5, 1.5, 1.5, 0., 1.5, 0.5, 0.5, 0.5, 0.5, 1.5, 1.5, 0., 1.5, 1.5, 1.5, 1.5, 0.5, 0.5]
-
-    for offset, y_rot in zip(offsets, y_rots):
-        location = offset
-        top_mpmts.append({
-            'kind': 'ME',
-            'loc': location,
-            'loc_sig': loc_sig,
-            'rot_axes': 'ZYX',
-            'rot_angles': [(y_rot - 0.5) * np.pi, np.pi, 0.],
-            'rot_angles_sig': [rot_angle_sig] * 3
-        })
-
-    devices_design['top'] = top_mpmts
-
-    top_cameras = []
+    top_y_rots = [0, 0.5, 0.5, 1.5, 1.5, 1.5, 0., 1.5, 0.5, 0.5, 0.5, 0.5, 1.5, 1.5, 0., 1.5, 1.5, 1.5, 1.5, 0.5, 0.5]
+
+    top_mpmts = DesignList('devices_design', 'top')
+    devices_design.add_builder('top', 'build_top_mpmts')
+
     # located at 4 corners of top super module
     camera_z_top = 270.  # typically 270 mm
 
-    for i_cam in range(4):
-        # start with a camera located on the bottom endcap x axis
-        loc = [camera_radius, 0., -camera_z_top]
-        # now rotate it around the bottom endcap z axis
-        phi_angle = np.pi / 4. + 2. * np.pi * i_cam / 4
-        rot_phi = Rotation.from_euler('Z', phi_angle)
-        rot_loc = rot_phi.apply(loc)
-        # rotations of the normal defined by 2 extrinsic rotations
-        rot_angles = [phi_angle + np.pi / 2., 0., -np.pi / 2. - camera_angle]
-
-        top_cameras.append({'name': str(i_cam + 4), 'kind': 'C',
-                            'loc': rot_loc,
-                            'loc_sig': [1.0, 1.0, 1.0],
-                            'rot_axes': 'ZYX',
-                            'rot_angles': rot_angles,
-                            'rot_angles_sig': [rot_angle_sig] * 3})
+    top_cameras = DesignList('cameras_design', 'top')
+    cameras_design.add_builder('top', 'build_top_cameras')
 
-    cameras_design['top'] = top_cameras
-
-    top_targets = []
     # located at a point extending from the support beams of bottom super module
     # they are not to be used to define the coordinate system of the super module
     # instead, they serve as references for determining the placement of the super module after full assembly
@@ -234,52 +168,138 @@ class SM(Device):
 
     target_z = z_inner_top - height_inner_beam / 2.
 
-    for i_target in range(16):
-        loc = [target_xs[i_target], target_ys[i_target], target_z]
+    top_target_z = target_z
+
+    top_targets = DesignList('targets_design', 'top')
+    targets_design.add_builder('top', 'build_top_targets')
+
+    # Barrel super module:
+    ####################
+    # Origin on cylinder axis, z-axis along that axis, z=0 at centre of second from bottom row of
+    # mPMTs. Ordering of mPMTs increases with phi. Second mPMT is displaced along SM +x axis.
 
-        top_targets.append({'name': str(i_target), 'kind': 'T',
+    n_col = 16
+
+    barrel_mpmts = DesignList('devices_design', 'barrel')
+    devices_design.add_builder('barrel', 'build_barrel_mpmts')
+
+    @classmethod
+    def build_bottom_mpmts(cls):
+        """Return the design list of the mPMTs in the bottom super module"""
+        bottom_mpmts = []
+        for i, (offset, y_rot, mpmt_kind) in enumerate(zip(cls.offsets, cls.bottom_y_rots, cls.mpmt_kinds)):
+            location = offset.copy()
+            if i in [12, 14, 16, 18]:
+                location[2] = 7.775  # mm offset for FD mPMTs
+            bottom_mpmts.append({
+                'kind': mpmt_kind,
+                'loc': location,
+                'loc_sig': cls.loc_sig,
+                'rot_axes': 'ZYX',
+                'rot_angles': [(y_rot + 0.5) * np.pi, 0., 0.],
+                'rot_angles_sig': [cls.rot_angle_sig] * 3
+            })
+        return bottom_mpmts
+
+    @classmethod
+    def build_top_mpmts(cls):
+        """Return the design list of the mPMTs in the top super module"""
+        top_mpmts = []
+        for offset, y_rot in zip(cls.offsets, cls.top_y_rots):
+            top_mpmts.append({
+                'kind': 'ME',
+                'loc': offset,
+                'loc_sig': cls.loc_sig,
+                'rot_axes': 'ZYX',
+                'rot_angles': [(y_rot - 0.5) * np.pi, np.pi, 0.],
+                'rot_angles_sig': [cls.rot_angle_sig] * 3
+            })
+        return top_mpmts
+
+    @classmethod
+    def build_barrel_mpmts(cls):
+        """Return the design list of the mPMTs in the barrel super module"""
+        barrel_mpmts = []
+        # rotate the mPMTs around the barrel z axis
+        phi_angles = 2. * np.pi * np.arange(cls.n_col) / cls.n_col
+        for i_row in range(-1, 3):
+            locs = np.zeros((cls.n_col, 3))
+            locs[:, 0] = cls.wcte_diameter / 2. * np.cos(phi_angles)
+            locs[:, 1] = cls.wcte_diameter / 2. * np.sin(phi_angles)
+            locs[:, 2] = i_row * cls.barrel_vertical_pitch
+            for loc, phi_angle in zip(locs, phi_angles.tolist()):
+                # rotations of the normal defined by 3 extrinsic rotations
+                barrel_mpmts.append({'kind': 'ME',
+                                     'loc': loc,
+                                     'loc_sig': cls.loc_sig,
+                                     'rot_axes': 'ZYX',
+                                     'rot_angles': [np.pi, np.pi / 2., -phi_angle],
+                                     'rot_angles_sig': [cls.rot_angle_sig] * 3})
+        return barrel_mpmts
+
+    @classmethod
+    def build_cameras(cls, camera_z, tilt_angle, first_name):
+        """Return the design list of 4 cameras at the corners of an endcap super module"""
+        cameras = []
+        # start with cameras located on the endcap x axis, then rotate them around the endcap z axis
+        phi_angles = np.pi / 4. + 2. * np.pi * np.arange(4) / 4
+        locs = np.zeros((4, 3))
+        locs[:, 0] = cls.camera_radius * np.cos(phi_angles)
+        locs[:, 1] = cls.camera_radius * np.sin(phi_angles)
+        locs[:, 2] = camera_z
+        for i_cam, (loc, phi_angle) in enumerate(zip(locs, phi_angles.tolist())):
+            # rotations of the normal defined by 3 rotations
+            cameras.append({'name': str(i_cam + first_name), 'kind': 'C',
                             'loc': loc,
                             'loc_sig': [1.0, 1.0, 1.0],
+                            'rot_axes': 'ZYX',
+                            'rot_angles': [phi_angle + np.pi / 2., 0., tilt_angle],
+                            'rot_angles_sig': [cls.rot_angle_sig] * 3})
+        return cameras
+
+    @classmethod
+    def build_bottom_cameras(cls):
+        """Return the design list of the cameras in the bottom super module"""
+        return cls.build_cameras(cls.camera_z_bot, -cls.camera_angle, 0)
+
+    @classmethod
+    def build_top_cameras(cls):
+        """Return the design list of the cameras in the top super module"""
+        return cls.build_cameras(-cls.camera_z_top, -np.pi / 2. - cls.camera_angle, 4)
+
+    @classmethod
+    def build_targets(cls, target_z):
+        """Return the design list of the 16 targets of an endcap super module"""
+        targets = []
+        for i_target in range(16):
+            targets.append({'name': str(i_target), 'kind': 'T',
+                            'loc': [cls.target_xs[i_target], cls.target_ys[i_target], target_z],
+                            'loc_sig': [1.0, 1.0, 1.0],
                             'rot_axes': 'Z',
                             'rot_angles': 0.,
                             'rot_angles_sig': 0.})
+        return targets
 
-    targets_design['top'] = top_targets
+    @classmethod
+    def build_bottom_targets(cls):
+        """Return the design list of the targets in the bottom super module"""
+        return cls.build_targets(cls.bottom_target_z)
 
-    # Barrel super module:
-    ####################
-    # Origin on cylinder axis, z-axis along that axis, z=0 at centre of second from bottom row of
-    # mPMTs. Ordering of mPMTs increases with phi. Second mPMT is displaced along SM +x axis.
-
-    barrel_mpmts = []
+    @classmethod
+    def build_top_targets(cls):
+        """Return the design list of the targets in the top super module"""
+        return cls.build_targets(cls.top_target_z)
 
-    n_col = 16
-    for i_row in range(-1, 3):
-        loc = [wcte_diameter / 2., 0., i_row * barrel_vertical_pitch]
-        for j_col in range(n_col):
-            phi_angle = 2. * np.pi * j_col / n_col
-            rot_phi = Rotation.from_euler('Z', phi_angle)
-            rot_loc = rot_phi.apply(loc)
-            # rotations of the normal defined by 3 extrinsic rotations
-            rot_angles = [np.pi, np.pi / 2., -phi_angle]
-            barrel_mpmts.append({'kind': 'ME',
-                                 'loc': rot_loc,
-                                 'loc_sig': loc_sig,
-                                 'rot_axes': 'ZYX',
-                                 'rot_angles': rot_angles,
-                                 'rot_angles_sig': [rot_angle_sig] * 3})
-
-    devices_design['barrel'] = barrel_mpmts
-
-    def __init__(self, name, container=None, kind='SSM', place_design={}, place_true={}, device_type=MPMT):
+    def __init__(self, name, container=None, kind='SSM', place_design={}, place_true={}, device_type=MPMT,
+                 lazy=False):
         super().__init__(SM, name, container, kind, place_design, place_true)
 
-        # create and place the set of devices
+        # create and place the set of devices (if lazy, the PMTs and LEDs of the mPMTs are created when first accessed)
         if device_type == MPMT:
-            self.mpmts = self.place_devices(device_type, self.devices_design, kind)
+            self.mpmts = self.place_devices(device_type, self.devices_design, kind, lazy=lazy)
             self.sms = None
         elif device_type == SM:
-            self.sms = self.place_devices(device_type, self.devices_design, kind)
+            self.sms = self.place_devices(device_type, self.devices_design, kind, lazy=lazy)
             # collect all the mpmts in the WCD
             self.mpmts = []
             for sm in self.sms:
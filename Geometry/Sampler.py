@@ -0,0 +1,126 @@
+import numpy as np
+
+
+class Sampler:
+    """
+    Sampler: draws the random true properties and placements of devices using a single numpy random generator.
+
+    True properties are drawn in batches for each kind of device, following the design distributions defined by the
+    device class dictionaries design_mean, design_scale, and design_var (see Device). Rows of a batch are handed out
+    one device at a time as the devices are constructed. If the design distributions of a kind are changed, the rows
+    drawn for the old design are discarded.
+
+    Placement variations are drawn for a complete design list (e.g. MPMT.pmts_design['ME']) at once.
+
+    Use a seed to make a set of realizations reproducible:
+        >>> Device.set_seed(123)
+        >>> wcte = WCD('wcte', kind='WCTE')
+    """
+
+    def __init__(self, seed=None, batch_size=256):
+        self.rng = np.random.default_rng(seed)
+        self.batch_size = batch_size
+        # true properties drawn in advance, keyed by (device_type, kind): see reserve
+        self.batches = {}
+
+    def draw_values(self, design_mean, design_scale, design_var, n):
+        """Return an (n, n_property) array of true property values drawn from the design distributions
+        (in the order of the design_mean keys). Properties with zero scale are set to their mean value."""
+        keys = list(design_mean)
+        means = np.array([design_mean[key] for key in keys], dtype=float)
+        scales = np.array([design_scale[key] for key in keys], dtype=float)
+        var_types = [design_var.get(key, 'norm') for key in keys]
+        values = np.tile(means, (n, 1))
+        for var_type in ['norm', 'gamma', 'uniform']:
+            columns = [i for i in range(len(keys)) if scales[i] > 0. and
+                       (var_types[i] == var_type or (var_type == 'norm' and var_types[i] not in ['gamma', 'uniform']))]
+            if len(columns) == 0:
+                continue
+            mean = means[columns]
+            scale = scales[columns]
+            if var_type == 'uniform':
+                values[:, columns] = self.rng.uniform(mean - scale, mean + scale, (n, len(columns)))
+            elif var_type == 'gamma':
+                values[:, columns] = self.rng.gamma(mean ** 2 / scale ** 2, scale ** 2 / mean, (n, len(columns)))
+            else:
+                values[:, columns] = self.rng.normal(mean, scale, (n, len(columns)))
+        return values
+
+    def reserve(self, device_type, kind, n):
+        """Draw in advance (in one batch) the true properties of at least n devices of the given kind"""
+        if not hasattr(device_type, 'design_mean') or kind not in device_type.design_mean:
+            return
+        design_mean = device_type.design_mean[kind]
+        design_scale = device_type.design_scale[kind]
+        design_var = device_type.design_var[kind]
+        batch = self.batches.get((device_type, kind))
+        rows = []
+        if batch is not None and batch['design'] == (design_mean, design_scale, design_var):
+            rows = batch['rows'][batch['next']:]
+        if len(rows) < n:
+            rows = rows + self.draw_values(design_mean, design_scale, design_var,
+                                           max(n - len(rows), self.batch_size)).tolist()
+            # copies of the design are kept to recognize when it has been changed
+            self.batches[(device_type, kind)] = {
+                'design': (design_mean.copy(), design_scale.copy(), design_var.copy()),
+                'keys': list(design_mean),
+                # properties without variation keep their design value (and type)
+                'fixed': {key: design_mean[key] for key in design_mean if not design_scale[key] > 0.},
+                'rows': rows,
+                'next': 0}
+
+    def draw_properties(self, device_type, kind):
+        """Return a dictionary of true properties for one device of the given kind"""
+        batch = self.batches.get((device_type, kind))
+        if (batch is None or batch['next'] >= len(batch['rows']) or
+                batch['design'] != (device_type.design_mean[kind], device_type.design_scale[kind],
+                                    device_type.design_var[kind])):
+            # a batch drawn for an old design is replaced
+            self.reserve(device_type, kind, 1)
+            batch = self.batches[(device_type, kind)]
+        truth = dict(zip(batch['keys'], batch['rows'][batch['next']]))
+        truth.update(batch['fixed'])
+        batch['next'] += 1
+        return truth
+
+    def draw_placements(self, devices_design):
+        """Return the list of true placements for a list of device designs (with 'loc', 'loc_sig', 'rot_axes',
+        'rot_angles', and 'rot_angles_sig'), drawn from normal distributions"""
+        n_device = len(devices_design)
+        if n_device == 0:
+            return []
+        locs = np.array([device['loc'] for device in devices_design], dtype=float)
+        locs_sig = np.array([device['loc_sig'] for device in devices_design], dtype=float)
+        locs_true = self.rng.normal(locs, locs_sig).tolist()
+
+        # angles of all devices are drawn together (the design lists are read without numpy, as they are short)
+        angles = []
+        angles_sig = []
+        n_angles = []
+        for device in devices_design:
+            device_angles = _as_list(device['rot_angles'])
+            sig = _as_list(device['rot_angles_sig'])
+            angles.extend(device_angles)
+            angles_sig.extend(sig * len(device_angles) if len(sig) == 1 else sig[:len(device_angles)])
+            n_angles.append(len(device_angles))
+        angles_true = self.rng.normal(np.array(angles, dtype=float), np.array(angles_sig, dtype=float)).tolist()
+
+        places_true = []
+        i_angle = 0
+        for device, loc_true, n_angle in zip(devices_design, locs_true, n_angles):
+            rot_angles_true = angles_true[i_angle:i_angle + n_angle]
+            i_angle += n_angle
+            if len(device['rot_axes']) == 1 and np.ndim(device['rot_angles']) == 0:
+                # a single rotation can be specified by a scalar angle
+                rot_angles_true = rot_angles_true[0]
+            places_true.append({'loc': loc_true, 'rot_axes': device['rot_axes'], 'rot_angles': rot_angles_true})
+        return places_true
+
+
+def _as_list(values):
+    """Return a list of the values of a list, tuple, or array (of any shape), or a list of one scalar value"""
+    if isinstance(values, np.ndarray):
+        return values.ravel().tolist()
+    if isinstance(values, (list, tuple)):
+        return list(values)
+    return [values]
@@ -0,0 +1,165 @@
+"""
+SpatialIndex: fast nearest neighbour and radius searches over the locations of devices (e.g. all PMTs of a WCD)
+
+The index holds the locations and directions of the devices of one type contained in a device, for one kind of
+placement information, in the coordinate system of that device. Queries are batched and return flat device
+indices, i.e. positions in the list device.get_devices(devices):
+
+    >>> index = SpatialIndex(wcte, 'pmts', 'est')
+    >>> distances, indices = index.nearest(points)
+    >>> pmts_near = index.within(point, 500.)
+    >>> cos_angles, indices = index.nearest_direction(vertices, directions)
+
+When placements are changed, the index is updated before the next query: the index listens for changed placements
+(see Device.add_listener), and only the locations of the devices whose placement (or that of one of their
+containers) has changed are recalculated.
+"""
+
+import numpy as np
+
+
+class SpatialIndex:
+    """A k-d tree of the locations of the devices of one type in a device"""
+
+    # above this fraction of changed devices, all placements are recalculated together
+    full_update_fraction = 0.1
+
+    def __init__(self, device, devices='pmts', place_info='design', auto_update=True):
+        """
+        * device: the device containing the devices to index (e.g. a WCD or HALL), which defines the coordinate system
+        * devices: the name of the device lists to index: 'pmts', 'leds', 'mpmts', etc.
+        * place_info: 'design', 'true', or 'est'
+        * auto_update: if True, check for changed placements before each query
+        """
+        self.device = device
+        self.devices_name = devices
+        self.place_info = place_info
+        self.auto_update = auto_update
+        self.devices = device.get_devices(devices)
+
+        # the devices whose placements affect the indexed locations: the indexed devices and their containers
+        self.nodes = []
+        self.node_rows = node_rows = {}
+        node_members = []
+        for i, the_device in enumerate(self.devices):
+            node = the_device
+            while node is not None and node is not device:
+                row = node_rows.get(id(node))
+                if row is None:
+                    row = node_rows[id(node)] = len(self.nodes)
+                    self.nodes.append(node)
+                    node_members.append([])
+                node_members[row].append(i)
+                node = node.container
+        self.node_members = [np.array(members) for members in node_members]
+
+        # the rows of the nodes whose placements have changed since the last update (None: all)
+        self.changed_nodes = None
+        device.add_listener(self.placement_changed)
+        self.location = np.full((len(self.devices), 3), np.nan)
+        self.direction_z = np.full((len(self.devices), 3), np.nan)
+        self.tree = None
+        # flat indices of the devices in the tree (devices without a placement are left out)
+        self.tree_indices = np.zeros(0, dtype=int)
+        self.update()
+
+    def placement_changed(self, device, place_info):
+        """Listener called when a placement of the indexed device or a device it contains has changed"""
+        if place_info == self.place_info and self.changed_nodes is not None:
+            row = self.node_rows.get(id(device))
+            if row is not None:
+                self.changed_nodes.add(row)
+
+    def update(self):
+        """Recalculate the locations of devices whose placements have changed and rebuild the tree.
+        Returns True if the index was changed."""
+        if self.changed_nodes is None:
+            changed_devices = np.arange(len(self.devices))
+        elif len(self.changed_nodes) == 0:
+            return False
+        else:
+            changed_devices = np.unique(np.concatenate([self.node_members[row] for row in self.changed_nodes]))
+        self.changed_nodes = set()
+
+        if len(changed_devices) > self.full_update_fraction * len(self.devices):
+            placements = self.device.get_placements(self.devices_name, self.place_info, self.device)
+            self.location = placements['location']
+            self.direction_z = placements['direction_z']
+        else:
+            for i in changed_devices.tolist():
+                try:
+                    rotation, translation = self.devices[i].get_transform(self.place_info, self.device)
+                    self.location[i] = translation
+                    self.direction_z[i] = rotation[:, 2]
+                except ValueError:
+                    # a placement is missing
+                    self.location[i] = np.nan
+                    self.direction_z[i] = np.nan
+
+        # scipy.spatial is imported when first needed, as it takes much longer to import than this package
+        from scipy.spatial import cKDTree
+        self.tree_indices = np.flatnonzero(~np.isnan(self.location).any(axis=1))
+        self.tree = cKDTree(self.location[self.tree_indices])
+        return True
+
+    def check(self):
+        """Update the index if placements have changed (if auto_update is set)"""
+        if self.auto_update:
+            self.update()
+
+    def nearest(self, points, max_distance=np.inf):
+        """Return the distances and flat indices of the nearest devices to the points (...,3).
+        Where no device is within max_distance, the distance is inf and the index -1."""
+        return self.knn(points, 1, max_distance)
+
+    def knn(self, points, k, max_distance=np.inf):
+        """Return the distances and flat indices (...,k) of the k nearest devices to the points (...,3), in
+        order of distance (for k = 1, the last axis is dropped)"""
+        self.check()
+        points = np.asarray(points, dtype=float)
+        distances, tree_rows = self.tree.query(points, k, distance_upper_bound=max_distance, workers=-1)
+        # missing neighbours are given the row after the last one
+        return distances, np.append(self.tree_indices, -1)[tree_rows]
+
+    def within(self, points, radius):
+        """Return the flat indices of the devices within the radius of each point, sorted by index:
+        an array for a single point (3,), or an array of arrays for points (...,3)"""
+        self.check()
+        points = np.asarray(points, dtype=float)
+        tree_rows = self.tree.query_ball_point(points, radius, workers=-1, return_sorted=True)
+        if points.ndim == 1:
+            return self.tree_indices[tree_rows]
+        indices = np.empty(tree_rows.shape, dtype=object)
+        for position, rows in np.ndenumerate(tree_rows):
+            indices[position] = self.tree_indices[rows]
+        return indices
+
+    def count_within(self, points, radius):
+        """Return the number of devices within the radius of each point"""
+        self.check()
+        return self.tree.query_ball_point(np.asarray(points, dtype=float), radius, workers=-1, return_length=True)
+
+    def nearest_direction(self, vertices, directions, chunk_size=1024):
+        """For each vertex (N,3) and direction (N,3), return the cosine of the angle between the direction and
+        the line from the vertex to the device best aligned with it, and the flat index of that device"""
+        self.check()
+        vertices = np.atleast_2d(np.asarray(vertices, dtype=float))
+        directions = np.atleast_2d(np.asarray(directions, dtype=float))
+        directions = directions / np.linalg.norm(directions, axis=-1, keepdims=True)
+        vertices, directions = np.broadcast_arrays(vertices, directions)
+        locations = self.location[self.tree_indices]
+        squared_lengths = (locations ** 2).sum(axis=1)
+        cos_angles = np.empty(len(vertices))
+        indices = np.empty(len(vertices), dtype=int)
+        # cos = (l.d - v.d) / |l - v|, from matrix products of the (chunk, device) arrays, which are kept small
+        for start in range(0, len(vertices), chunk_size):
+            stop = start + chunk_size
+            vertex, direction = vertices[start:stop], directions[start:stop]
+            squared_distances = (squared_lengths[None, :] - 2. * (vertex @ locations.T) +
+                                 (vertex ** 2).sum(axis=1)[:, None])
+            cos = ((direction @ locations.T - (vertex * direction).sum(axis=1)[:, None]) /
+                   np.sqrt(np.maximum(squared_distances, 1.e-18)))
+            best = np.argmax(cos, axis=1)
+            cos_angles[start:stop] = cos[np.arange(len(best)), best]
+            indices[start:stop] = self.tree_indices[best]
+        return cos_angles, indices
@@ -0,0 +1,120 @@
+"""
+TofTable: distances and times of flight from every light source to every PMT of a WCD
+
+The sources are the LEDs in the mPMTs (in the order of wcd.get_devices('leds')) followed by the calibration sources
+(wcd.get_devices('calibs')). The PMTs are in the order of wcd.get_devices('pmts'). The tables are float32 arrays of
+shape (n_source, n_pmt), calculated with numpy array operations from the placements of all devices:
+
+    >>> table = TofTable.build(wcte, 'est')
+    >>> table.tof[led_index, pmt_index]   # ns
+
+The time of flight is the distance between the device origins divided by the speed of light in water,
+WCD.light_velocity / refraction_index.
+
+As the tables take some time to calculate, they can be saved in a cache directory. The file name is a hash of the
+source and PMT locations, refraction index and light velocity, so a table is only reused for the same geometry:
+
+    >>> table = TofTable.load_or_build(wcte, 'est', cache_dir='tof_cache')
+"""
+
+import hashlib
+from pathlib import Path
+import numpy as np
+
+
+class TofTable:
+    """Source to PMT distances (mm) and times of flight (ns)"""
+
+    # increase when the calculation changes, so that old cached tables are not used
+    version = 1
+
+    def __init__(self, distance, tof, refraction_index, light_velocity, key=None):
+        self.distance = distance
+        self.tof = tof
+        self.refraction_index = refraction_index
+        self.light_velocity = light_velocity
+        self.key = key
+
+    @property
+    def shape(self):
+        return self.tof.shape
+
+    @staticmethod
+    def get_locations(wcd, place_info='design'):
+        """Return the locations of the sources (n_source,3) and PMTs (n_pmt,3) in the WCD coordinate system"""
+        source_locations = [wcd.get_placements(devices, place_info, wcd)['location'] for devices in ['leds', 'calibs']]
+        pmt_locations = wcd.get_placements('pmts', place_info, wcd)['location']
+        return np.concatenate(source_locations), pmt_locations
+
+    @staticmethod
+    def get_refraction_index(wcd, prop_info='design'):
+        """Return the refraction index of the water in the WCD (from the design if prop_info does not give it)"""
+        for info in [prop_info, 'design']:
+            refraction_index = (getattr(wcd, 'prop_' + info, None) or {}).get('refraction_index')
+            if refraction_index is not None:
+                return float(refraction_index)
+        raise ValueError('WCD: ' + wcd.name + ' has no refraction_index property.')
+
+    @staticmethod
+    def get_key(source_locations, pmt_locations, refraction_index, light_velocity):
+        """Return the hash identifying a table"""
+        key = hashlib.sha1()
+        key.update(str((TofTable.version, refraction_index, light_velocity)).encode())
+        for locations in [source_locations, pmt_locations]:
+            key.update(str(locations.shape).encode())
+            key.update(np.ascontiguousarray(locations, dtype=np.float64).tobytes())
+        return key.hexdigest()
+
+    @staticmethod
+    def iter_chunks(source_locations, pmt_locations, chunk_size=256):
+        """Generate the distances (float32) from chunks of sources to all PMTs: (start, stop, distances)"""
+        for start in range(0, len(source_locations), chunk_size):
+            stop = min(start + chunk_size, len(source_locations))
+            offsets = pmt_locations[None, :, :] - source_locations[start:stop, None, :]
+            yield start, stop, np.sqrt(np.einsum('spi,spi->sp', offsets, offsets)).astype(np.float32)
+
+    @classmethod
+    def build(cls, wcd, place_info='design', prop_info=None, refraction_index=None, chunk_size=256):
+        """Calculate the table for a WCD, using the placements given by place_info and the refraction index
+        given by prop_info (by default the same as place_info), unless refraction_index is specified"""
+        source_locations, pmt_locations = cls.get_locations(wcd, place_info)
+        if refraction_index is None:
+            refraction_index = cls.get_refraction_index(wcd, prop_info or place_info)
+        return cls.from_locations(source_locations, pmt_locations, refraction_index, wcd.light_velocity, chunk_size)
+
+    @classmethod
+    def from_locations(cls, source_locations, pmt_locations, refraction_index, light_velocity, chunk_size=256):
+        """Calculate the table for source (n_source,3) and PMT (n_pmt,3) locations"""
+        distance = np.empty((len(source_locations), len(pmt_locations)), dtype=np.float32)
+        for start, stop, chunk in cls.iter_chunks(source_locations, pmt_locations, chunk_size):
+            distance[start:stop] = chunk
+        tof = distance * np.float32(refraction_index / light_velocity)
+        key = cls.get_key(source_locations, pmt_locations, refraction_index, light_velocity)
+        return cls(distance, tof, refraction_index, light_velocity, key)
+
+    @classmethod
+    def load_or_build(cls, wcd, place_info='design', prop_info=None, refraction_index=None, cache_dir='.'):
+        """Return the table saved in the cache directory for the current geometry, or build and save it"""
+        source_locations, pmt_locations = cls.get_locations(wcd, place_info)
+        if refraction_index is None:
+            refraction_index = cls.get_refraction_index(wcd, prop_info or place_info)
+        key = cls.get_key(source_locations, pmt_locations, refraction_index, wcd.light_velocity)
+        filepath = Path(cache_dir) / ('tof_' + key + '.npz')
+        if filepath.exists():
+            return cls.load(filepath)
+        table = cls.from_locations(source_locations, pmt_locations, refraction_index, wcd.light_velocity)
+        Path(cache_dir).mkdir(parents=True, exist_ok=True)
+        table.save(filepath)
+        return table
+
+    def save(self, filepath):
+        """Save the table in a numpy .npz file"""
+        np.savez(filepath, distance=self.distance, tof=self.tof, refraction_index=self.refraction_index,
+                 light_velocity=self.light_velocity, key=self.key)
+
+    @classmethod
+    def load(cls, filepath):
+        """Read a table saved by save"""
+        with np.load(filepath) as data:
+            return cls(data['distance'], data['tof'], data['refraction_index'].item(), data['light_velocity'].item(),
+                       data['key'].item())
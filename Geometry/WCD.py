@@ -29,6 +29,9 @@ class WCD(Device):
     design_scale = {}  # scale of variations of properties used to create objects
     design_var = {}  # distribution of variations
 
+    # design dictionaries used to place the sub-devices in each list
+    design_tables = {'sms': 'sms_design', 'mpmts': 'mpmts_design', 'calibs': 'calibs_design'}
+
     # A dictionary of mpmt kinds and placements in the WCD:
     mpmts_design = {}
 
@@ -191,16 +194,17 @@ class WCD(Device):
     # Add a beacon (laser ball for example)
     calibs_design['WCTE'] = def_calibs
 
-    def __init__(self, name, container=None, kind='WCTE', place_design={}, place_true={}, device_type=SM):
+    def __init__(self, name, container=None, kind='WCTE', place_design={}, place_true={}, device_type=SM,
+                 lazy=False):
         super().__init__(WCD, name, container, kind, place_design, place_true)
 
-        # create and place the set of devices
+        # create and place the set of devices (if lazy, the PMTs and LEDs of the mPMTs are created when first accessed)
         if device_type == MPMT:
-            self.mpmts = self.place_devices(device_type, self.mpmts_design, kind)
+            self.mpmts = self.place_devices(device_type, self.mpmts_design, kind, lazy=lazy)
             self.sms = None
             self.cameras = None
         elif device_type == SM:
-            self.sms = self.place_devices(device_type, self.sms_design, kind)
+            self.sms = self.place_devices(device_type, self.sms_design, kind, lazy=lazy)
             # collect all the mpmts in the WCD
             self.mpmts = []
             for sm in self.sms:
@@ -0,0 +1,324 @@
+"""
+Benchmarks of the time and peak memory used by the main operations of the package
+
+    python benchmarks/run_benchmarks.py                      # run all benchmarks, compare with the baseline
+    python benchmarks/run_benchmarks.py -k placement         # only the benchmarks with names containing 'placement'
+    python benchmarks/run_benchmarks.py --save-baseline      # replace the baseline with the new results
+
+Each benchmark is timed several times (the best time is reported), and then run once more with tracemalloc to find
+the peak memory allocated by python and numpy during the call. The results are written to a json file and compared
+with the baseline results in benchmarks/baseline.json: a benchmark that takes more than --threshold times its
+baseline time is reported as a regression (and the exit status is 1).
+
+Repeated queries of the same tree find their results in the caches of the devices after the first run: the
+benchmarks with names ending in _cold discard the caches at the start of each run, to time the calculations.
+
+The synthetic_hall benchmarks construct a hall filled with many copies of WCTE, to follow how the construction and
+queries scale with the size of the detector.
+"""
+
+import argparse
+import datetime
+import json
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from Geometry.Device import Device
+from Geometry.FitScheduler import FitScheduler
+from Geometry.Fitter import Fitter
+from Geometry.HALL import HALL
+from Geometry.RenderGeometry import RenderGeometry
+from Geometry.SM import SM
+from Geometry.WCD import WCD
+
+benchmarks_dir = Path(__file__).resolve().parent
+examples_dir = benchmarks_dir.parent / 'examples'
+
+# the benchmarks: name -> function(**options) returning (function to benchmark, number of repeats)
+benchmarks = {}
+
+
+def benchmark(name):
+    """Register a benchmark"""
+    def register(setup):
+        benchmarks[name] = setup
+        return setup
+    return register
+
+
+def get_wcte(place_est=False):
+    Device.set_seed(1)
+    wcte = WCD('wcte', kind='WCTE')
+    if place_est:
+        for device_list in ['sms', 'mpmts', 'cameras']:
+            for device in getattr(wcte, device_list):
+                device.place_est = device.place_true.copy()
+    return wcte
+
+
+def get_synthetic_hall(n_wcd):
+    """Return a hall with n_wcd copies of WCTE placed in a row"""
+    kind = 'SYNTHETIC_' + str(n_wcd)
+    if kind not in HALL.wcds_design:
+        HALL.wcds_design[kind] = [dict(HALL.wcte_wcds[0], name='wcte_' + str(i), loc=[5000. * i, 0., 0.])
+                                  for i in range(n_wcd)]
+    return HALL('synthetic', kind=kind)
+
+
+@benchmark('import_geometry')
+def import_geometry(repeat):
+    # a new interpreter imports the package (the time includes the interpreter start up)
+    command = [sys.executable, '-c', 'import Geometry.HALL']
+    return lambda: subprocess.run(command, check=True, cwd=benchmarks_dir.parent), repeat
+
+
+@benchmark('construct_wcte')
+def construct_wcte(repeat):
+    return lambda: WCD('wcte', kind='WCTE'), repeat
+
+
+@benchmark('construct_hall')
+def construct_hall(repeat):
+    return lambda: HALL('hall', kind='WCTE'), repeat
+
+
+@benchmark('clone_wcte')
+def clone_wcte(repeat):
+    wcte = get_wcte()
+    return lambda: wcte.clone(seed=1), repeat
+
+
+def get_placement_all_pmts_leds(repeat, cold):
+    # the placements of all PMTs and LEDs, one device at a time, in the WCD, SM and mPMT coordinate systems
+    wcte = get_wcte()
+    devices = wcte.get_devices('pmts') + wcte.get_devices('leds')
+
+    def run():
+        if cold:
+            wcte.set_dirty('design')
+        for device in devices:
+            device.get_placement('design')
+            device.get_placement('design', device.container.container)
+            device.get_placement('design', device.container)
+    return run, repeat
+
+
+# after the first run, the transformations are found in the caches of the devices. The cold benchmarks discard the
+# caches (with set_dirty) at the start of each run, so that the transformations are calculated again
+benchmark('get_placement_all_pmts_leds')(lambda repeat: get_placement_all_pmts_leds(repeat, cold=False))
+benchmark('get_placement_all_pmts_leds_cold')(lambda repeat: get_placement_all_pmts_leds(repeat, cold=True))
+
+
+@benchmark('get_placements_batch')
+def get_placements_batch(repeat):
+    wcte = get_wcte()
+
+    def run():
+        wcte.get_placements('pmts', 'true')
+        wcte.get_placements('leds', 'true')
+    return run, repeat
+
+
+@benchmark('get_placement_after_change')
+def get_placement_after_change(repeat):
+    # the placements of all PMTs after the placement of a supermodule changes
+    wcte = get_wcte()
+    pmts = wcte.get_devices('pmts')
+
+    def run():
+        wcte.sms[1].place_design['loc'][2] += 0.
+        for pmt in pmts:
+            pmt.get_placement('design')
+    return run, repeat
+
+
+def sm_fiducials_points(repeat, cold):
+    # the fiducials and outlines of all mPMTs of a supermodule, in the supermodule coordinate system
+    bottom = SM('bottom', kind='bottom')
+
+    def run():
+        if cold:
+            bottom.set_dirty('design')
+            bottom.set_dirty('true')
+        for mpmt in bottom.mpmts:
+            mpmt.get_fiducials('design', bottom, z_offset=-178.08)
+            mpmt.get_xy_points('design', 'base', bottom)
+            mpmt.get_transformed_points(mpmt.fiducials, 'true', bottom)
+    return run, repeat
+
+
+# as above, the cold benchmark discards the cached transformations and points at the start of each run
+benchmark('sm_fiducials_points')(lambda repeat: sm_fiducials_points(repeat, cold=False))
+benchmark('sm_fiducials_points_cold')(lambda repeat: sm_fiducials_points(repeat, cold=True))
+
+
+@benchmark('save_json_all')
+def save_json_all(repeat):
+    wcte = get_wcte()
+    directory = tempfile.mkdtemp()
+    return lambda: wcte.save_json(Path(directory) / 'wcte_all.json', devices='all'), max(repeat // 2, 1)
+
+
+@benchmark('save_file_geo')
+def save_file_geo(repeat):
+    device = Device.open_file(examples_dir / 'wcte_bldg157.geo')
+    directory = tempfile.mkdtemp()
+    return lambda: device.save_file(Path(directory) / 'wcte_bldg157.geo'), repeat
+
+
+@benchmark('open_file_geo')
+def open_file_geo(repeat):
+    return lambda: Device.open_file(examples_dir / 'wcte_bldg157.geo'), repeat
+
+
+@benchmark('survey_fit')
+def survey_fit(repeat):
+    # fit the mPMTs and cameras of the endcaps to simulated survey points, with 0.2 mm measurement errors
+    wcte = get_wcte(place_est=True)
+    rng = np.random.default_rng(1)
+    surveys = []
+    for sm in [wcte.sms[0], wcte.sms[2]]:
+        mpmt_points = np.array([mpmt.get_fiducials('true', sm, z_offset=-178.08) for mpmt in sm.mpmts])
+        camera_points = np.array([camera.get_fiducials('true', sm) for camera in sm.cameras])
+        surveys.append((sm, mpmt_points + rng.normal(0., 0.2, mpmt_points.shape),
+                        camera_points + rng.normal(0., 0.2, camera_points.shape)))
+
+    def run():
+        for sm, mpmt_points, camera_points in surveys:
+            Fitter.fit_sm(sm, mpmt_points, camera_points, z_offset=-178.08)
+    return run, repeat
+
+
+@benchmark('render_export_wcte')
+def render_export_wcte(repeat):
+    # the drawing of all mPMTs, PMTs, cameras and axes, written as glTF binary
+    wcte = get_wcte()
+    directory = tempfile.mkdtemp()
+    return lambda: RenderGeometry.build(wcte, 'design').save(Path(directory) / 'wcte.glb'), repeat
+
+
+def synthetic_hall_benchmarks(n_wcd):
+    """Register the benchmarks of a synthetic hall with n_wcd copies of WCTE"""
+
+    @benchmark('synthetic_hall_' + str(n_wcd) + '_construct')
+    def construct(repeat):
+        return lambda: get_synthetic_hall(n_wcd), max(repeat // 4, 1)
+
+    @benchmark('synthetic_hall_' + str(n_wcd) + '_get_placements')
+    def get_placements(repeat):
+        hall = get_synthetic_hall(n_wcd)
+        return lambda: hall.get_placements('pmts', 'true'), repeat
+
+
+for _n_wcd in [1, 4, 16]:
+    synthetic_hall_benchmarks(_n_wcd)
+
+
+def fit_scheduler_benchmarks(n_wcd, max_workers):
+    """Register the benchmark of the survey fits of all supermodules of a synthetic hall with a FitScheduler"""
+
+    @benchmark('synthetic_hall_' + str(n_wcd) + '_fit_workers_' + str(max_workers))
+    def fit(repeat):
+        # the time includes that of preparing the problems in this process, and of starting the pool of workers
+        hall = get_synthetic_hall(n_wcd)
+        scheduler = FitScheduler(max_workers=max_workers)
+        for wcd in hall.wcds:
+            for sm in wcd.sms:
+                mpmt_points = np.array([mpmt.get_fiducials('true', sm, z_offset=-178.08) for mpmt in sm.mpmts])
+                camera_points = None
+                if sm.cameras:
+                    camera_points = np.array([camera.get_fiducials('true', sm) for camera in sm.cameras])
+                scheduler.add_sm(sm, mpmt_points, camera_points, z_offset=-178.08)
+        return lambda: scheduler.run(update=False), max(repeat // 2, 1)
+
+
+for _n_wcd in [1, 16]:
+    for _max_workers in [1, 4]:
+        fit_scheduler_benchmarks(_n_wcd, _max_workers)
+
+
+def run_benchmark(name, repeat):
+    """Return the best time and peak memory of a benchmark"""
+    function, n_repeat = benchmarks[name](repeat)
+    times = []
+    for i in range(n_repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    function()
+    peak_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {'time': min(times), 'mean_time': sum(times) / len(times), 'repeat': n_repeat, 'peak_memory': peak_memory}
+
+
+def compare(results, baseline, threshold):
+    """Print the results with their ratios to the baseline times and return the names of the regressions"""
+    regressions = []
+    print('{:40s} {:>10s} {:>10s} {:>8s} {:>12s}'.format('benchmark', 'time (s)', 'baseline', 'ratio', 'memory (MB)'))
+    for name, result in results.items():
+        base = baseline.get(name)
+        ratio = result['time'] / base['time'] if base else np.nan
+        flag = ''
+        if ratio > threshold:
+            regressions.append(name)
+            flag = '  <-- slower'
+        print('{:40s} {:10.4f} {:>10s} {:8.2f} {:12.2f}{}'.format(
+            name, result['time'], '{:.4f}'.format(base['time']) if base else '-', ratio,
+            result['peak_memory'] / 1.e6, flag))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run the Geometry benchmarks')
+    parser.add_argument('-k', dest='keyword', default='', help='run the benchmarks with names containing this')
+    parser.add_argument('--repeat', type=int, default=5, help='number of times each benchmark is timed')
+    parser.add_argument('--output', default='benchmark_results.json', help='file for the results')
+    parser.add_argument('--baseline', default=str(benchmarks_dir / 'baseline.json'), help='baseline results file')
+    parser.add_argument('--threshold', type=float, default=1.5, help='time ratio to the baseline of a regression')
+    parser.add_argument('--save-baseline', action='store_true', help='write the results to the baseline file')
+    args = parser.parse_args(argv)
+
+    results = {}
+    for name in benchmarks:
+        if args.keyword in name:
+            results[name] = run_benchmark(name, args.repeat)
+
+    report = {'date': datetime.datetime.now().isoformat(timespec='seconds'),
+              'python': platform.python_version(),
+              'numpy': np.__version__,
+              'machine': platform.machine(),
+              'processor': platform.processor(),
+              'results': results}
+
+    baseline = {}
+    if Path(args.baseline).exists():
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+    regressions = compare(results, baseline, args.threshold)
+
+    output = args.baseline if args.save_baseline else args.output
+    if args.save_baseline and Path(output).exists():
+        # keep the baseline results of benchmarks that were not run
+        with open(output) as f:
+            report['results'] = dict(json.load(f)['results'], **results)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    if regressions and not args.save_baseline:
+        print(str(len(regressions)) + ' benchmark(s) slower than the baseline by more than ' + str(args.threshold))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
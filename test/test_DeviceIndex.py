@@ -0,0 +1,41 @@
+from Geometry.WCD import WCD
+from Geometry.DeviceIndex import DeviceIndex
+import numpy as np
+
+
+def test_paths():
+    wcte = WCD('wcte', kind='WCTE')
+    index = DeviceIndex(wcte)
+    pmts = wcte.get_devices('pmts')
+    assert len(index) == len(set(index.paths.values()))
+    for device in [wcte.sms[1], wcte.mpmts[43], pmts[100], wcte.mpmts[5].leds[2], wcte.calibs[0]]:
+        assert index.get(index.get_path(device)) is device
+    assert index.get_path(wcte.mpmts[43].pmts[1]) == 'sms:barrel/mpmts:43/pmts:1'
+    assert index.get('') is wcte and index.get('sms:barrel/mpmts:999') is None
+    assert index.get_flat_id(pmts[100]) == ('pmts', 100)
+    assert index.get_device('mpmts', 43) is wcte.mpmts[43]
+    # flat PMT ids from mPMT ids and positions
+    flat_ids = index.get_flat_ids('pmts', [43, 43, 0], [1, 99, 0])
+    assert list(flat_ids) == [pmts.index(wcte.mpmts[43].pmts[1]), -1, 0]
+
+
+def test_channel_map():
+    wcte = WCD('wcte', kind='WCTE')
+    index = DeviceIndex(wcte)
+    n_pmt = len(wcte.get_devices('pmts'))
+    rng = np.random.default_rng(1)
+    flat_ids = rng.permutation(n_pmt)[:n_pmt - 10]
+    for name, channel_ids in [('dense', 1000 + np.arange(len(flat_ids))),
+                              ('sparse', 1000 * np.arange(len(flat_ids)) + 7)]:
+        index.add_channel_map(name, channel_ids, flat_ids)
+        hits = rng.integers(len(channel_ids), size=5000)
+        assert np.array_equal(index.translate(name, channel_ids[hits]), flat_ids[hits])
+        assert list(index.translate(name, [-5, 3, channel_ids.max() + 1])) == [-1, -1, -1]
+        device = index.get_channel_device(name, int(channel_ids[3]))
+        assert index.get_flat_id(device) == ('pmts', flat_ids[3])
+        assert index.get_channel(name, device) == channel_ids[3]
+        assert np.array_equal(index.translate_back(name, flat_ids), channel_ids)
+    # devices given by path
+    paths = ['sms:barrel/mpmts:43/pmts:1', 'sms:top/mpmts:100/pmts:0']
+    index.add_channel_map('paths', [5, 6], paths)
+    assert index.get_channel_device('paths', 6) is index.get(paths[1])
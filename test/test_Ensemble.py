@@ -0,0 +1,36 @@
+from Geometry.WCD import WCD
+from Geometry.Ensemble import Ensemble
+import numpy as np
+
+
+def test_draw():
+    wcte = WCD('wcte', kind='WCTE')
+    ensemble = Ensemble(wcte, seed=3, chunk_size=4)
+    pmts = ensemble.draw(10, 'PMT')
+    n_pmt = len(wcte.get_devices('pmts'))
+    assert pmts['location'].shape == (10, n_pmt, 3) and pmts['direction_z'].shape == (10, n_pmt, 3)
+    assert pmts['properties'].shape == (10, n_pmt, len(pmts['property_keys']))
+    assert np.allclose(np.linalg.norm(pmts['direction_z'], axis=-1), 1.)
+
+    # the realizations are varied about the design, and do not depend on the chunk size
+    design = wcte.get_placements('pmts', 'design')['location']
+    assert 0.5 < np.std(pmts['location'] - design) < 50.
+    other = Ensemble(wcte, seed=3, chunk_size=7).draw(3, 'PMT', first=5)
+    assert np.array_equal(other['location'], pmts['location'][5:8])
+    assert np.array_equal(other['properties'], pmts['properties'][5:8])
+
+    mpmts = ensemble.draw(2, 'MPMT')
+    assert mpmts['location'].shape == (2, len(wcte.mpmts), 3)
+
+
+def test_materialize():
+    ensemble = Ensemble(WCD('wcte', kind='WCTE'), seed=4)
+    pmts = ensemble.draw(3, 'PMT')
+    wcte = ensemble.materialize(2)
+
+    placements = wcte.get_placements('pmts', 'true')
+    assert np.allclose(placements['location'], pmts['location'][2])
+    assert np.allclose(placements['rotation'][:, :, 2], pmts['direction_z'][2])
+    pmt = wcte.mpmts[0].pmts[0]
+    assert pmt.prop_true['qe'] == pmts['properties'][2, 0, pmts['property_keys'].index('qe')]
+    assert wcte.sms[0].targets[0].get_placement('true') != wcte.sms[0].targets[0].get_placement('design')
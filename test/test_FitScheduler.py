@@ -0,0 +1,34 @@
+from Geometry.WCD import WCD
+from Geometry.Fitter import Fitter
+from Geometry.FitScheduler import FitScheduler
+import numpy as np
+
+
+def test_run():
+    wcte = WCD('wcte', kind='WCTE')
+    bottom, barrel = wcte.sms[0], wcte.sms[1]
+    barrel.place_est = barrel.place_true.copy()
+    bottom_points = np.array([mpmt.get_fiducials('true', bottom, z_offset=-178.08) for mpmt in bottom.mpmts])
+    bottom_points[4, :3] = np.nan
+    camera_points = np.array([camera.get_fiducials('true', bottom) for camera in bottom.cameras])
+    barrel_points = [mpmt.get_fiducials('true', wcte, z_offset=-49.06) for mpmt in barrel.mpmts]
+
+    scheduler = FitScheduler(max_workers=2, chunk_size=8)
+    scheduler.add_sm(bottom, bottom_points, camera_points, z_offset=-178.08)
+    scheduler.add_devices(barrel.mpmts, barrel_points, device_for_coordinate_system=wcte, z_offset=-49.06)
+    bottom_fit, barrel_fit = scheduler.run(update=False)
+
+    # the same results as the fits done in this process
+    fit = Fitter.fit_sm(bottom, bottom_points, camera_points, z_offset=-178.08, update=False)
+    assert bottom_fit['mpmts']['devices'] == bottom.mpmts and bottom_fit['cameras']['devices'] == bottom.cameras
+    assert list(bottom_fit['mpmts']['fitted']) == list(fit['mpmts']['fitted'])
+    assert np.allclose(bottom_fit['cameras']['loc'], fit['cameras']['loc'])
+    assert bottom_fit['mpmts']['residuals'].shape == (len(bottom.mpmts), 16, 3)
+    assert barrel_fit['fitted'].all() and np.allclose(barrel_fit['rms'], 0.)
+
+    scheduler.max_workers = 1
+    scheduler.run()
+    assert bottom.mpmts[4].place_est == {}
+    rotation, loc = barrel.mpmts[7].get_transform('est', barrel)
+    true_rotation, true_loc = barrel.mpmts[7].get_transform('true', barrel)
+    assert np.allclose(rotation, true_rotation) and np.allclose(loc, true_loc)
@@ -0,0 +1,71 @@
+from Geometry.WCD import WCD
+from Geometry.Fitter import Fitter
+import numpy as np
+
+
+def test_solve():
+    rng = np.random.default_rng(1)
+    body = rng.normal(0., 100., (5, 4, 3))
+    angles = rng.uniform(-np.pi, np.pi, 5)
+    rotation = np.zeros((5, 3, 3))
+    rotation[:, 0, 0] = rotation[:, 1, 1] = np.cos(angles)
+    rotation[:, 0, 1] = -np.sin(angles)
+    rotation[:, 1, 0] = np.sin(angles)
+    rotation[:, 2, 2] = 1.
+    translation = rng.normal(0., 1000., (5, 3))
+    surveyed = np.einsum('nij,nmj->nmi', rotation, body) + translation[:, None, :]
+    surveyed[1, 2] = np.nan
+
+    fit_rotation, fit_translation, rms, n_used = Fitter.solve(body, surveyed)
+    assert np.allclose(fit_rotation, rotation)
+    assert np.allclose(fit_translation, translation)
+    assert np.allclose(rms, 0.)
+    assert list(n_used) == [4, 3, 4, 4, 4]
+
+
+def test_euler_angles_near_gimbal():
+    # barrel mPMTs have a middle 'ZYX' angle close to pi/2: the angles are chosen from the two equivalent sets
+    from scipy.spatial.transform import Rotation
+    angles = np.array([[0.3, np.pi / 2. - 0.01, -0.2], [2.5, np.pi / 2. + 0.01, 1.], [-3.1, 0.2, 3.1]])
+    rotation = Rotation.from_euler('ZYX', angles).as_matrix()
+    other = angles + np.pi
+    other[:, 1] = np.pi - angles[:, 1]
+    for reference in [angles, other]:
+        rot_angles = Fitter.get_euler_angles(rotation, ['ZYX'] * len(angles), reference)
+        assert np.allclose(rot_angles, reference)
+        assert np.allclose(Rotation.from_euler('ZYX', rot_angles).as_matrix(), rotation)
+
+
+def test_fit_sm():
+    wcte = WCD('wcte', kind='WCTE')
+    bottom = wcte.sms[0]
+    z_offset = -178.08
+    mpmt_points = np.array([mpmt.get_fiducials('true', bottom, z_offset=z_offset) for mpmt in bottom.mpmts])
+    camera_points = np.array([camera.get_fiducials('true', bottom) for camera in bottom.cameras])
+    # missing fiducials: mPMT 3 has too few to be fit
+    mpmt_points[2, 1] = np.nan
+    mpmt_points[3, :2] = np.nan
+    camera_points[:, 3:] = np.nan
+    for device in bottom.mpmts + bottom.cameras:
+        device.place_est = device.place_design.copy()
+
+    fit = Fitter.fit_sm(bottom, mpmt_points, camera_points, z_offset=z_offset)
+    assert list(fit['mpmts']['n_fiducial'][:4]) == [4, 4, 3, 2]
+    assert not fit['mpmts']['fitted'][3] and fit['mpmts']['fitted'].sum() == len(bottom.mpmts) - 1
+    assert np.nanmax(fit['mpmts']['rms']) < 1.e-6 and np.nanmax(fit['cameras']['rms']) < 1.e-6
+    assert bottom.mpmts[3].place_est == bottom.mpmts[3].place_design
+
+    for device in [bottom.mpmts[0], bottom.mpmts[2], bottom.cameras[1]]:
+        assert device.place_est['rot_axes'] == device.place_design['rot_axes']
+        assert np.allclose(device.place_est['loc'], device.place_true['loc'])
+        assert np.allclose(device.place_est['rot_angles'], device.place_true['rot_angles'])
+
+    # survey in the coordinate system of the WCD: the placement of the supermodule is used
+    barrel = wcte.sms[1]
+    barrel.place_est = barrel.place_true.copy()
+    mpmt_points = [mpmt.get_fiducials('true', wcte, z_offset=-49.06) for mpmt in barrel.mpmts]
+    fit = Fitter.fit_devices(barrel.mpmts, mpmt_points, 'est', wcte, z_offset=-49.06)
+    assert fit['fitted'].all()
+    assert np.allclose(barrel.mpmts[5].get_placement('est', wcte)['location'],
+                       barrel.mpmts[5].get_placement('true', wcte)['location'])
+    assert np.allclose(barrel.mpmts[5].get_transform('est', wcte)[0], barrel.mpmts[5].get_transform('true', wcte)[0])
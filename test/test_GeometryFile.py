@@ -0,0 +1,48 @@
+from Geometry.Device import Device
+from Geometry.WCD import WCD
+from Geometry.GeometryFile import GeometryFile
+from Geometry.GeometryTable import GeometryTable
+from pathlib import Path
+import numpy as np
+
+
+def test_save_file(tmp_path):
+    wcte = WCD('wcte', kind='WCTE')
+    wcte.mpmts[0].place_est = None
+    wcte.save_file(tmp_path / 'wcte.geob')
+    assert GeometryFile.is_geometry_file(tmp_path / 'wcte.geob')
+
+    new_wcte = Device.open_file(tmp_path / 'wcte.geob')
+    assert new_wcte.mpmts[0].place_est is None
+    assert new_wcte.mpmts[5].pmts[3].prop_true == wcte.mpmts[5].pmts[3].prop_true
+    old_placements = wcte.get_placements('leds', 'true')
+    new_placements = new_wcte.get_placements('leds', 'true')
+    assert np.allclose(new_placements['location'], old_placements['location'])
+
+
+def test_open_file_as_table(tmp_path):
+    filepath = GeometryFile.convert('examples/wcte_bldg157.geo', tmp_path / 'wcte_bldg157.geob')
+    table = Device.open_file(filepath, as_table=True)
+
+    # only the arrays that are used are read
+    mpmt_rows = table.select('MPMT')
+    locations = table['place_est_loc'][mpmt_rows]
+    assert 'prop_true' not in table.arrays.arrays
+    assert isinstance(table.arrays.arrays['place_est_loc'], np.memmap)
+
+    old_wcte = Device.open_file('examples/wcte_bldg157.geo')
+    for mpmt, location in zip(old_wcte.wcds[0].mpmts, locations):
+        if mpmt.place_est is None:
+            assert np.isnan(location).all()
+        else:
+            assert np.allclose(location, mpmt.place_est['loc'])
+
+
+def test_sparse_arrays(tmp_path):
+    filepath = GeometryFile.convert('examples/wcte_bldg157.geo', tmp_path / 'wcte_bldg157.geob')
+    assert filepath.stat().st_size < Path('examples/wcte_bldg157.geo').stat().st_size
+    table = GeometryFile.read(filepath)
+    assert 'mask_offset' in table.arrays.array_info['prop_true']
+    dense_table = GeometryTable.from_device(Device.open_file('examples/wcte_bldg157.geo'))
+    for name in ['prop_true', 'prop_design', 'place_est_loc']:
+        assert np.array_equal(table[name], dense_table.arrays[name], equal_nan=True)
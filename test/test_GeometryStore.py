@@ -0,0 +1,64 @@
+from Geometry.WCD import WCD
+from Geometry.GeometryStore import GeometryStore
+import pytest
+
+
+def test_store(tmp_path):
+    wcte = WCD('wcte', kind='WCTE')
+    store = GeometryStore.create(tmp_path / 'store', wcte, tag='as_built')
+    mpmt = wcte.mpmts[43]
+    mpmt.place_est = mpmt.place_true.copy()
+    mpmt.place_est['loc'][0] += 1.
+    wcte.mpmts[3].pmts[2].prop_est['delay'] = 3.
+    assert store.commit(wcte, tag='survey', message='first survey') == 1
+    mpmt.place_est['loc'][1] += 2.
+    assert store.commit(wcte) == 2
+    assert store.commit(wcte) == 3
+
+    # the changes are listed from the manifest
+    store = GeometryStore(tmp_path / 'store')
+    assert len(store) == 4 and [entry['tag'] for entry in store.log()] == ['as_built', 'survey', None, None]
+    assert store.get_changed('as_built', 'survey') == ['sms:barrel/mpmts:43', 'sms:bottom/mpmts:3/pmts:2']
+    assert store.get_changes(2) == {'sms:barrel/mpmts:43': ['place_est']}
+    assert store.get_changes(3) == {} and store.log()[3]['file'] is None
+    assert sorted(path.name for path in (tmp_path / 'store').iterdir()) == ['base.geo', 'manifest.json',
+                                                                           'rev_0001.pkl', 'rev_0002.pkl']
+
+    # the revisions are checked out
+    as_built = store.checkout('as_built')
+    assert as_built.mpmts[43].place_est == {} and as_built.mpmts[3].pmts[2].prop_est == {}
+    survey = store.checkout('survey')
+    assert survey.mpmts[43].place_est['loc'][1] == pytest.approx(mpmt.place_true['loc'][1])
+    assert survey.mpmts[3].pmts[2].prop_est == {'delay': 3.}
+    latest = store.checkout()
+    assert latest.mpmts[43].place_est['loc'] == pytest.approx(mpmt.place_est['loc'])
+    assert (latest.mpmts[43].get_placement('est', latest.sms[1])['location'] ==
+            pytest.approx(mpmt.get_placement('est', wcte.sms[1])['location']))
+
+    store.set_tag(2, 'survey_2')
+    assert store.get_revision('survey_2') == 2
+    with pytest.raises(ValueError):
+        store.checkout('unknown')
+
+
+def test_reopen_and_commit(tmp_path):
+    wcte = WCD('wcte', kind='WCTE')
+    store = GeometryStore.create(tmp_path / 'store', wcte)
+    wcte.mpmts[43].place_est = wcte.mpmts[43].place_true.copy()
+    store.commit(wcte)
+
+    # the device checked out at the latest revision of a reopened store is committed from its placement changes
+    store = GeometryStore(tmp_path / 'store')
+    latest = store.checkout()
+    latest.mpmts[5].place_est['loc'] = [1., 2., 3.]
+    latest.mpmts[43].place_est['loc'][0] += 0.
+    latest.mpmts[7].pmts[1].prop_est['gain'] = 2.
+    assert store.commit(latest, tag='refit') == 2
+    assert store.get_changes(2) == {'sms:bottom/mpmts:5': ['place_est'], 'sms:bottom/mpmts:7/pmts:1': ['prop_est']}
+
+    # any other device is compared with the latest revision in full
+    store = GeometryStore(tmp_path / 'store')
+    assert store.commit(wcte) == 3
+    assert store.get_changes(3) == {'sms:bottom/mpmts:5': ['place_est'], 'sms:bottom/mpmts:7/pmts:1': ['prop_est']}
+    assert store.checkout(3).mpmts[5].place_est == {}
+    assert store.checkout('refit').mpmts[5].place_est['loc'] == [1., 2., 3.]
@@ -0,0 +1,66 @@
+from Geometry.Device import Device
+from Geometry.WCD import WCD
+from Geometry.GeometryTable import GeometryTable
+import numpy as np
+
+
+def test_from_device():
+    wcte = WCD('wcte', kind='WCTE')
+    table = GeometryTable.from_device(wcte)
+
+    pmt_rows = table.select('PMT')
+    assert len(pmt_rows) == len(wcte.get_devices('pmts'))
+    assert len(table.select('MPMT')) == len(wcte.mpmts)
+
+    # the transformations calculated from the arrays are the same as those of the devices
+    rotations, locations = table.get_transforms('design')
+    placements = wcte.get_placements('pmts', 'design')
+    assert np.allclose(locations[pmt_rows], placements['location'])
+    assert np.allclose(rotations[pmt_rows], placements['rotation'])
+
+    # in the coordinate system of an mPMT
+    mpmt_row = table.select('MPMT')[3]
+    rotations, locations = table.get_transforms('true', mpmt_row)
+    placements = wcte.mpmts[3].get_placements('pmts', 'true', wcte.mpmts[3])
+    assert np.isnan(locations[pmt_rows[0]]).all()
+    assert np.allclose(locations[mpmt_row + 1:mpmt_row + 1 + len(placements['devices'])], placements['location'])
+
+
+def test_container_without_placement():
+    # the supermodules have no estimated placements: they are treated as the identity, as by Device.get_placements
+    wcte = WCD('wcte', kind='WCTE')
+    for mpmt in wcte.mpmts[::3]:
+        mpmt.place_est = dict(mpmt.place_true)
+    assert not wcte.sms[0].place_est
+    table = GeometryTable.from_device(wcte)
+    rotations, locations = table.get_transforms('est')
+    placements = wcte.get_placements('mpmts', 'est')
+    mpmt_rows = table.select('MPMT')
+    assert np.isnan(locations[mpmt_rows[1]]).all()
+    assert np.allclose(locations[mpmt_rows], placements['location'], equal_nan=True)
+    assert np.allclose(rotations[mpmt_rows], placements['rotation'], equal_nan=True)
+
+
+def test_to_device():
+    old_wcte = Device.open_file('examples/wcte_bldg157.geo')
+    table = GeometryTable.from_device(old_wcte)
+    new_wcte = table.to_device()
+
+    old_wcd, new_wcd = old_wcte.wcds[0], new_wcte.wcds[0]
+    assert len(new_wcd.mpmts) == len(old_wcd.mpmts)
+    for old_mpmt, new_mpmt in zip(old_wcd.mpmts, new_wcd.mpmts):
+        assert new_mpmt.container in new_wcd.sms
+        assert new_mpmt.name == old_mpmt.name and new_mpmt.kind == old_mpmt.kind
+        assert new_mpmt.prop_true == old_mpmt.prop_true
+        assert (new_mpmt.place_est is None) == (old_mpmt.place_est is None)
+        for old_pmt, new_pmt in zip(old_mpmt.pmts, new_mpmt.pmts):
+            assert new_pmt.place_est.keys() == old_pmt.place_est.keys()
+            if old_pmt.place_est:
+                assert np.allclose(new_pmt.place_est['loc'], old_pmt.place_est['loc'])
+                assert type(new_pmt.place_est['loc']) is type(old_pmt.place_est['loc'])
+        assert [led is None for led in new_mpmt.leds] == [led is None for led in old_mpmt.leds]
+
+    # scalar rotation angles are kept as scalars
+    target = new_wcd.sms[0].targets[0]
+    assert np.ndim(target.place_design['rot_angles']) == 0
+    assert new_wcd.sms[0].targets[0].get_placement('design') == old_wcd.sms[0].targets[0].get_placement('design')
@@ -1,6 +1,20 @@
 from Geometry.HALL import HALL
+from pathlib import Path
+import subprocess
+import sys
 
 def test_hall():
     t9_area = HALL('wcte', kind='WCTE')
 
     assert t9_area is not None
+
+
+def test_lazy_imports():
+    # the design tables are built when first used, and scipy is imported only when it is needed
+    # (the import time is followed by the import_geometry benchmark)
+    code = ('import sys\n'
+            'import Geometry.HALL\n'
+            'print("scipy.stats" in sys.modules, "scipy.spatial" in sys.modules)\n')
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                            cwd=Path(__file__).resolve().parents[1])
+    assert result.stdout.strip() == 'False False'
@@ -0,0 +1,41 @@
+from Geometry.WCD import WCD
+from Geometry.Illumination import Illumination
+import numpy as np
+
+
+def test_from_arrays():
+    # one LED at the origin pointing along z, PMTs on a sphere pointing to the origin
+    angles = np.radians([0., 10., 25., 35., 50.])
+    pmt_locations = 1000. * np.stack([np.sin(angles), np.zeros(5), np.cos(angles)], axis=1)
+    pmt_directions = -pmt_locations / 1000.
+    # the last PMT is turned away from the LED
+    pmt_directions[4] *= -1.
+    illumination = Illumination.from_arrays(np.zeros((2, 3)), np.array([[0., 0., 1.]] * 2), np.radians([40., 40.]),
+                                            np.radians([0., 20.]), pmt_locations, pmt_directions,
+                                            np.full(5, 1.))
+    assert list(illumination.get_pmts(0)) == [0, 1, 2, 3]
+    # ring from 20 to 40 degrees
+    assert list(illumination.get_pmts(1)) == [2, 3]
+    assert np.allclose(illumination.get_dense(illumination.emission_angle)[0, :4], angles[:4], atol=1.e-6)
+    assert np.allclose(illumination.incidence_angle, 0., atol=1.e-3)
+
+
+def test_build():
+    wcte = WCD('wcte', kind='WCTE')
+    illumination = Illumination.build(wcte, 'design', chunk_size=100)
+    leds = wcte.get_devices('leds') + wcte.get_devices('calibs')
+    pmts = wcte.get_devices('pmts')
+    assert illumination.get_mask().shape == (len(leds), len(pmts))
+    assert 0 < illumination.in_fov.sum() < len(illumination)
+
+    # compare a few pairs with the placements of the devices
+    for i in [0, len(illumination) // 2, len(illumination) - 1]:
+        led = leds[illumination.source[i]].get_placement('design', wcte)
+        pmt = pmts[illumination.pmt[i]].get_placement('design', wcte)
+        offset = np.subtract(pmt['location'], led['location'])
+        distance = np.linalg.norm(offset)
+        assert np.isclose(illumination.distance[i], distance, rtol=1.e-6)
+        assert np.isclose(illumination.emission_angle[i], np.arccos(np.dot(offset, led['direction_z']) / distance),
+                          atol=1.e-5)
+        assert np.isclose(illumination.incidence_angle[i], np.arccos(-np.dot(offset, pmt['direction_z']) / distance),
+                          atol=1.e-5)
@@ -1,4 +1,6 @@
 from Geometry.MPMT import MPMT
+from Geometry.SM import SM
+import numpy as np
 
 
 def test_get_mpmt():
@@ -27,5 +29,75 @@ def test_mpmt():
     assert test_mpmt is not None
 
 
+def test_get_transformed_points():
+    my_sm = SM('bottom', kind='bottom')
+    mpmt = my_sm.mpmts[2]
+
+    points = np.random.uniform(-300., 300., (1000, 3))
+    transformed = mpmt.get_transformed_points(points, 'true')
+    assert transformed.shape == (1000, 3)
+
+    # the origin and the unit axes of the mpmt transform to its placement
+    p = mpmt.get_placement('true')
+    axes = mpmt.get_transformed_points([[0., 0., 0.], [1., 0., 0.], [0., 0., 1.]], 'true')
+    assert np.allclose(axes[0], p['location'])
+    assert np.allclose(axes[1] - axes[0], p['direction_x'])
+    assert np.allclose(axes[2] - axes[0], p['direction_z'])
+
+    # distances between points are preserved
+    assert np.allclose(np.linalg.norm(transformed[1:] - transformed[:-1], axis=1),
+                       np.linalg.norm(points[1:] - points[:-1], axis=1))
+
+    fiducials = mpmt.get_fiducials('design', my_sm, z_offset=20.)
+    assert fiducials.shape == (4, 3)
+
+
+def test_lazy():
+    my_sm = SM('bottom', kind='bottom', lazy=True)
+    assert SM('bottom', kind='bottom').mpmts[2]._pmts is not None
+    mpmt = my_sm.mpmts[2]
+    assert mpmt._pmts is None and mpmt._leds is None
+
+    # mpmt placements do not need the PMTs and LEDs
+    placements = my_sm.get_placements('mpmts', 'design')
+    assert len(placements['devices']) == len(my_sm.mpmts)
+    assert mpmt._pmts is None
+
+    # the PMTs are created when first accessed, the same as those of a regular mPMT
+    regular_mpmt = MPMT('regular', my_sm, kind=mpmt.kind, place_design=mpmt.place_design)
+    assert len(mpmt.pmts) == len(regular_mpmt.pmts)
+    assert mpmt._leds is None
+    assert np.allclose(mpmt.pmts[5].get_placement('design')['location'],
+                       regular_mpmt.pmts[5].get_placement('design')['location'])
+    assert mpmt.pmts[5].get_properties('true') != regular_mpmt.pmts[5].get_properties('true')
+    leds = my_sm.get_devices('leds')
+    assert all(m._leds is not None for m in my_sm.mpmts)
+    assert len(leds) == sum(len(m.leds) for m in my_sm.mpmts)
+
+
+def test_design_tables():
+    # the dome layouts are built when first used, and shared by ME and MI mPMTs
+    assert 'ME' in MPMT.pmts_design and 'FD' in MPMT.pmts_design
+    assert MPMT.pmts_design['ME'] is MPMT.pmts_design['MI'] is MPMT.dome_pmts
+    assert len(MPMT.pmts_design['ME']) == 19 and len(MPMT.leds_design['ME']) == 12
+    assert set(MPMT.pmts_design) == {'MR', 'ME', 'MI', 'FD'}
+
+    # PMTs are equally spaced in each row
+    locs = np.array([pmt['loc'] for pmt in MPMT.pmts_design['ME']])
+    assert np.allclose(np.linalg.norm(locs[1:7, :2], axis=1), MPMT.transverse_radius_by_row[1])
+    assert np.allclose(np.linalg.norm(locs[1:7] - np.roll(locs[1:7], 1, axis=0), axis=1), MPMT.transverse_radius_by_row[1])
+
+    # changes to the design lists are used when devices are created
+    mpmt_design = SM.bottom_mpmts[0]
+    assert mpmt_design is SM.devices_design['bottom'][0]
+    loc_sig = mpmt_design['loc_sig']
+    mpmt_design['loc_sig'] = [0., 0., 0.]
+    try:
+        my_sm = SM('bottom', kind='bottom')
+    finally:
+        mpmt_design['loc_sig'] = loc_sig
+    assert my_sm.mpmts[0].place_true['loc'] == list(mpmt_design['loc'])
+
+
 def test_get_xy_points():
     assert False
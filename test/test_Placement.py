@@ -0,0 +1,30 @@
+from Geometry.Placement import Placement
+from scipy.spatial.transform import Rotation
+import numpy as np
+
+
+def test_compiled_rotation():
+    place = Placement({'loc': [1., 2., 3.], 'rot_axes': 'ZYX', 'rot_angles': [0.1, 0.2, 0.3]})
+    assert not place.is_compiled
+    assert np.allclose(place.get_matrix(), Rotation.from_euler('ZYX', [0.1, 0.2, 0.3]).as_matrix())
+    assert place.is_compiled
+
+    # the matrix follows changes to the angles
+    place['rot_angles'][0] = 0.5
+    assert not place.is_compiled
+    assert np.allclose(place.get_matrix(), Rotation.from_euler('ZYX', [0.5, 0.2, 0.3]).as_matrix())
+
+    # scalar angles for single axis rotations
+    target_place = Placement({'loc': [0., 0., 0.], 'rot_axes': 'Z', 'rot_angles': 0.5})
+    assert np.allclose(target_place.get_matrix(), Rotation.from_euler('Z', 0.5).as_matrix())
+
+
+def test_from_matrix():
+    rotation = Rotation.from_euler('xz', [0.4, -1.2])
+    place = Placement.from_matrix(rotation.as_matrix(), 'xzy', [1., 2., 3.])
+    assert place.is_compiled and place['loc'] == [1., 2., 3.]
+    assert np.allclose(place['rot_angles'], [0.4, -1.2, 0.])
+    place = Placement.from_quat(rotation.as_quat(), 'ZYX')
+    assert np.allclose(place.get_quat() * np.sign(place.get_quat()[3]),
+                       rotation.as_quat() * np.sign(rotation.as_quat()[3]))
+    assert np.allclose(Rotation.from_euler('ZYX', place['rot_angles']).as_matrix(), rotation.as_matrix())
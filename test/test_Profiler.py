@@ -0,0 +1,30 @@
+from Geometry.WCD import WCD
+from Geometry.MPMT import MPMT
+from Geometry.Device import Device
+from Geometry.Profiler import Profiler
+import json
+
+
+def test_profiler(tmp_path):
+    get_transform = Device.get_transform
+    with Profiler() as profiler:
+        wcte = WCD('wcte', kind='WCTE')
+        wcte.mpmts[0].pmts[0].get_placement('design')
+        wcte.mpmts[1].get_fiducials('true')
+        Device.get_relative_transforms(wcte.mpmts[:2], wcte.cameras[:1], 'design')
+    # the methods are restored when the profiler is stopped
+    assert Device.get_transform is get_transform and '__wrapped__' not in MPMT.__dict__['get_fiducials'].__dict__
+
+    report = {(entry['class'], entry['method'], entry['place_info']): entry for entry in profiler.get_report()}
+    assert report[('MPMT', 'place_devices', None)]['calls'] == len(wcte.mpmts) * 2
+    assert report[('PMT', 'get_placement', 'design')]['calls'] == 1
+    assert report[('MPMT', 'get_fiducials', 'true')]['calls'] == 1
+    # a staticmethod is counted under the class that defines it
+    assert report[('Device', 'get_relative_transforms', 'design')]['calls'] == 1
+    entry = report[('WCD', 'place_devices', None)]
+    assert entry['own_time'] < entry['total_time']
+
+    assert profiler.get_summary(5).count('\n') == 5
+    profiler.save_report(tmp_path / 'profile.json')
+    with open(tmp_path / 'profile.json') as f:
+        assert len(json.load(f)) == len(report)
@@ -0,0 +1,44 @@
+from Geometry.WCD import WCD
+from Geometry.RenderGeometry import RenderGeometry
+import json
+import struct
+import numpy as np
+
+
+def test_build():
+    wcte = WCD('wcte', kind='WCTE')
+    render = RenderGeometry.build(wcte, 'design')
+    assert render.vertices.shape == render.colors.shape and render.segments.max() < len(render.vertices)
+
+    # the outlines are the same as those of the devices (108 points for each mPMT: base, feedthrough, survey holes)
+    mpmts = [mpmt for mpmt in wcte.mpmts if mpmt.kind != 'FD']
+    first = render.segments[render.groups['mpmt_ME'][0] + 108 + 8:][:20, 0]
+    assert np.allclose(render.vertices[first], mpmts[1].get_xy_points('design', 'feedthrough'), atol=1.e-3)
+    pmts = wcte.get_devices('pmts')
+    start = render.groups['pmt_face'][0] + 7 * RenderGeometry.n_circle
+    face = render.segments[start:start + RenderGeometry.n_circle, 0]
+    assert np.allclose(render.vertices[face], pmts[7].get_xy_points('design'), atol=1.e-3)
+    start, stop = render.groups['mpmt_axis_z']
+    assert stop - start == len(wcte.mpmts)
+    assert np.allclose(render.vertices[render.segments[start]],
+                       [wcte.mpmts[0].get_placement('design')['location'],
+                        wcte.mpmts[0].get_transformed_points([0., 0., 100.], 'design')], atol=1.e-3)
+
+
+def test_save(tmp_path):
+    wcte = WCD('wcte', kind='WCTE')
+    render = RenderGeometry.build(wcte, 'design', features=('mpmts', 'cameras'))
+    render.save(tmp_path / 'wcte.ply')
+    data = (tmp_path / 'wcte.ply').read_bytes()
+    header, body = data.split(b'end_header\n')
+    assert b'element vertex ' + str(len(render.vertices)).encode() in header
+    assert len(body) == 15 * len(render.vertices) + 8 * len(render.segments)
+
+    render.save(tmp_path / 'wcte.glb', scale=0.001)
+    data = (tmp_path / 'wcte.glb').read_bytes()
+    magic, version, length = struct.unpack('<4sII', data[:12])
+    assert magic == b'glTF' and version == 2 and length == len(data)
+    json_length = struct.unpack('<I', data[12:16])[0]
+    gltf = json.loads(data[20:20 + json_length])
+    assert gltf['accessors'][0]['count'] == len(render.vertices)
+    assert gltf['meshes'][0]['primitives'][0]['mode'] == 1
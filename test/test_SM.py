@@ -124,4 +124,53 @@ def test_get_top():
 
     assert my_top is not None
 
-test_get_top()
\ No newline at end of file
+
+def test_transform_cache():
+    my_bottom = SM('bottom', kind='bottom')
+    my_bottom.place_est = my_bottom.place_design.copy()
+    for mpmt in my_bottom.mpmts:
+        mpmt.place_est = mpmt.place_design.copy()
+        for pmt in mpmt.pmts:
+            pmt.place_est = pmt.place_design.copy()
+
+    pmt = my_bottom.mpmts[3].pmts[4]
+    p1 = pmt.get_placement('est', my_bottom)
+    hits = SM.transform_cache_info['hits']
+    p2 = pmt.get_placement('est', my_bottom)
+    assert SM.transform_cache_info['hits'] > hits
+    assert np.allclose(p1['location'], p2['location'])
+
+    # modifying the placement of the container must be seen by the pmt
+    my_bottom.mpmts[3].place_est['loc'][2] += 10.
+    p3 = pmt.get_placement('est', my_bottom)
+    assert np.isclose(p3['location'][2] - p1['location'][2], 10.)
+
+    my_bottom.mpmts[3].place_est = my_bottom.mpmts[3].place_design.copy()
+    p4 = pmt.get_placement('est', my_bottom)
+    assert np.allclose(p1['location'], p4['location'])
+
+
+def test_set_dirty():
+    my_bottom = SM('bottom', kind='bottom')
+    mpmt = my_bottom.mpmts[3]
+    pmt = mpmt.pmts[4]
+    other_pmt = my_bottom.mpmts[4].pmts[4]
+    fiducials = mpmt.get_fiducials('design', my_bottom)
+    pmt.get_transform('design', my_bottom)
+    other_pmt.get_transform('design', my_bottom)
+
+    changes = []
+    my_bottom.add_listener(lambda device, place_info: changes.append((device, place_info)))
+    mpmt.place_design['loc'][2] += 10.
+    assert changes == [(mpmt, 'design')]
+    # only the caches of the modified device and the devices it contains are discarded
+    assert 'design' not in pmt._transforms and 'design' in other_pmt._transforms
+    assert np.allclose(mpmt.get_fiducials('design', my_bottom)[:, 2] - fiducials[:, 2], 10.)
+
+    # a replaced placement is no longer tracked
+    old_place = mpmt.place_design
+    mpmt.place_design = old_place.copy()
+    old_place['loc'][2] += 10.
+    assert len(changes) == 2
+
+test_get_top()
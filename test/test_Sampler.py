@@ -0,0 +1,33 @@
+from Geometry.Sampler import Sampler
+from Geometry.Device import Device
+from Geometry.PMT import PMT
+from Geometry.WCD import WCD
+import numpy as np
+
+
+def test_draw_values():
+    sampler = Sampler(seed=1)
+    design_mean = {'a': 1., 'b': 2., 'c': 3., 'd': 4.}
+    design_scale = {'a': 0.1, 'b': 0.2, 'c': 0.3, 'd': 0.}
+    design_var = {'b': 'gamma', 'c': 'uniform'}
+    values = sampler.draw_values(design_mean, design_scale, design_var, 100000)
+
+    assert np.allclose(values.mean(axis=0), [1., 2., 3., 4.], atol=0.01)
+    assert np.allclose(values[:, :2].std(axis=0), [0.1, 0.2], rtol=0.02)
+    assert values[:, 2].min() >= 2.7 and values[:, 2].max() <= 3.3
+    assert np.all(values[:, 3] == 4.)
+
+
+def test_seed():
+    Device.set_seed(42)
+    wcte1 = WCD('wcte', kind='WCTE')
+    Device.set_seed(42)
+    wcte2 = WCD('wcte', kind='WCTE')
+
+    assert wcte1.mpmts[50].pmts[7].prop_true == wcte2.mpmts[50].pmts[7].prop_true
+    assert wcte1.mpmts[50].place_true == wcte2.mpmts[50].place_true
+    assert wcte1.sms[0].targets[3].place_true == wcte2.sms[0].targets[3].place_true
+
+    Device.set_seed()
+    my_pmt = PMT('my_pmt', kind='P3')
+    assert my_pmt.get_properties('true')['size'] != wcte1.mpmts[50].pmts[7].prop_true['size']
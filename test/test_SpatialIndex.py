@@ -0,0 +1,44 @@
+from Geometry.WCD import WCD
+from Geometry.SpatialIndex import SpatialIndex
+import numpy as np
+
+
+def test_queries():
+    wcte = WCD('wcte', kind='WCTE')
+    index = SpatialIndex(wcte, 'pmts', 'design')
+    locations = wcte.get_placements('pmts', 'design')['location']
+
+    distances, indices = index.nearest(locations + 1.)
+    assert np.array_equal(indices, np.arange(len(locations)))
+    distances, indices = index.knn(locations[:5], 3)
+    assert indices.shape == (5, 3) and np.array_equal(indices[:, 0], np.arange(5))
+    distances, indices = index.nearest([[0., 0., 0.]], max_distance=10.)
+    assert indices[0] == -1 and np.isinf(distances[0])
+
+    # the PMTs of the first mPMT are within 300 mm of its central PMT
+    assert list(index.within(locations[0], 300.)) == list(range(19))
+    assert list(index.count_within(locations[:2], 300.)) == [19, 19]
+
+    # the PMT seen straight along the axis of a PMT from the centre
+    directions = wcte.get_placements('pmts', 'design')['direction_z']
+    vertices = locations[[100, 700]] + 1000. * directions[[100, 700]]
+    cos_angles, indices = index.nearest_direction(vertices, -directions[[100, 700]])
+    assert list(indices) == [100, 700] and np.allclose(cos_angles, 1.)
+
+
+def test_update():
+    wcte = WCD('wcte', kind='WCTE')
+    index = SpatialIndex(wcte, 'pmts', 'design')
+    assert not index.update()
+
+    wcte.mpmts[5].place_design['loc'][0] += 100.
+    wcte.mpmts[6].pmts[3].place_design['loc'][2] += 5.
+    assert not np.allclose(index.location, wcte.get_placements('pmts', 'design')['location'])
+    distances, indices = index.nearest(wcte.mpmts[6].pmts[3].get_placement('design')['location'])
+    assert indices == 6 * 19 + 3 and distances < 1.e-9
+    assert np.allclose(index.location, wcte.get_placements('pmts', 'design')['location'])
+
+    # devices without placements are not indexed
+    index = SpatialIndex(wcte, 'pmts', 'est')
+    assert len(index.tree_indices) == 0
+    assert index.nearest([0., 0., 0.])[1] == -1
@@ -0,0 +1,33 @@
+from Geometry.WCD import WCD
+from Geometry.TofTable import TofTable
+import numpy as np
+
+
+def test_build():
+    wcte = WCD('wcte', kind='WCTE')
+    table = TofTable.build(wcte, 'true')
+    leds = wcte.get_devices('leds') + wcte.get_devices('calibs')
+    pmts = wcte.get_devices('pmts')
+    assert table.shape == (len(leds), len(pmts)) and table.tof.dtype == np.float32
+
+    for i_led, i_pmt in [(0, 0), (10, 1000), (len(leds) - 1, 7)]:
+        led_location = leds[i_led].get_placement('true', wcte)['location']
+        pmt_location = pmts[i_pmt].get_placement('true', wcte)['location']
+        distance = np.linalg.norm(np.subtract(led_location, pmt_location))
+        assert np.isclose(table.distance[i_led, i_pmt], distance, rtol=1.e-6)
+        assert np.isclose(table.tof[i_led, i_pmt], distance * wcte.prop_true['refraction_index'] / wcte.light_velocity,
+                          rtol=1.e-6)
+
+
+def test_load_or_build(tmp_path):
+    wcte = WCD('wcte', kind='WCTE')
+    table = TofTable.load_or_build(wcte, 'design', cache_dir=tmp_path)
+    assert len(list(tmp_path.glob('tof_*.npz'))) == 1
+    loaded = TofTable.load_or_build(wcte, 'design', cache_dir=tmp_path)
+    assert loaded.key == table.key and np.array_equal(loaded.tof, table.tof)
+
+    # a different geometry or refraction index is a different table
+    other = TofTable.load_or_build(wcte, 'design', refraction_index=1.33, cache_dir=tmp_path)
+    wcte.mpmts[4].place_design['loc'][2] += 1.
+    TofTable.load_or_build(wcte, 'design', cache_dir=tmp_path)
+    assert other.key != table.key and len(list(tmp_path.glob('tof_*.npz'))) == 3
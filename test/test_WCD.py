@@ -1,5 +1,7 @@
 from Geometry.WCD import WCD
 import json
+import numpy as np
+import pytest
 
 
 def test_get_wcd():
@@ -18,18 +20,196 @@ def test_get_wcd():
     assert wcte is not None
 
 
-def test_wcd_json():
+def test_get_placements():
     wcte = WCD('wcte', kind='WCTE')
 
-    wcte.save_json('wcte_design.json', 'design', 'design', devices='all')
+    for devices in ['mpmts', 'pmts', 'leds', 'cameras']:
+        placements = wcte.get_placements(devices, 'true')
+        for i, device in enumerate(placements['devices']):
+            p = device.get_placement('true')
+            assert np.allclose(placements['location'][i], p['location'])
+            assert np.allclose(placements['direction_x'][i], p['direction_x'])
+            assert np.allclose(placements['direction_z'][i], p['direction_z'])
+
+    placements = wcte.sms[1].get_placements('pmts', 'design', wcte.sms[1])
+    assert placements['rotation'].shape == (len(wcte.sms[1].get_devices('pmts')), 3, 3)
+
+
+def test_wcd_json(tmp_path):
+    wcte = WCD('wcte', kind='WCTE')
+
+    wcte.save_json(tmp_path / 'wcte_design.json', 'design', 'design', devices='all')
 
     assert wcte is not None
 
-def test_wcd_json_load():
-    info = json.load(open('wcte_design.json'))
+def test_wcd_json_load(tmp_path):
+    test_wcd_json(tmp_path)
+    info = json.load(open(tmp_path / 'wcte_design.json'))
 
     p = info['mpmts']['43']['leds']['3']['placement']
 
     assert info is not None
 
-test_get_wcd()
\ No newline at end of file
+
+def test_save_json_files(tmp_path):
+    wcte = WCD('wcte', kind='WCTE')
+    wcte.mpmts[2].place_est = {}
+    wcte.save_json_files([(tmp_path / 'wcte_true.json', 'true', 'true'),
+                          (tmp_path / 'wcte_est.json', None, 'est')], devices='mpmts,leds', compact=True)
+
+    info = json.load(open(tmp_path / 'wcte_true.json'))
+    assert info['description']['place_info'] == 'true'
+    led = wcte.mpmts[43].leds[3]
+    assert info['mpmts']['43']['leds']['3']['properties'] == led.get_properties('true')
+    assert np.allclose(info['mpmts']['43']['leds']['3']['placement']['location'],
+                       led.get_placement('true')['location'])
+
+    # devices without placement information have null placements
+    info = json.load(open(tmp_path / 'wcte_est.json'))
+    assert info['mpmts']['2']['placement'] is None
+    assert 'properties' not in info['mpmts']['2']
+
+
+def test_container_without_placement():
+    # the mPMTs are fitted before the supermodules have estimated placements
+    wcte = WCD('wcte', kind='WCTE')
+    mpmt = wcte.mpmts[3]
+    mpmt.place_est = dict(mpmt.place_design)
+    assert np.allclose(mpmt.get_placement('est')['location'], [0., 580., 0.])
+    assert np.allclose(mpmt.get_transformed_points([0., 0., 10.], 'est'), [0., 580., 10.])
+    with pytest.raises(KeyError):
+        wcte.sms[0].get_placement('est')
+    # the cached transformation is replaced when the supermodule placement is set
+    wcte.sms[0].place_est = dict(wcte.sms[0].place_design)
+    assert np.allclose(mpmt.get_placement('est')['location'], mpmt.get_placement('design')['location'])
+
+
+def test_device_without_placement():
+    wcte = WCD('wcte', kind='WCTE')
+    mpmt = wcte.mpmts[3]
+    # an empty placement: the device is at the origin of its container for get_transformed_points
+    assert mpmt.place_est == {}
+    mpmt.container.place_est = dict(mpmt.container.place_design)
+    container_points = mpmt.container.get_transformed_points([[0., 0., 10.]], 'design')
+    assert np.allclose(mpmt.get_transformed_points([[0., 0., 10.]], 'est'), container_points)
+    with pytest.raises(KeyError):
+        mpmt.get_placement('est')
+    with pytest.raises(ValueError):
+        mpmt.get_transform('est')
+    # unknown placement information
+    with pytest.raises(ValueError):
+        mpmt.get_transformed_points([0., 0., 10.], 'unknown')
+    with pytest.raises(ValueError):
+        mpmt.get_placement('unknown')
+
+
+def test_get_placements_container_without_placement():
+    wcte = WCD('wcte', kind='WCTE')
+    for mpmt in wcte.mpmts[::5]:
+        mpmt.place_est = dict(mpmt.place_true)
+    placements = wcte.get_placements('mpmts', 'est')
+    for i, mpmt in enumerate(wcte.mpmts):
+        if mpmt.place_est:
+            placement = mpmt.get_placement('est')
+            assert np.allclose(placements['location'][i], placement['location'])
+            assert np.allclose(placements['direction_x'][i], placement['direction_x'])
+            assert np.allclose(placements['direction_z'][i], placement['direction_z'])
+        else:
+            assert np.isnan(placements['location'][i]).all()
+            assert np.isnan(placements['rotation'][i]).all()
+
+
+def test_optional_placements():
+    wcte = WCD('wcte', kind='WCTE')
+    pmt = wcte.mpmts[2].pmts[7]
+    # placements and property estimates are only stored when they are first modified
+    # reading the placements of many devices does not give out (and keep) empty placements
+    wcte.get_placements('pmts', 'est')
+    assert pmt.get_stored('place_est') == {} and getattr(pmt, '_pending', None) is None
+    # the same empty placement is given out until it is set, so changes made through each reference are kept
+    place_est = pmt.place_est
+    other_place_est = pmt.place_est
+    assert place_est == {} and other_place_est is place_est
+    place_est['loc'] = [1., 2., 3.]
+    other_place_est['rot_axes'] = 'XZ'
+    other_place_est['rot_angles'] = [0., 0.]
+    assert pmt.place_est is place_est and pmt.place_est == {'loc': [1., 2., 3.], 'rot_axes': 'XZ',
+                                                            'rot_angles': [0., 0.]}
+    prop_est = pmt.prop_est
+    other_prop_est = pmt.prop_est
+    prop_est['delay'] = 1.5
+    other_prop_est['gain'] = 2.
+    assert pmt.prop_est == {'delay': 1.5, 'gain': 2.}
+
+    # state saved by earlier versions, with all of the placements and cache dictionaries
+    state = pmt.__getstate__()
+    assert 'place_survey' not in state and state['place_est'] == pmt.place_est
+    state.update({'_transforms': {}, 'place_survey': {}, 'prop_est_sig': {}})
+    old_pmt = type(pmt).__new__(type(pmt))
+    old_pmt.__setstate__(state)
+    assert old_pmt.place_survey == {} and old_pmt.prop_est == pmt.prop_est
+    assert np.allclose(old_pmt.get_placement('true')['location'], pmt.get_placement('true')['location'])
+
+    # an empty placement given out before the placement is set no longer changes the device
+    place_survey = pmt.place_survey
+    pmt.place_survey = {'loc': [0., 0., 1.]}
+    place_survey['loc'] = [5., 5., 5.]
+    assert pmt.place_survey == {'loc': [0., 0., 1.]}
+
+
+def test_clone():
+    wcte = WCD('wcte', kind='WCTE')
+    wcte.mpmts[4].place_est = wcte.mpmts[4].place_true.copy()
+    wcte.mpmts[4].prop_est['delay'] = 2.
+
+    clone = wcte.clone(seed=2)
+    assert len(clone.get_devices('pmts')) == len(wcte.get_devices('pmts'))
+    assert clone.mpmts[30].container is clone.sms[1] and clone.mpmts[30] in clone.sms[1].mpmts
+    assert clone.mpmts[4].pmts[0].container is clone.mpmts[4]
+    # a new realization, with the same design
+    assert clone.mpmts[4].place_design is wcte.mpmts[4].place_design
+    assert clone.mpmts[4].place_true['loc'] != wcte.mpmts[4].place_true['loc']
+    assert clone.mpmts[4].pmts[2].prop_true != wcte.mpmts[4].pmts[2].prop_true
+    assert clone.mpmts[4].place_est == {} and clone.mpmts[4].prop_est == {}
+    again = wcte.clone(seed=2)
+    assert np.array_equal(clone.get_placements('pmts', 'true')['location'],
+                          again.get_placements('pmts', 'true')['location'])
+    assert clone.mpmts[4].pmts[2].prop_true == again.mpmts[4].pmts[2].prop_true
+
+    # an exact copy, with the estimates
+    copy = wcte.clone(redraw=[], keep_est=True)
+    assert np.array_equal(copy.get_placements('leds', 'true')['location'],
+                          wcte.get_placements('leds', 'true')['location'])
+    assert copy.mpmts[4].place_est == wcte.mpmts[4].place_est and copy.mpmts[4].prop_est == {'delay': 2.}
+    copy.mpmts[4].place_est['loc'][0] += 1.
+    assert copy.mpmts[4].place_est['loc'][0] == wcte.mpmts[4].place_est['loc'][0] + 1.
+
+
+def test_relative_transforms():
+    wcte = WCD('wcte', kind='WCTE')
+    pmt = wcte.mpmts[43].pmts[1]
+    camera = wcte.sms[0].cameras[2]
+    assert pmt.get_common_ancestor(camera) is wcte
+    assert pmt.get_common_ancestor(wcte.mpmts[43].leds[0]) is wcte.mpmts[43]
+    assert pmt.get_ancestors() == (pmt, wcte.mpmts[43], wcte.sms[1], wcte)
+
+    # the PMT seen from the camera: a point in the PMT system maps to the same point via the WCD system
+    rotation, translation = pmt.get_relative_transform('true', camera)
+    point = np.array([10., -20., 30.])
+    in_wcd = pmt.get_transformed_points(point, 'true')
+    camera_rotation, camera_translation = camera.get_transform('true')
+    assert np.allclose(rotation @ point + translation, camera_rotation.T @ (in_wcd - camera_translation))
+    # the same as get_transform when the reference is a container
+    assert np.allclose(pmt.get_relative_transform('true', wcte.sms[1])[1], pmt.get_transform('true', wcte.sms[1])[1])
+
+    # all PMTs seen from all cameras
+    pmts = wcte.get_devices('pmts')
+    cameras = wcte.get_devices('cameras')
+    rotations, translations = WCD.get_relative_transforms(pmts, cameras, 'true')
+    assert rotations.shape == (len(cameras), len(pmts), 3, 3)
+    assert np.allclose(rotations[2, pmts.index(pmt)], rotation)
+    assert np.allclose(translations[2, pmts.index(pmt)], translation)
+    rotations, translations = WCD.get_relative_transforms([pmt, camera], [camera, camera], 'true', pairs=True)
+    assert np.allclose(translations[0], translation) and np.allclose(rotations[1], np.identity(3))
+
+test_get_wcd()